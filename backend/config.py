@@ -9,9 +9,16 @@ class Settings(BaseSettings):
     """Application settings"""
     
     # Google Gemini Configuration (Default LLM Provider)
-    GEMINI_API_KEY: str
+    GEMINI_API_KEY: Optional[str] = None  # Required unless LLM_MODE is "replay"
     GEMINI_MODEL: str = "gemini-pro"
     
+    # LLM Provider Mode: "live" (Gemini), "record" (Gemini + save cassettes)
+    # or "replay" (serve saved cassettes offline, for benchmarking)
+    LLM_MODE: str = "live"
+    LLM_CASSETTE_DIR: str = "cassettes"
+    LLM_REPLAY_LATENCY_MS: float = 0.0  # Synthetic latency per replayed call
+    LLM_REPLAY_JITTER_MS: float = 0.0  # Uniform +/- jitter on the latency
+    
     # MongoDB Configuration
     MONGODB_URL: str = "mongodb://localhost:27017"
     MONGODB_DB_NAME: str = "smart_task_planner"
@@ -33,6 +40,67 @@ class Settings(BaseSettings):
     # Task Generation Settings
     MAX_TASKS_PER_PLAN: int = 15
     DEFAULT_TASK_DURATION: int = 2
+    MAX_CRITICAL_PATHS: int = 10  # Zero-float paths stored per plan
+    PLAN_GRAPH_CACHE_SIZE: int = 256  # Compiled dependency graphs kept in memory
+    RESOURCE_LEVELING_ENABLED: bool = True  # Allow plans to opt in with constraints.level_resources
+    TASK_EFFORT_HOURS_PER_DAY: int = 4  # Default work hours behind one day of task duration
+    RISK_DEFAULT_SAMPLES: int = 10000  # Monte Carlo samples per risk request
+    RISK_MAX_SAMPLES: int = 100000
+    CALENDAR_CACHE_SIZE: int = 128  # Compiled working calendars kept in memory
+    CALENDAR_REFRESH_SECONDS: int = 60  # How long a named calendar is trusted before rereading it
+    
+    # LLM Concurrency Settings
+    LLM_MAX_CONCURRENCY: int = 32  # Max Gemini generations in flight per worker
+    LLM_TIMEOUT_SECONDS: float = 60.0  # Per-call timeout before falling back
+    LLM_BATCH_SIZE: int = 4  # Max goals packed into one prompt (fewer if their output would not fit)
+    LLM_DEADLINE_SECONDS: float = 90.0  # Hard per-request deadline, including queueing
+    LLM_REPAIR_MAX_CONTINUATIONS: int = 2  # "Continue from last task" calls for truncated output
+    LLM_FANOUT_CONCURRENCY: int = 8  # Phases generated at once for a phased (very large) plan
+    
+    # LLM Output Token Budget (max_output_tokens sized from the expected task count)
+    LLM_MAX_OUTPUT_TOKENS: int = 8192  # Upper bound, and the budget when adaptive sizing is off
+    LLM_ADAPTIVE_OUTPUT_TOKENS: bool = True
+    LLM_MIN_OUTPUT_TOKENS: int = 1024
+    LLM_OUTPUT_TOKENS_PER_TASK: int = 150  # Starting estimate; refined from observed responses
+    LLM_OUTPUT_TOKEN_HEADROOM: float = 1.5  # Multiplier over the expected output size
+    
+    # LLM Circuit Breaker Settings
+    LLM_BREAKER_WINDOW: int = 20  # Recent calls considered
+    LLM_BREAKER_MIN_CALLS: int = 5  # Calls needed before the breaker can trip
+    LLM_BREAKER_FAILURE_RATE: float = 0.5  # Fraction of failed/slow calls that trips it
+    LLM_BREAKER_SLOW_CALL_SECONDS: float = 30.0  # Calls slower than this count as bad
+    LLM_BREAKER_RESET_SECONDS: float = 30.0  # Time open before a probe call is allowed
+    
+    # Hedged Requests: send a duplicate call once the first exceeds the observed pN latency
+    # (only when a quota token is free right away; hedges never wait for quota)
+    LLM_HEDGE_ENABLED: bool = False
+    LLM_HEDGE_PERCENTILE: float = 95.0
+    LLM_HEDGE_MIN_SAMPLES: int = 20  # Latency samples required before hedging starts
+    
+    # Cluster-Wide Gemini Quota (token bucket shared by all replicas through MongoDB)
+    LLM_QUOTA_ENABLED: bool = True
+    LLM_QUOTA_REQUESTS_PER_MINUTE: float = 60.0
+    LLM_QUOTA_BURST: int = 10  # Bucket capacity
+    LLM_QUOTA_BUCKET: str = "gemini"  # Replicas sharing a name share the quota
+    
+    # LLM Plan Cache Settings
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_MAX_ENTRIES: int = 512  # In-process LRU size
+    LLM_CACHE_TTL_SECONDS: int = 86400  # MongoDB entry lifetime (24 hours)
+    
+    # Similar-Goal Plan Reuse (skips the LLM for paraphrased goals with identical constraints)
+    SIMILARITY_REUSE_ENABLED: bool = True
+    SIMILARITY_THRESHOLD: float = 0.8  # Minimum Jaccard similarity of normalized goal tokens
+    SIMILARITY_REFRESH_SECONDS: int = 30  # How often lookups pick up goals indexed by other processes
+    
+    # Heuristic Planner (template plans without an LLM call)
+    HEURISTIC_CONFIDENCE_THRESHOLD: float = 0.75  # planner="auto" uses templates at or above this confidence
+    
+    # Background Job Queue / Worker Settings
+    JOB_LEASE_SECONDS: int = 300  # A running job is reclaimed if its worker stops renewing
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_POLL_INTERVAL_SECONDS: float = 1.0  # Worker sleep when the queue is empty
+    WORKER_CONCURRENCY: int = 4  # Jobs processed at once per worker process
     
     # CORS Configuration
     CORS_ORIGINS: str = "http://localhost:3000,http://localhost:5173,http://localhost:8000"
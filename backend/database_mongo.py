@@ -4,7 +4,7 @@ MongoDB database connection and initialization using Motor and Beanie
 from motor.motor_asyncio import AsyncIOMotorClient
 from beanie import init_beanie
 from config import settings
-from models_mongo import Goal, Plan, Task
+from models_mongo import Goal, Plan, Task, LLMCacheEntry, Job, QuotaBucket, GoalSignature, WorkingCalendar
 import logging
 
 logger = logging.getLogger(__name__)
@@ -28,7 +28,7 @@ async def connect_to_mongodb():
         # Initialize Beanie with document models
         await init_beanie(
             database=mongodb_client[settings.MONGODB_DB_NAME],
-            document_models=[Goal, Plan, Task]
+            document_models=[Goal, Plan, Task, LLMCacheEntry, Job, QuotaBucket, GoalSignature, WorkingCalendar]
         )
         logger.info("✓ Beanie ODM initialized")
         
@@ -1,18 +1,37 @@
 """
 FastAPI application for Smart Task Planner with MongoDB
 """
-from fastapi import FastAPI, HTTPException, status
+from fastapi import FastAPI, HTTPException, Query, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from typing import List, Optional, Dict, Any
+import asyncio
+import json
 from datetime import datetime
 from pydantic import BaseModel, Field
 from beanie import PydanticObjectId
 
 from config import settings
 from database_mongo import connect_to_mongodb, close_mongodb_connection
-from models_mongo import Goal, Plan, Task, PlanType, TaskStatus, TaskPriority
+from models_mongo import Goal, Plan, Task, Job, JobStatus, PlanType, TaskStatus, TaskPriority, WorkingCalendar
 from services.llm_service import llm_service
-from services.plan_service import plan_generator
+from services.plan_pipeline import (
+    build_plan,
+    schedule_llm_tasks,
+    plan_documents,
+    save_plans,
+    constraints_from_goal,
+    propagate_task_changes,
+)
+from services.job_queue import enqueue_plan_job, enqueue_expansion_job
+from services.similarity_index import similarity_index, find_reusable_plan, is_indexable
+from services.plan_regeneration import regenerate_subtree
+from services.plan_expansion import expand_milestone
+from services.phased_generation import generate_phased_plan
+from services.quota import Priority, llm_priority
+from services.heuristic_planner import PlannerMode, plan_without_llm
+from services.schedule_risk import assess_plan_risk
+from services.calendar_registry import calendar_registry
 
 
 # ============================================================================
@@ -25,6 +44,9 @@ class ConstraintsRequest(BaseModel):
     max_hours_per_day: Optional[int] = Field(default=8, ge=1, le=24)
     no_work_on_weekends: bool = False
     unavailable_dates: List[str] = Field(default_factory=list)
+    calendar_name: Optional[str] = None  # Named working calendar (see /api/calendars)
+    level_resources: bool = False  # Limit parallel work to max_hours_per_day
+    effort_hours_per_day: Optional[int] = Field(default=None, ge=1, le=24)  # Hours per day of task duration
 
 
 class PlanCreateRequest(BaseModel):
@@ -32,6 +54,25 @@ class PlanCreateRequest(BaseModel):
     goal_text: str = Field(..., min_length=10, max_length=1000)
     plan_type: PlanType = PlanType.MODERATE
     constraints: Optional[ConstraintsRequest] = None
+    bypass_cache: bool = False  # Force a fresh LLM generation (no cache or plan reuse)
+    lazy: bool = False  # Generate milestones only; expand them into subtasks later
+    expand_in_background: bool = False  # With lazy: queue expansion of all milestones for the worker
+    phased: bool = False  # Very large goals: outline phases, then generate them in parallel
+    planner: PlannerMode = PlannerMode.LLM  # "heuristic" or "auto" for instant template plans
+
+
+class BatchPlanCreateRequest(BaseModel):
+    """Request to create several plans with batched LLM calls"""
+    plans: List[PlanCreateRequest] = Field(..., min_length=1, max_length=50)
+    bypass_cache: bool = False  # Applies to every plan in the batch
+
+
+class PlanVariantsRequest(BaseModel):
+    """Request to generate several plan types for one goal at once"""
+    goal_text: str = Field(..., min_length=10, max_length=1000)
+    plan_types: List[PlanType] = Field(default_factory=lambda: list(PlanType), min_length=1, max_length=3)
+    constraints: Optional[ConstraintsRequest] = None
+    bypass_cache: bool = False
 
 
 class TaskResponse(BaseModel):
@@ -50,6 +91,14 @@ class TaskResponse(BaseModel):
     status: TaskStatus = TaskStatus.PENDING
     is_completed: bool = False
     completed_at: Optional[datetime] = None
+    is_expandable: bool = False
+    is_expanded: bool = False
+    parent_task_id: Optional[str] = None
+    late_start: Optional[datetime] = None
+    late_finish: Optional[datetime] = None
+    total_float_days: Optional[int] = None
+    free_float_days: Optional[int] = None
+    is_critical: bool = False
     created_at: datetime
 
     class Config:
@@ -62,6 +111,7 @@ class PlanDetailResponse(BaseModel):
     goal_id: str
     plan_type: PlanType
     critical_path: List[str] = Field(default_factory=list)
+    critical_paths: List[List[str]] = Field(default_factory=list)
     plan_summary: str
     total_duration_days: Optional[int] = None
     estimated_completion: Optional[datetime] = None
@@ -74,6 +124,36 @@ class PlanDetailResponse(BaseModel):
         from_attributes = True
 
 
+class PlanRiskResponse(BaseModel):
+    """Monte Carlo schedule risk of a plan"""
+    plan_id: str
+    plan_type: PlanType
+    samples: int
+    estimated_completion: Optional[str] = None  # Deterministic schedule
+    completion: Dict[str, str] = Field(default_factory=dict)  # p50/p80/p95 completion dates
+    completion_days: Dict[str, float] = Field(default_factory=dict)  # Working days from plan start
+    deadline: Optional[str] = None
+    on_time_probability: Optional[float] = None
+    criticality: Dict[str, float] = Field(default_factory=dict)  # Task ID -> share of samples on a critical path
+
+
+class CalendarRequest(BaseModel):
+    """Named working calendar to create or replace"""
+    description: Optional[str] = None
+    no_work_on_weekends: bool = True
+    unavailable_dates: List[str] = Field(default_factory=list)  # YYYY-MM-DD
+
+
+class CalendarResponse(BaseModel):
+    """Named working calendar"""
+    name: str
+    description: Optional[str] = None
+    no_work_on_weekends: bool
+    unavailable_dates: List[str]
+    created_at: datetime
+    updated_at: datetime
+
+
 class GoalResponse(BaseModel):
     """Goal response model"""
     id: str
@@ -86,10 +166,32 @@ class GoalResponse(BaseModel):
         from_attributes = True
 
 
+class JobResponse(BaseModel):
+    """Background job status response"""
+    id: str
+    job_type: str
+    status: JobStatus
+    stage: str
+    progress: int
+    goal_id: Optional[str] = None
+    plan_id: Optional[str] = None
+    error: Optional[str] = None
+    attempts: int
+    created_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime] = None
+
+
+class TaskRegenerateRequest(BaseModel):
+    """Request to regenerate a task and everything downstream of it"""
+    instructions: Optional[str] = Field(default=None, max_length=1000)  # e.g. "split testing into unit and e2e"
+
+
 class TaskUpdateRequest(BaseModel):
     """Request to update a task"""
     status: Optional[TaskStatus] = None
     is_completed: Optional[bool] = None
+    duration_days: Optional[int] = Field(default=None, ge=1, le=30)
 
 
 # ============================================================================
@@ -112,6 +214,101 @@ app.add_middleware(
 )
 
 
+# ============================================================================
+# Response Helpers
+# ============================================================================
+
+def _task_to_response(task: Task) -> TaskResponse:
+    """Convert a Task document into its API response model"""
+    return TaskResponse(
+        id=str(task.id),
+        plan_id=str(task.plan_id),
+        task_id=task.task_id,
+        title=task.title,
+        description=task.description,
+        duration_days=task.duration_days,
+        earliest_start=task.earliest_start,
+        latest_finish=task.latest_finish,
+        depends_on=task.depends_on,
+        priority=task.priority,
+        confidence=task.confidence,
+        status=task.status,
+        is_completed=task.is_completed,
+        completed_at=task.completed_at,
+        is_expandable=task.is_expandable,
+        is_expanded=task.is_expanded,
+        parent_task_id=task.parent_task_id,
+        late_start=task.late_start,
+        late_finish=task.late_finish,
+        total_float_days=task.total_float_days,
+        free_float_days=task.free_float_days,
+        is_critical=task.is_critical,
+        created_at=task.created_at
+    )
+
+
+def _plan_to_response(plan: Plan, tasks: List[Task]) -> PlanDetailResponse:
+    """Convert a Plan document and its tasks into the detailed API response"""
+    return PlanDetailResponse(
+        id=str(plan.id),
+        goal_id=str(plan.goal_id),
+        plan_type=plan.plan_type,
+        critical_path=plan.critical_path,
+        critical_paths=plan.critical_paths,
+        plan_summary=plan.plan_summary,
+        total_duration_days=plan.total_duration_days,
+        estimated_completion=plan.estimated_completion,
+        plan_data=plan.plan_data,
+        tasks=[_task_to_response(task) for task in tasks],
+        created_at=plan.created_at,
+        updated_at=plan.updated_at
+    )
+
+
+def _job_to_response(job: Job) -> JobResponse:
+    """Convert a Job document into its API response model"""
+    return JobResponse(
+        id=str(job.id),
+        job_type=job.job_type,
+        status=job.status,
+        stage=job.stage,
+        progress=job.progress,
+        goal_id=job.goal_id,
+        plan_id=job.plan_id,
+        error=job.error,
+        attempts=job.attempts,
+        created_at=job.created_at,
+        updated_at=job.updated_at,
+        finished_at=job.finished_at
+    )
+
+
+def _calendar_to_response(calendar: WorkingCalendar) -> CalendarResponse:
+    """Convert a WorkingCalendar document into its API response model"""
+    return CalendarResponse(
+        name=calendar.name,
+        description=calendar.description,
+        no_work_on_weekends=calendar.no_work_on_weekends,
+        unavailable_dates=calendar.unavailable_dates,
+        created_at=calendar.created_at,
+        updated_at=calendar.updated_at
+    )
+
+
+def _sse_event(event: str, data: Any) -> str:
+    """Format a Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def _require_calendar(constraints: Optional[ConstraintsRequest]) -> None:
+    """Reject constraints naming a working calendar that does not exist"""
+    if not await calendar_registry.resolve(constraints):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Working calendar {constraints.calendar_name} not found"
+        )
+
+
 # ============================================================================
 # Startup/Shutdown Events
 # ============================================================================
@@ -121,8 +318,12 @@ async def startup_event():
     """Initialize database connection on startup"""
     await connect_to_mongodb()
     print("✓ MongoDB connected")
+    indexed = await similarity_index.load()
+    print(f"✓ Similarity index loaded ({indexed} goals)")
+    calendars = await calendar_registry.load()
+    print(f"✓ Working calendars loaded ({calendars})")
     print(f"✓ Server running on {settings.HOST}:{settings.PORT}")
-    print(f"✓ LLM Provider: Google Gemini ({settings.GEMINI_MODEL})")
+    print(f"✓ LLM Provider: {llm_service.provider.name} ({settings.GEMINI_MODEL})")
 
 
 @app.on_event("shutdown")
@@ -160,11 +361,20 @@ async def health_check():
     return {
         "status": "healthy",
         "database": db_status,
-        "llm_provider": "gemini",
+        "llm_provider": llm_service.provider.name,
         "timestamp": datetime.utcnow().isoformat()
     }
 
 
+@app.get("/api/metrics/llm")
+async def llm_metrics():
+    """LLM service counters (plan cache hits/misses, etc.)"""
+    return {
+        **llm_service.get_stats(),
+        "similarity_index": similarity_index.get_stats()
+    }
+
+
 # ============================================================================
 # Plan Generation Endpoints
 # ============================================================================
@@ -181,7 +391,16 @@ async def create_plan(request: PlanCreateRequest):
     4. Assigns dates based on constraints
     5. Stores Plan and Tasks in MongoDB
     6. Returns complete plan with tasks
+    
+    With lazy=true only milestones are generated; expand them with
+    POST /api/plans/{plan_id}/tasks/{task_id}/expand, or set
+    expand_in_background=true to have the worker expand all of them.
+    With phased=true the phases of a very large goal are generated in
+    parallel and stitched into one plan. planner="heuristic" builds the
+    plan from templates without calling the LLM; planner="auto" does so
+    only when the goal category is recognized with enough confidence.
     """
+    await _require_calendar(request.constraints)
     try:
         # Create goal document
         goal = Goal(
@@ -190,171 +409,251 @@ async def create_plan(request: PlanCreateRequest):
         )
         await goal.insert()
         
-        # Generate plan using LLM (Gemini) - NOT async
-        llm_response = llm_service.generate_plan(
-            goal_text=request.goal_text,
-            constraints=request.constraints,
-            plan_type=request.plan_type
-        )
+        # Sources in order: a reused similar plan, a template plan, a phased
+        # fan-out, then a single LLM call (the first that applies wins).
+        # Only full LLM plans are indexed, so other modes never reuse one.
+        llm_response = None
+        if (
+            not request.bypass_cache
+            and not request.lazy
+            and not request.phased
+            and request.planner == PlannerMode.LLM
+        ):
+            llm_response = await find_reusable_plan(request.goal_text, request.plan_type, request.constraints)
+        if llm_response is None:
+            llm_response = plan_without_llm(
+                request.goal_text, request.constraints, request.plan_type, request.planner
+            )
+        
+        # Nothing reused or templated: generate with the LLM without blocking the event loop
+        if llm_response is None and request.phased and not request.lazy:
+            llm_response = await generate_phased_plan(
+                goal_text=request.goal_text,
+                constraints=request.constraints,
+                plan_type=request.plan_type,
+                use_cache=not request.bypass_cache
+            )
+        if llm_response is None:
+            llm_response = await llm_service.generate_plan_async(
+                goal_text=request.goal_text,
+                constraints=request.constraints,
+                plan_type=request.plan_type,
+                use_cache=not request.bypass_cache,
+                milestones_only=request.lazy
+            )
+        
+        # Assign dates, calculate critical path and store Plan/Task documents
+        plan, tasks = await build_plan(goal, request.plan_type, llm_response, request.constraints)
+        if is_indexable(llm_response):
+            await similarity_index.add(goal, plan)
         
-        # Convert LLM tasks to task objects
-        task_list = []
-        for idx, llm_task in enumerate(llm_response.tasks):
+        if request.expand_in_background and any(task.is_expandable for task in tasks):
+            job = await enqueue_expansion_job(plan)
+            plan.plan_data = {**(plan.plan_data or {}), "expansion_job_id": str(job.id)}
+            await plan.save()
+        
+        return _plan_to_response(plan, tasks)
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to create plan: {str(e)}"
+        )
+
+
+@app.post("/api/plans/stream")
+async def create_plan_stream(request: PlanCreateRequest):
+    """
+    Create a new plan, streaming progress as Server-Sent Events
+    
+    Events, in order:
+    - goal: the created goal id
+    - task: one event per task, sent as soon as Gemini finishes writing it
+    - schedule: assigned dates and critical path once generation ends
+    - plan: the stored plan, same shape as POST /api/plans
+    - error: sent instead of the remaining events if something fails (the
+      goal is removed again unless the plan was already stored)
+    """
+    await _require_calendar(request.constraints)
+    
+    async def event_stream():
+        goal = None
+        plan = None
+        try:
+            # Created inside the stream so a failed generation can remove it again
+            goal = Goal(
+                goal_text=request.goal_text,
+                constraints=request.constraints.model_dump() if request.constraints else {}
+            )
+            await goal.insert()
+            yield _sse_event("goal", {"goal_id": str(goal.id)})
             
-            # Handle both dict and object formats
-            if isinstance(llm_task, dict):
-                task_id = llm_task.get("id")
-                title = llm_task.get("title")
-                description = llm_task.get("description")
-                duration_days = llm_task.get("duration_days")
-                depends_on = llm_task.get("depends_on", [])
-                priority = llm_task.get("priority", "Medium")
-                confidence = llm_task.get("confidence", 1.0)
-            else:
-                # It's a Pydantic model
-                task_id = llm_task.id
-                title = llm_task.title
-                description = llm_task.description
-                duration_days = llm_task.duration_days
-                depends_on = llm_task.depends_on
-                priority = llm_task.priority
-                confidence = llm_task.confidence
+            llm_response = None
+            async for event, payload in llm_service.stream_plan(
+                goal_text=request.goal_text,
+                constraints=request.constraints,
+                plan_type=request.plan_type,
+                use_cache=not request.bypass_cache
+            ):
+                if event == "task":
+                    yield _sse_event("task", payload.model_dump())
+                else:
+                    llm_response = payload
             
-            task_list.append({
-                "task_id": task_id,
-                "title": title,
-                "description": description,
-                "duration_days": duration_days,
-                "depends_on": depends_on,
-                "priority": priority,
-                "confidence": confidence,
-                "status": TaskStatus.PENDING
+            plan, tasks = await build_plan(goal, request.plan_type, llm_response, request.constraints)
+            if is_indexable(llm_response):
+                await similarity_index.add(goal, plan)
+            yield _sse_event("schedule", {
+                "critical_path": plan.critical_path,
+                "estimated_completion": plan.estimated_completion,
+                "tasks": [
+                    {
+                        "task_id": task.task_id,
+                        "earliest_start": task.earliest_start,
+                        "latest_finish": task.latest_finish
+                    }
+                    for task in tasks
+                ]
             })
+            yield _sse_event("plan", _plan_to_response(plan, tasks).model_dump(mode="json"))
+        except Exception as e:
+            if goal is not None and goal.id is not None and plan is None:
+                await goal.delete()
+            yield _sse_event("error", {"detail": f"Failed to create plan: {str(e)}"})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/api/plans/batch", response_model=List[PlanDetailResponse], status_code=status.HTTP_201_CREATED)
+async def create_plans_batch(request: BatchPlanCreateRequest):
+    """
+    Create plans for many goals at once
+    
+    Goals are packed several to a prompt, so onboarding a team costs a few
+    LLM round trips instead of one per goal. Plans are returned in request
+    order.
+    """
+    for plan_request in request.plans:
+        await _require_calendar(plan_request.constraints)
+    
+    # Queue behind interactive requests for the shared Gemini quota
+    llm_priority.set(Priority.BULK)
+    try:
+        goals = []
+        for plan_request in request.plans:
+            goal = Goal(
+                goal_text=plan_request.goal_text,
+                constraints=plan_request.constraints.model_dump() if plan_request.constraints else {}
+            )
+            await goal.insert()
+            goals.append(goal)
         
-        # Convert dicts to TaskResponse objects for assign_dates
-        task_response_objects = []
-        for task_dict in task_list:
-            task_response_objects.append(TaskResponse(
-                id=task_dict["task_id"],  # Use task_id for both id and task_id
-                task_id=task_dict["task_id"],
-                title=task_dict["title"],
-                description=task_dict["description"],
-                duration_days=task_dict["duration_days"],
-                depends_on=task_dict["depends_on"],
-                priority=TaskPriority(task_dict["priority"]),
-                confidence=task_dict["confidence"],
-                status=TaskStatus(task_dict["status"]),
-                created_at=datetime.now()
-            ))
-        
-        # Assign dates to tasks (modifies objects in place)
-        task_response_objects = plan_generator.assign_dates(
-            task_response_objects,
-            request.constraints,
-            datetime.now()
+        llm_responses = await llm_service.generate_plans_batch(
+            [(p.goal_text, p.constraints, p.plan_type) for p in request.plans],
+            use_cache=not request.bypass_cache
         )
         
-        # Convert back to dictionaries with dates
-        task_list = []
-        for task_obj in task_response_objects:
-            task_list.append({
-                "task_id": task_obj.id,
-                "title": task_obj.title,
-                "description": task_obj.description,
-                "duration_days": task_obj.duration_days,
-                "depends_on": task_obj.depends_on,
-                "priority": task_obj.priority,
-                "confidence": task_obj.confidence,
-                "status": task_obj.status,
-                "earliest_start": task_obj.earliest_start,
-                "latest_finish": task_obj.latest_finish
-            })
+        results = []
+        for goal, plan_request, llm_response in zip(goals, request.plans, llm_responses):
+            plan, tasks = await build_plan(goal, plan_request.plan_type, llm_response, plan_request.constraints)
+            results.append(_plan_to_response(plan, tasks))
+        return results
         
-        # Calculate critical path (needs TaskResponse objects)
-        critical_path = plan_generator.calculate_critical_path(task_response_objects)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to create plans: {str(e)}"
+        )
+
+
+@app.post("/api/plans/variants", response_model=List[PlanDetailResponse], status_code=status.HTTP_201_CREATED)
+async def create_plan_variants(request: PlanVariantsRequest):
+    """
+    Create aggressive, moderate and conservative plans for one goal at once
+    
+    All variants share one Goal, are generated concurrently (latency is the
+    slowest variant, not the sum) and are stored with one bulk insert.
+    Plans are returned in the order of plan_types.
+    """
+    await _require_calendar(request.constraints)
+    try:
+        goal = Goal(
+            goal_text=request.goal_text,
+            constraints=request.constraints.model_dump() if request.constraints else {}
+        )
+        await goal.insert()
+        plan_types = list(dict.fromkeys(request.plan_types))
         
-        # Calculate total duration and estimated completion
-        total_duration = max([t.get("duration_days", 0) for t in task_list], default=0)
-        estimated_completion = None
-        if task_list:
-            latest_finish_dates = [t.get("latest_finish") for t in task_list if t.get("latest_finish")]
-            if latest_finish_dates:
-                estimated_completion = max(latest_finish_dates)
+        async def generate(plan_type: PlanType):
+            llm_response = None
+            if not request.bypass_cache:
+                llm_response = await find_reusable_plan(request.goal_text, plan_type, request.constraints)
+            if llm_response is None:
+                llm_response = await llm_service.generate_plan_async(
+                    goal_text=request.goal_text,
+                    constraints=request.constraints,
+                    plan_type=plan_type,
+                    use_cache=not request.bypass_cache
+                )
+            return llm_response
         
-        # Create plan document
-        plan = Plan(
-            goal_id=str(goal.id),
-            plan_type=request.plan_type,
-            critical_path=critical_path,
-            plan_summary=llm_response.plan_summary,
-            total_duration_days=total_duration,
-            estimated_completion=estimated_completion,
-            plan_data={"llm_metadata": llm_response.metadata if hasattr(llm_response, 'metadata') else {}}
-        )
-        await plan.insert()
+        llm_responses = await asyncio.gather(*[generate(plan_type) for plan_type in plan_types])
         
-        # Create task documents
-        tasks = []
-        for task_data in task_list:
-            task = Task(
-                plan_id=str(plan.id),
-                task_id=task_data["task_id"],
-                title=task_data["title"],
-                description=task_data["description"],
-                duration_days=task_data["duration_days"],
-                earliest_start=task_data.get("earliest_start"),
-                latest_finish=task_data.get("latest_finish"),
-                depends_on=task_data["depends_on"],
-                priority=task_data["priority"],
-                confidence=task_data["confidence"],
-                status=TaskStatus.PENDING
-            )
-            await task.insert()
-            tasks.append(task)
+        documents = []
+        for plan_type, llm_response in zip(plan_types, llm_responses):
+            scheduled_tasks, critical_path = schedule_llm_tasks(llm_response.tasks, request.constraints)
+            documents.append(plan_documents(
+                goal, plan_type, llm_response, scheduled_tasks, critical_path, request.constraints
+            ))
+        await save_plans(documents)
         
-        # Build response
-        task_responses = [
-            TaskResponse(
-                id=str(task.id),
-                plan_id=str(task.plan_id),
-                task_id=task.task_id,
-                title=task.title,
-                description=task.description,
-                duration_days=task.duration_days,
-                earliest_start=task.earliest_start,
-                latest_finish=task.latest_finish,
-                depends_on=task.depends_on,
-                priority=task.priority,
-                confidence=task.confidence,
-                status=task.status,
-                is_completed=task.is_completed,
-                completed_at=task.completed_at,
-                created_at=task.created_at
-            )
-            for task in tasks
-        ]
+        for (plan, _), llm_response in zip(documents, llm_responses):
+            if is_indexable(llm_response):
+                await similarity_index.add(goal, plan)
         
-        return PlanDetailResponse(
-            id=str(plan.id),
-            goal_id=str(plan.goal_id),
-            plan_type=plan.plan_type,
-            critical_path=plan.critical_path,
-            plan_summary=plan.plan_summary,
-            total_duration_days=plan.total_duration_days,
-            estimated_completion=plan.estimated_completion,
-            plan_data=plan.plan_data,
-            tasks=task_responses,
-            created_at=plan.created_at,
-            updated_at=plan.updated_at
-        )
+        return [_plan_to_response(plan, tasks) for plan, tasks in documents]
         
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to create plan: {str(e)}"
+            detail=f"Failed to create plan variants: {str(e)}"
         )
 
 
+@app.post("/api/plans/jobs", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_plan_job(request: PlanCreateRequest, response: Response):
+    """
+    Queue plan generation for a background worker (python worker.py)
+    
+    Returns immediately with a job id; poll GET /api/jobs/{job_id} until
+    status is "completed" and then fetch the plan by plan_id.
+    """
+    await _require_calendar(request.constraints)
+    goal = Goal(
+        goal_text=request.goal_text,
+        constraints=request.constraints.model_dump() if request.constraints else {}
+    )
+    await goal.insert()
+    
+    job = await enqueue_plan_job(goal, {
+        "goal_text": request.goal_text,
+        "plan_type": request.plan_type.value,
+        "constraints": request.constraints.model_dump(mode="json") if request.constraints else None,
+        "bypass_cache": request.bypass_cache,
+        "lazy": request.lazy,
+        "expand_in_background": request.expand_in_background,
+        "phased": request.phased,
+        "planner": request.planner.value
+    })
+    
+    response.headers["Location"] = f"/api/jobs/{job.id}"
+    return _job_to_response(job)
+
+
 @app.get("/api/plans", response_model=List[PlanDetailResponse])
 async def list_plans(skip: int = 0, limit: int = 10):
     """
@@ -367,40 +666,7 @@ async def list_plans(skip: int = 0, limit: int = 10):
         # Get tasks for this plan
         tasks = await Task.find(Task.plan_id == str(plan.id)).to_list()
         
-        task_responses = [
-            TaskResponse(
-                id=str(task.id),
-                plan_id=str(task.plan_id),
-                task_id=task.task_id,
-                title=task.title,
-                description=task.description,
-                duration_days=task.duration_days,
-                earliest_start=task.earliest_start,
-                latest_finish=task.latest_finish,
-                depends_on=task.depends_on,
-                priority=task.priority,
-                confidence=task.confidence,
-                status=task.status,
-                is_completed=task.is_completed,
-                completed_at=task.completed_at,
-                created_at=task.created_at
-            )
-            for task in tasks
-        ]
-        
-        result.append(PlanDetailResponse(
-            id=str(plan.id),
-            goal_id=str(plan.goal_id),
-            plan_type=plan.plan_type,
-            critical_path=plan.critical_path,
-            plan_summary=plan.plan_summary,
-            total_duration_days=plan.total_duration_days,
-            estimated_completion=plan.estimated_completion,
-            plan_data=plan.plan_data,
-            tasks=task_responses,
-            created_at=plan.created_at,
-            updated_at=plan.updated_at
-        ))
+        result.append(_plan_to_response(plan, tasks))
     
     return result
 
@@ -427,40 +693,7 @@ async def get_plan(plan_id: str):
     # Get tasks
     tasks = await Task.find(Task.plan_id == plan_id).to_list()
     
-    task_responses = [
-        TaskResponse(
-            id=str(task.id),
-            plan_id=str(task.plan_id),
-            task_id=task.task_id,
-            title=task.title,
-            description=task.description,
-            duration_days=task.duration_days,
-            earliest_start=task.earliest_start,
-            latest_finish=task.latest_finish,
-            depends_on=task.depends_on,
-            priority=task.priority,
-            confidence=task.confidence,
-            status=task.status,
-            is_completed=task.is_completed,
-            completed_at=task.completed_at,
-            created_at=task.created_at
-        )
-        for task in tasks
-    ]
-    
-    return PlanDetailResponse(
-        id=str(plan.id),
-        goal_id=str(plan.goal_id),
-        plan_type=plan.plan_type,
-        critical_path=plan.critical_path,
-        plan_summary=plan.plan_summary,
-        total_duration_days=plan.total_duration_days,
-        estimated_completion=plan.estimated_completion,
-        plan_data=plan.plan_data,
-        tasks=task_responses,
-        created_at=plan.created_at,
-        updated_at=plan.updated_at
-    )
+    return _plan_to_response(plan, tasks)
 
 
 @app.delete("/api/plans/{plan_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -487,6 +720,7 @@ async def delete_plan(plan_id: str):
     
     # Delete the plan
     await plan.delete()
+    await similarity_index.remove_plan(plan_id)
     
     return None
 
@@ -498,7 +732,12 @@ async def delete_plan(plan_id: str):
 @app.patch("/api/plans/{plan_id}/tasks/{task_id}", response_model=TaskResponse)
 async def update_task(plan_id: str, task_id: str, update: TaskUpdateRequest):
     """
-    Update a task (e.g., mark as completed)
+    Update a task (e.g., mark as completed or change its duration)
+    
+    A new duration or a change in completion moves the task's dates:
+    completed tasks finish on their completion date. Downstream tasks are
+    rescheduled incrementally, only as far as their dates actually move,
+    and the critical path and floats are refreshed.
     """
     # Find the task
     task = await Task.find_one(Task.plan_id == plan_id, Task.task_id == task_id)
@@ -509,6 +748,9 @@ async def update_task(plan_id: str, task_id: str, update: TaskUpdateRequest):
             detail=f"Task {task_id} not found in plan {plan_id}"
         )
     
+    was_completed = task.is_completed
+    previous_duration = task.duration_days
+    
     # Update fields
     if update.status is not None:
         task.status = update.status
@@ -533,26 +775,144 @@ async def update_task(plan_id: str, task_id: str, update: TaskUpdateRequest):
                 task.status = TaskStatus.PENDING
             task.completed_at = None
     
+    if update.duration_days is not None:
+        task.duration_days = update.duration_days
+    
     task.updated_at = datetime.utcnow()
-    await task.save()
     
-    return TaskResponse(
-        id=str(task.id),
-        plan_id=str(task.plan_id),
-        task_id=task.task_id,
-        title=task.title,
-        description=task.description,
-        duration_days=task.duration_days,
-        earliest_start=task.earliest_start,
-        latest_finish=task.latest_finish,
-        depends_on=task.depends_on,
-        priority=task.priority,
-        confidence=task.confidence,
-        status=task.status,
-        is_completed=task.is_completed,
-        completed_at=task.completed_at,
-        created_at=task.created_at
+    schedule_changed = (
+        task.is_completed != was_completed
+        or (task.duration_days != previous_duration and not task.is_completed)
     )
+    if not schedule_changed or task.is_expanded:
+        await task.save()
+        return _task_to_response(task)
+    
+    try:
+        plan = await Plan.get(PydanticObjectId(plan_id))
+        tasks = await Task.find(Task.plan_id == plan_id).to_list()
+        goal = await Goal.get(PydanticObjectId(plan.goal_id)) if plan else None
+        
+        # Work on the loaded copy of the edited task so the rescheduler sees the edits
+        tasks = [task if other.id == task.id else other for other in tasks]
+        dirty_ids, pinned_ids = set(), set()
+        if task.is_completed:
+            # Actual finish replaces the planned one
+            finish = task.completed_at.strftime("%Y-%m-%d")
+            task.latest_finish = finish
+            task.earliest_start = min(task.earliest_start or finish, finish)
+            pinned_ids.add(task.task_id)
+        else:
+            dirty_ids.add(task.task_id)
+        
+        constraints = constraints_from_goal(goal)
+        await calendar_registry.resolve(constraints)
+        changed = propagate_task_changes(
+            plan, tasks, dirty_ids, constraints, pinned_ids
+        ) if plan else []
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to reschedule plan: {str(e)}"
+        )
+    
+    await task.save()
+    for other in changed:
+        if other.task_id != task.task_id:
+            await other.save()
+    if plan:
+        await plan.save()
+    
+    return _task_to_response(task)
+
+
+@app.post("/api/plans/{plan_id}/tasks/{task_id}/regenerate", response_model=PlanDetailResponse)
+async def regenerate_task(plan_id: str, task_id: str, request: TaskRegenerateRequest):
+    """
+    Regenerate a task and every task downstream of it
+    
+    Only that part of the dependency graph is sent to the LLM, with its
+    direct prerequisites as frozen context. Revised tasks keep their
+    status; dates and the critical path are recomputed for the edited
+    region only.
+    """
+    try:
+        plan = await Plan.get(PydanticObjectId(plan_id))
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Plan {plan_id} not found"
+        )
+    
+    if not plan:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Plan {plan_id} not found"
+        )
+    
+    try:
+        plan, tasks = await regenerate_subtree(plan, task_id, request.instructions)
+    except KeyError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Task {task_id} not found in plan {plan_id}"
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to regenerate tasks: {str(e)}"
+        )
+    
+    return _plan_to_response(plan, tasks)
+
+
+@app.post("/api/plans/{plan_id}/tasks/{task_id}/expand", response_model=PlanDetailResponse)
+async def expand_task(plan_id: str, task_id: str):
+    """
+    Expand a milestone of a lazily generated plan into subtasks
+    
+    The subtasks take the milestone's place in the dependency graph and
+    the milestone's dates then span them. Dates and the critical path are
+    recomputed for the new subtasks and everything after them.
+    """
+    try:
+        plan = await Plan.get(PydanticObjectId(plan_id))
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Plan {plan_id} not found"
+        )
+    
+    if not plan:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Plan {plan_id} not found"
+        )
+    
+    try:
+        plan, tasks = await expand_milestone(plan, task_id)
+    except KeyError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Task {task_id} not found in plan {plan_id}"
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to expand task: {str(e)}"
+        )
+    
+    return _plan_to_response(plan, tasks)
 
 
 @app.get("/api/plans/{plan_id}/tasks", response_model=List[TaskResponse])
@@ -578,26 +938,153 @@ async def get_plan_tasks(plan_id: str):
     # Get tasks
     tasks = await Task.find(Task.plan_id == plan_id).to_list()
     
-    return [
-        TaskResponse(
-            id=str(task.id),
-            plan_id=str(task.plan_id),
-            task_id=task.task_id,
-            title=task.title,
-            description=task.description,
-            duration_days=task.duration_days,
-            earliest_start=task.earliest_start,
-            latest_finish=task.latest_finish,
-            depends_on=task.depends_on,
-            priority=task.priority,
-            confidence=task.confidence,
-            status=task.status,
-            is_completed=task.is_completed,
-            completed_at=task.completed_at,
-            created_at=task.created_at
-        )
-        for task in tasks
-    ]
+    return [_task_to_response(task) for task in tasks]
+
+
+@app.get("/api/plans/{plan_id}/risk", response_model=PlanRiskResponse)
+async def get_plan_risk(
+    plan_id: str,
+    samples: int = Query(default=settings.RISK_DEFAULT_SAMPLES, ge=100, le=settings.RISK_MAX_SAMPLES),
+    seed: Optional[int] = None
+):
+    """
+    Simulate the plan many times with uncertain task durations
+    
+    Each task's duration spread comes from its confidence and the plan
+    type. Returns P50/P80/P95 completion dates, the chance of meeting the
+    goal's deadline and how often each task was critical. Pass a seed for
+    reproducible results.
+    """
+    try:
+        plan = await Plan.get(PydanticObjectId(plan_id))
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Plan {plan_id} not found"
+        )
+    
+    if not plan:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Plan {plan_id} not found"
+        )
+    
+    tasks = await Task.find(Task.plan_id == plan_id).to_list()
+    goal = await Goal.get(PydanticObjectId(plan.goal_id))
+    constraints = constraints_from_goal(goal)
+    await calendar_registry.resolve(constraints)
+    
+    try:
+        # CPU-bound; keep the event loop free
+        risk = await asyncio.to_thread(
+            assess_plan_risk, plan.plan_type, tasks, constraints, samples, seed
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to simulate plan risk: {str(e)}"
+        )
+    
+    return PlanRiskResponse(
+        plan_id=plan_id,
+        plan_type=plan.plan_type,
+        samples=samples,
+        estimated_completion=plan.estimated_completion,
+        deadline=constraints.deadline if constraints else None,
+        **risk
+    )
+
+
+# ============================================================================
+# Working Calendar Endpoints
+# ============================================================================
+
+@app.put("/api/calendars/{name}", response_model=CalendarResponse)
+async def save_calendar(name: str, request: CalendarRequest):
+    """
+    Create or replace a named working calendar
+    
+    Plans use it by setting constraints.calendar_name; its unavailable
+    dates are added to the plan's own and its weekend rule wins. Plans
+    already scheduled keep their dates until they are rescheduled.
+    """
+    try:
+        calendar = await calendar_registry.save(
+            name,
+            no_work_on_weekends=request.no_work_on_weekends,
+            unavailable_dates=request.unavailable_dates,
+            description=request.description
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to save calendar: {str(e)}"
+        )
+    return _calendar_to_response(calendar)
+
+
+@app.get("/api/calendars", response_model=List[CalendarResponse])
+async def list_calendars():
+    """
+    List all named working calendars
+    """
+    calendars = await WorkingCalendar.find_all().sort("name").to_list()
+    return [_calendar_to_response(calendar) for calendar in calendars]
+
+
+@app.get("/api/calendars/{name}", response_model=CalendarResponse)
+async def get_calendar(name: str):
+    """
+    Get a named working calendar
+    """
+    calendar = await calendar_registry.refresh(name)
+    if not calendar:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Calendar {name} not found"
+        )
+    return _calendar_to_response(calendar)
+
+
+@app.delete("/api/calendars/{name}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_calendar(name: str):
+    """
+    Delete a named working calendar
+    
+    Plans that still name it are scheduled with their own constraints.
+    """
+    if not await calendar_registry.delete(name):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Calendar {name} not found"
+        )
+    return None
+
+
+# ============================================================================
+# Job Endpoints
+# ============================================================================
+
+@app.get("/api/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    """
+    Get the status and progress of a background job
+    """
+    try:
+        job = await Job.get(PydanticObjectId(job_id))
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Job {job_id} not found"
+        )
+    
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Job {job_id} not found"
+        )
+    
+    return _job_to_response(job)
 
 
 # ============================================================================
@@ -3,6 +3,7 @@ MongoDB Document Models using Beanie ODM
 """
 from beanie import Document, Link
 from pydantic import Field
+from pymongo import IndexModel, ASCENDING
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from enum import Enum
@@ -30,6 +31,14 @@ class PlanType(str, Enum):
     CONSERVATIVE = "conservative"
 
 
+class JobStatus(str, Enum):
+    """Background job status enumeration"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
 class Task(Document):
     """Task document model"""
     plan_id: str  # Reference to Plan
@@ -38,14 +47,23 @@ class Task(Document):
     description: str
     duration_days: int
     earliest_start: str  # ISO date string
-    latest_finish: str  # ISO date string
+    latest_finish: str  # ISO date string (early finish; name kept for API compatibility)
     depends_on: List[str] = Field(default_factory=list)
     priority: TaskPriority = TaskPriority.MEDIUM
     confidence: float = Field(default=0.8, ge=0.0, le=1.0)
     status: TaskStatus = TaskStatus.PENDING
     is_completed: bool = False
     completed_at: Optional[datetime] = None
+    is_expandable: bool = False  # Milestone whose subtasks have not been generated yet
+    is_expanded: bool = False  # Milestone replaced by its subtasks (dates summarize them)
+    parent_task_id: Optional[str] = None  # Milestone this subtask belongs to
+    late_start: Optional[str] = None  # Latest start that keeps the plan end (ISO date)
+    late_finish: Optional[str] = None  # Latest finish that keeps the plan end (ISO date)
+    total_float_days: Optional[int] = None  # Working days it can slip without moving the plan end
+    free_float_days: Optional[int] = None  # Working days it can slip without delaying a successor
+    is_critical: bool = False  # Zero total float
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
     
     class Settings:
         name = "tasks"
@@ -62,10 +80,12 @@ class Plan(Document):
     goal_id: str  # Reference to Goal
     plan_type: PlanType = PlanType.MODERATE
     critical_path: List[str] = Field(default_factory=list)
+    critical_paths: List[List[str]] = Field(default_factory=list)  # Every zero-float path (up to MAX_CRITICAL_PATHS)
     plan_summary: str
     total_duration_days: Optional[int] = None
     estimated_completion: Optional[str] = None  # ISO date string
     plan_data: Optional[Dict[str, Any]] = None  # Additional plan metadata
+    expansion_lease_until: Optional[datetime] = None  # Held while milestone subtasks are merged in
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     
@@ -91,3 +111,95 @@ class Goal(Document):
             "user_id",
             "created_at",
         ]
+
+
+class LLMCacheEntry(Document):
+    """Cached LLM plan response keyed by canonical prompt hash"""
+    cache_key: str  # SHA-256 of normalized goal, constraints and plan type
+    plan_type: str
+    response: Dict[str, Any]  # Serialized LLMPlanResponse
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    expires_at: datetime  # MongoDB TTL monitor removes the entry after this
+    
+    class Settings:
+        name = "llm_cache"
+        indexes = [
+            IndexModel([("cache_key", ASCENDING)], unique=True),
+            IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),  # TTL index
+        ]
+
+
+class Job(Document):
+    """Background plan-generation job claimed by worker processes"""
+    job_type: str = "create_plan"
+    status: JobStatus = JobStatus.QUEUED
+    payload: Dict[str, Any] = Field(default_factory=dict)  # Request parameters
+    goal_id: Optional[str] = None
+    plan_id: Optional[str] = None  # Reserved before the plan is saved; final once the job completes
+    stage: str = "queued"  # queued, generating, scheduling, saving, completed
+    progress: int = Field(default=0, ge=0, le=100)  # Percent complete
+    error: Optional[str] = None
+    attempts: int = 0
+    max_attempts: int = 3
+    worker_id: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None  # Expired leases are reclaimed
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    
+    class Settings:
+        name = "jobs"
+        indexes = [
+            [("status", 1), ("created_at", 1)],  # Claim order
+            "lease_expires_at",
+            "goal_id",
+        ]
+
+
+class QuotaBucket(Document):
+    """Token bucket shared by all replicas calling a rate-limited provider"""
+    name: str
+    tokens: float = 0.0
+    granted: bool = False  # Outcome of the most recent take
+    updated_at: Optional[datetime] = None  # MongoDB server time of the last refill
+    
+    class Settings:
+        name = "quota_buckets"
+        indexes = [
+            IndexModel([("name", ASCENDING)], unique=True),
+        ]
+
+
+class GoalSignature(Document):
+    """MinHash signature of a goal whose plan can be reused for similar goals"""
+    goal_id: str
+    plan_id: str
+    plan_type: str
+    constraints_key: str = ""  # constraints_fingerprint of the goal's constraints
+    tokens: List[str] = Field(default_factory=list)  # Normalized goal tokens
+    signature: List[int] = Field(default_factory=list)  # MinHash values
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    
+    class Settings:
+        name = "goal_signatures"
+        indexes = [
+            "plan_id",
+            "created_at",  # Incremental refresh
+        ]
+
+
+class WorkingCalendar(Document):
+    """Named working calendar that plans can share through Constraints.calendar_name"""
+    name: str
+    description: Optional[str] = None
+    no_work_on_weekends: bool = True
+    unavailable_dates: List[str] = Field(default_factory=list)  # YYYY-MM-DD
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    
+    class Settings:
+        name = "working_calendars"
+        indexes = [
+            IndexModel([("name", ASCENDING)], unique=True),
+        ]
@@ -2,7 +2,7 @@
 Pydantic schemas for request/response validation
 """
 from pydantic import BaseModel, Field, field_validator
-from typing import List, Optional
+from typing import List, Optional, Dict, Any
 from datetime import datetime
 
 
@@ -16,6 +16,9 @@ class Constraints(BaseModel):
     max_hours_per_day: Optional[int] = Field(default=8, description="Maximum work hours per day", ge=1, le=24)
     no_work_on_weekends: Optional[bool] = Field(default=True, description="Whether to exclude weekends")
     unavailable_dates: Optional[List[str]] = Field(default_factory=list, description="List of unavailable dates (YYYY-MM-DD)")
+    calendar_name: Optional[str] = Field(default=None, description="Named working calendar to apply on top of these constraints")
+    level_resources: bool = Field(default=False, description="Limit parallel work to max_hours_per_day")
+    effort_hours_per_day: Optional[int] = Field(default=None, description="Work hours behind one day of task duration (server default if unset)", ge=1, le=24)
 
 
 # ============================================================================
@@ -141,3 +144,4 @@ class LLMPlanResponse(BaseModel):
     """Schema for complete plan generated by LLM"""
     tasks: List[LLMTaskResponse]
     plan_summary: str
+    metadata: Dict[str, Any] = Field(default_factory=dict)  # Source, cache info, etc.
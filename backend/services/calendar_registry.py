@@ -0,0 +1,225 @@
+"""
+Named working calendars stored in MongoDB and an LRU of compiled calendars
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from config import settings
+from models_mongo import WorkingCalendar
+from services.work_calendar import WorkCalendar
+
+logger = logging.getLogger(__name__)
+
+Fingerprint = Tuple[bool, Tuple[str, ...]]
+
+
+class CalendarRegistry:
+    """
+    Shared working calendars and compiled WorkCalendar instances
+
+    Constraints may name a stored calendar (calendar_name); its
+    unavailable dates are combined with the constraint's own, and its
+    weekend rule wins. Compiled calendars are cached by a fingerprint of
+    the effective weekend rule and date strings, so plans with the same
+    calendar share one instance and repeated scheduling parses nothing.
+    Editing a named calendar changes its fingerprint, so stale compiled
+    calendars simply age out of the LRU.
+    """
+
+    def __init__(self, max_entries: int, refresh_seconds: int):
+        """Initialize an empty registry"""
+        self.max_entries = max_entries
+        self.refresh_seconds = refresh_seconds
+        self._named: Dict[str, WorkingCalendar] = {}
+        self._read_at: Dict[str, float] = {}  # Monotonic time each named calendar was read
+        self._compiled: "OrderedDict[Fingerprint, WorkCalendar]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    async def load(self) -> int:
+        """
+        Load all named calendars into memory
+
+        Returns:
+            Number of calendars loaded
+        """
+        self._named.clear()
+        self._read_at.clear()
+        async for calendar in WorkingCalendar.find_all():
+            self._remember(calendar)
+        return len(self._named)
+
+    async def refresh(self, name: str) -> Optional[WorkingCalendar]:
+        """
+        Named calendar, reread from MongoDB when missing or older than refresh_seconds
+
+        Keeps processes that did not make an edit (e.g. the worker) up to date.
+
+        Args:
+            name: Calendar name
+
+        Returns:
+            WorkingCalendar, or None if no calendar has that name
+        """
+        read_at = self._read_at.get(name)
+        if read_at is not None and time.monotonic() - read_at < self.refresh_seconds:
+            return self._named.get(name)
+        calendar = await WorkingCalendar.find_one(WorkingCalendar.name == name)
+        if calendar is None:
+            self._named.pop(name, None)
+            self._read_at.pop(name, None)
+            return None
+        self._remember(calendar)
+        return calendar
+
+    async def resolve(self, constraints: Optional[Any]) -> bool:
+        """
+        Refresh the calendar named by constraints before they are scheduled
+
+        Args:
+            constraints: Scheduling constraints (or None)
+
+        Returns:
+            False if constraints name a calendar that does not exist
+        """
+        name = getattr(constraints, "calendar_name", None)
+        return not name or await self.refresh(name) is not None
+
+    async def save(
+        self,
+        name: str,
+        no_work_on_weekends: bool = True,
+        unavailable_dates: Optional[List[str]] = None,
+        description: Optional[str] = None
+    ) -> WorkingCalendar:
+        """
+        Create or replace a named calendar
+
+        A single atomic upsert, so concurrent saves of the same name never
+        collide; the last write wins.
+
+        Args:
+            name: Calendar name
+            no_work_on_weekends: Whether Saturdays and Sundays are non-working
+            unavailable_dates: Dates that are never worked (YYYY-MM-DD)
+            description: Optional description
+
+        Returns:
+            Stored WorkingCalendar
+        """
+        now = datetime.utcnow()
+        update = {
+            "$set": {
+                "description": description,
+                "no_work_on_weekends": no_work_on_weekends,
+                "unavailable_dates": sorted(set(unavailable_dates or [])),
+                "updated_at": now,
+            },
+            "$setOnInsert": {"created_at": now},
+        }
+        collection = WorkingCalendar.get_motor_collection()
+        try:
+            document = await collection.find_one_and_update(
+                {"name": name}, update, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # A concurrent save inserted the name first - update its document
+            document = await collection.find_one_and_update(
+                {"name": name}, update, return_document=ReturnDocument.AFTER
+            )
+        calendar = WorkingCalendar.model_validate(document)
+        self._remember(calendar)
+        return calendar
+
+    async def delete(self, name: str) -> bool:
+        """
+        Delete a named calendar
+
+        Plans that still name it fall back to their own constraints.
+
+        Returns:
+            True if a calendar was deleted
+        """
+        calendar = await WorkingCalendar.find_one(WorkingCalendar.name == name)
+        self._named.pop(name, None)
+        self._read_at.pop(name, None)
+        if calendar is None:
+            return False
+        await calendar.delete()
+        return True
+
+    def get(self, name: str) -> Optional[WorkingCalendar]:
+        """Named calendar from memory"""
+        return self._named.get(name)
+
+    def fingerprint(self, constraints: Optional[Any]) -> Fingerprint:
+        """
+        Effective weekend rule and unavailable dates of constraints
+
+        Order and duplicates of the date strings do not matter. An unknown
+        calendar_name is logged and ignored.
+
+        Args:
+            constraints: Scheduling constraints (or None)
+
+        Returns:
+            Tuple of (skip weekends, sorted unique date strings)
+        """
+        skip_weekends = constraints.no_work_on_weekends if constraints else True
+        dates = set(getattr(constraints, "unavailable_dates", None) or ())
+        name = getattr(constraints, "calendar_name", None)
+        if name:
+            named = self._named.get(name)
+            if named is None:
+                logger.warning(f"Unknown working calendar {name}; using the plan's own constraints")
+            else:
+                skip_weekends = named.no_work_on_weekends
+                dates.update(named.unavailable_dates)
+        return bool(skip_weekends), tuple(sorted(dates))
+
+    def compile(self, constraints: Optional[Any]) -> WorkCalendar:
+        """
+        Compiled calendar of constraints, built on a miss
+
+        Args:
+            constraints: Scheduling constraints (or None for weekends off)
+
+        Returns:
+            WorkCalendar (shared; do not modify)
+        """
+        key = self.fingerprint(constraints)
+        with self._lock:
+            calendar = self._compiled.get(key)
+            if calendar is not None:
+                self._compiled.move_to_end(key)
+                self.stats["hits"] += 1
+                return calendar
+
+        skip_weekends, date_strs = key
+        calendar = WorkCalendar(skip_weekends, WorkCalendar.parse_dates(date_strs))
+        with self._lock:
+            self.stats["misses"] += 1
+            self._compiled[key] = calendar
+            self._compiled.move_to_end(key)
+            while len(self._compiled) > self.max_entries:
+                self._compiled.popitem(last=False)
+        return calendar
+
+    def _remember(self, calendar: WorkingCalendar) -> None:
+        """Keep a named calendar in memory"""
+        self._named[calendar.name] = calendar
+        self._read_at[calendar.name] = time.monotonic()
+
+
+# Singleton instance
+calendar_registry = CalendarRegistry(
+    max_entries=settings.CALENDAR_CACHE_SIZE,
+    refresh_seconds=settings.CALENDAR_REFRESH_SECONDS
+)
@@ -0,0 +1,145 @@
+"""
+Circuit breaker and latency tracking for LLM provider calls
+"""
+import math
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the circuit is open"""
+
+
+class CircuitBreaker:
+    """
+    Sliding-window circuit breaker
+
+    A call counts as bad when it fails or takes longer than
+    slow_call_seconds. Once at least min_calls outcomes are in the window
+    and the bad fraction reaches failure_rate, the circuit opens and
+    calls are rejected for reset_timeout_seconds. After that a single
+    probe call is let through (half-open): success closes the circuit,
+    failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        window_size: int,
+        min_calls: int,
+        failure_rate: float,
+        slow_call_seconds: float,
+        reset_timeout_seconds: float
+    ):
+        """Initialize a closed breaker"""
+        self.window_size = window_size
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_timeout_seconds = reset_timeout_seconds
+        self.state = self.CLOSED
+        self._outcomes: deque = deque(maxlen=window_size)  # True = bad call
+        self._opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self.stats = {
+            "trips": 0,
+            "rejected": 0,
+            "failures": 0,
+            "slow_calls": 0,
+        }
+
+    def allow_request(self) -> bool:
+        """Whether a call may proceed right now"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.reset_timeout_seconds:
+                self.stats["rejected"] += 1
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                self.stats["rejected"] += 1
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record_success(self, latency_seconds: float) -> None:
+        """Record a completed call; slow calls count against the circuit"""
+        slow = latency_seconds > self.slow_call_seconds
+        if slow:
+            self.stats["slow_calls"] += 1
+
+        if self.state == self.HALF_OPEN:
+            if slow:
+                self._trip()
+            else:
+                self.state = self.CLOSED
+                self._outcomes.clear()
+            self._probe_in_flight = False
+            return
+        self._record(slow)
+
+    def record_failure(self) -> None:
+        """Record a failed or timed-out call"""
+        self.stats["failures"] += 1
+        if self.state == self.HALF_OPEN:
+            self._probe_in_flight = False
+            self._trip()
+            return
+        self._record(True)
+
+    def release_probe(self) -> None:
+        """Forget an abandoned (cancelled) call without recording an outcome"""
+        self._probe_in_flight = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return the current state and counters"""
+        return {"state": self.state, **self.stats}
+
+    def _record(self, bad: bool) -> None:
+        """Add an outcome to the window and trip if the bad rate is too high"""
+        self._outcomes.append(bad)
+        if self.state == self.CLOSED and len(self._outcomes) >= self.min_calls:
+            if sum(self._outcomes) / len(self._outcomes) >= self.failure_rate:
+                self._trip()
+
+    def _trip(self) -> None:
+        """Open the circuit"""
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.stats["trips"] += 1
+
+
+class LatencyTracker:
+    """Rolling window of call latencies for percentile estimates"""
+
+    def __init__(self, window_size: int):
+        """Initialize an empty window"""
+        self._samples: deque = deque(maxlen=window_size)
+
+    def record(self, latency_seconds: float) -> None:
+        """Add one latency sample"""
+        self._samples.append(latency_seconds)
+
+    def percentile(self, percent: float, min_samples: int = 1) -> Optional[float]:
+        """Nearest-rank percentile, or None until min_samples are collected"""
+        if len(self._samples) < max(min_samples, 1):
+            return None
+        ordered = sorted(self._samples)
+        rank = max(math.ceil(percent / 100 * len(ordered)) - 1, 0)
+        return ordered[min(rank, len(ordered) - 1)]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return sample count and common percentiles (seconds)"""
+        return {
+            "samples": len(self._samples),
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
@@ -0,0 +1,238 @@
+"""
+NumPy critical-path engine over integer-indexed dependency arrays
+"""
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+# Successor CSR: (succ_indptr, edge sources, edge targets)
+Successors = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+class ForwardPass(NamedTuple):
+    """Result of forward_pass; level k is order[level_bounds[k]:level_bounds[k + 1]]"""
+    order: np.ndarray
+    earliest_start: np.ndarray
+    earliest_finish: np.ndarray
+    level_bounds: np.ndarray
+
+
+class BackwardPass(NamedTuple):
+    """Result of backward_pass; -1 marks tasks that were never released"""
+    latest_start: np.ndarray
+    latest_finish: np.ndarray
+    total_float: np.ndarray
+    free_float: np.ndarray
+
+
+def gather_ranges(indptr: np.ndarray, nodes: np.ndarray) -> np.ndarray:
+    """Concatenate the CSR ranges of the given nodes, in node order"""
+    starts = indptr[nodes]
+    lengths = indptr[nodes + 1] - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(total, dtype=np.int64)
+
+
+def successor_arrays(pred_indptr: np.ndarray, pred_indices: np.ndarray) -> Successors:
+    """
+    Transpose the prerequisite CSR into successor CSR
+
+    Returns:
+        Tuple of (succ_indptr, edge sources, edge targets); targets are in
+        ascending task index within each source
+    """
+    n = len(pred_indptr) - 1
+    dst = np.repeat(np.arange(n, dtype=np.int64), np.diff(pred_indptr))
+    by_source = np.argsort(pred_indices, kind="stable")
+    succ_indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pred_indices, minlength=n), out=succ_indptr[1:])
+    return succ_indptr, pred_indices[by_source], dst[by_source]
+
+
+def forward_pass(
+    durations: np.ndarray,
+    pred_indptr: np.ndarray,
+    pred_indices: np.ndarray,
+    successors: Optional[Successors] = None
+) -> ForwardPass:
+    """
+    Topological order and earliest start/finish, one dependency level at a time
+
+    Each iteration releases every task whose prerequisites all finished in
+    earlier levels. Tasks of a level are ordered by the position of their
+    last-finishing prerequisite, then by index, which reproduces the
+    first-in-first-out Kahn order of the reference implementation. Tasks
+    on or behind a dependency cycle are never released.
+
+    Args:
+        durations: Task durations
+        pred_indptr: CSR row pointers of the prerequisites
+        pred_indices: CSR prerequisite indices
+        successors: successor_arrays of the same CSR, if already computed
+
+    Returns:
+        ForwardPass; unreleased tasks are absent from order and have
+        earliest_finish -1
+    """
+    n = len(durations)
+    succ_indptr, succ_src, succ_dst = successors or successor_arrays(pred_indptr, pred_indices)
+
+    remaining = np.diff(pred_indptr).copy()
+    position = np.full(n, -1, dtype=np.int64)
+    trigger = np.full(n, -1, dtype=np.int64)
+    earliest_start = np.zeros(n, dtype=np.int64)
+    earliest_finish = np.full(n, -1, dtype=np.int64)
+
+    levels = []
+    frontier = np.flatnonzero(remaining == 0)
+    released = 0
+    while frontier.size:
+        levels.append(frontier)
+        position[frontier] = np.arange(released, released + frontier.size)
+        released += frontier.size
+        earliest_finish[frontier] = earliest_start[frontier] + durations[frontier]
+
+        edges = gather_ranges(succ_indptr, frontier)
+        if edges.size == 0:
+            break
+        sources = succ_src[edges]
+        targets = succ_dst[edges]
+        remaining -= np.bincount(targets, minlength=n)
+        np.maximum.at(earliest_start, targets, earliest_finish[sources])
+        np.maximum.at(trigger, targets, position[sources])
+
+        ready = np.unique(targets[remaining[targets] == 0])
+        frontier = ready[np.lexsort((ready, trigger[ready]))]
+
+    order = np.concatenate(levels) if levels else np.empty(0, dtype=np.int64)
+    level_bounds = np.cumsum([0] + [level.size for level in levels])
+    return ForwardPass(order, earliest_start, earliest_finish, level_bounds)
+
+
+def backward_pass(
+    durations: np.ndarray,
+    pred_indptr: np.ndarray,
+    pred_indices: np.ndarray,
+    forward: ForwardPass,
+    successors: Optional[Successors] = None
+) -> BackwardPass:
+    """
+    Latest start/finish and total/free float, one dependency level at a time
+
+    Levels are visited in reverse: a task must finish before the latest
+    start of each of its successors, or by the project end if it has none.
+    Total float is how far a task can slip without moving the project end;
+    free float is how far it can slip without delaying any successor's
+    earliest start. Tasks that were never released are ignored as
+    successors.
+
+    Args:
+        durations: Task durations
+        pred_indptr: CSR row pointers of the prerequisites
+        pred_indices: CSR prerequisite indices
+        forward: Result of forward_pass for the same arrays
+        successors: successor_arrays of the same CSR, if already computed
+
+    Returns:
+        BackwardPass
+    """
+    n = len(durations)
+    order, earliest_start, earliest_finish, level_bounds = forward
+    released = earliest_finish >= 0
+    project_end = int(earliest_finish[order].max()) if order.size else 0
+    succ_indptr, succ_src, succ_dst = successors or successor_arrays(pred_indptr, pred_indices)
+
+    latest_finish = np.full(n, project_end, dtype=np.int64)
+    latest_start = np.full(n, -1, dtype=np.int64)
+    for level in range(len(level_bounds) - 2, -1, -1):
+        nodes = order[level_bounds[level]:level_bounds[level + 1]]
+        edges = gather_ranges(succ_indptr, nodes)
+        edges = edges[released[succ_dst[edges]]]
+        np.minimum.at(latest_finish, succ_src[edges], latest_start[succ_dst[edges]])
+        latest_start[nodes] = latest_finish[nodes] - durations[nodes]
+
+    next_start = np.full(n, project_end, dtype=np.int64)
+    live = released[succ_src] & released[succ_dst]
+    np.minimum.at(next_start, succ_src[live], earliest_start[succ_dst[live]])
+
+    latest_finish[~released] = -1
+    total_float = np.where(released, latest_start - earliest_start, -1)
+    free_float = np.where(released, next_start - earliest_finish, -1)
+    return BackwardPass(latest_start, latest_finish, total_float, free_float)
+
+
+def zero_float_paths(
+    pred_indptr: np.ndarray,
+    pred_indices: np.ndarray,
+    forward: ForwardPass,
+    backward: BackwardPass,
+    max_paths: int,
+    successors: Optional[Successors] = None
+) -> List[List[int]]:
+    """
+    Enumerate critical paths: chains of zero-float tasks from start to finish
+
+    A path starts at a zero-float task that starts at time 0 and follows
+    zero-float successors that start exactly when their prerequisite
+    finishes, until the project end. Every such chain reaches the end, so
+    the walk never backtracks out of a dead end; enumeration stops after
+    max_paths paths.
+
+    Returns:
+        Paths as lists of task indices, in topological order of their first task
+    """
+    if forward.order.size == 0 or max_paths <= 0:
+        return []
+    succ_indptr, _, succ_dst = successors or successor_arrays(pred_indptr, pred_indices)
+    critical = backward.total_float == 0
+    project_end = int(forward.earliest_finish[forward.order].max())
+
+    paths: List[List[int]] = []
+    starts = [int(i) for i in forward.order if critical[i] and forward.earliest_start[i] == 0]
+    stack = [[start] for start in reversed(starts)]
+    while stack and len(paths) < max_paths:
+        path = stack.pop()
+        last = path[-1]
+        if forward.earliest_finish[last] == project_end:
+            paths.append(path)
+            continue
+        following = succ_dst[succ_indptr[last]:succ_indptr[last + 1]]
+        following = following[
+            critical[following] & (forward.earliest_start[following] == forward.earliest_finish[last])
+        ]
+        for successor in np.unique(following)[::-1]:
+            stack.append(path + [int(successor)])
+    return paths
+
+
+def critical_path_indices(
+    pred_indptr: np.ndarray,
+    pred_indices: np.ndarray,
+    forward: ForwardPass
+) -> List[int]:
+    """
+    Backtrack the longest chain from the task that finishes last
+
+    Ties go to the first task in topological order, and while walking back
+    to the first prerequisite (in depends_on order) with the latest finish.
+
+    Returns:
+        Task indices of the critical path, first task first
+    """
+    order, earliest_finish = forward.order, forward.earliest_finish
+    if order.size == 0:
+        return []
+    current = int(order[np.argmax(earliest_finish[order])])
+    path = [current]
+    while True:
+        preds = pred_indices[pred_indptr[current]:pred_indptr[current + 1]]
+        preds = preds[earliest_finish[preds] >= 0]
+        if preds.size == 0:
+            break
+        current = int(preds[np.argmax(earliest_finish[preds])])
+        path.append(current)
+    path.reverse()
+    return path
@@ -0,0 +1,342 @@
+"""
+Rule/template-based planner: instant plans without an LLM call
+"""
+import re
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Dict, List, Optional, Tuple
+
+from config import settings
+from schemas import Constraints, LLMPlanResponse, LLMTaskResponse
+
+
+class PlannerMode(str, Enum):
+    """Which planner create_plan uses"""
+    LLM = "llm"  # Always call the LLM
+    HEURISTIC = "heuristic"  # Always use the template planner
+    AUTO = "auto"  # Template planner when the goal category is recognized confidently
+
+
+@dataclass(frozen=True)
+class TaskTemplate:
+    """One templated task; depends_on holds indices of earlier templates"""
+    title: str
+    description: str  # May reference {subject}
+    duration_days: int
+    depends_on: Tuple[int, ...] = ()
+    priority: str = "Medium"
+    confidence: float = 0.8
+
+
+@dataclass(frozen=True)
+class GoalCategory:
+    """Keyword-classified goal category with its task templates"""
+    name: str
+    keywords: Dict[str, float]
+    tasks: List[TaskTemplate] = field(default_factory=list)
+    summary: str = ""
+
+
+CATEGORIES = [
+    GoalCategory(
+        name="software",
+        keywords={
+            "app": 2, "application": 2, "software": 2, "api": 2, "backend": 2, "frontend": 2,
+            "mobile": 1.5, "ios": 1.5, "android": 1.5, "saas": 2, "mvp": 1.5, "feature": 1,
+            "code": 1, "deploy": 1, "microservice": 2, "platform": 1, "bot": 1.5, "tool": 0.5,
+        },
+        tasks=[
+            TaskTemplate("Define requirements", "Write down user stories, scope and acceptance criteria for {subject}", 2, (), "High", 0.9),
+            TaskTemplate("Design architecture and UI", "Choose the stack, data model and main screens for {subject}", 2, (0,), "High", 0.85),
+            TaskTemplate("Set up project and CI", "Create the repository, environments and automated build for {subject}", 1, (1,), "Medium", 0.9),
+            TaskTemplate("Build core features", "Implement the must-have functionality of {subject}", 5, (2,), "High", 0.7),
+            TaskTemplate("Build secondary features", "Implement the remaining in-scope functionality", 3, (3,), "Medium", 0.7),
+            TaskTemplate("Testing and bug fixing", "Run unit, integration and manual tests and fix defects", 3, (4,), "High", 0.75),
+            TaskTemplate("Write documentation", "Document setup, usage and known limitations", 1, (3,), "Low", 0.85),
+            TaskTemplate("Release", "Deploy {subject} to production and monitor the rollout", 1, (5, 6), "High", 0.8),
+        ],
+        summary="Requirements and design first, then setup, core and secondary features, testing and release.",
+    ),
+    GoalCategory(
+        name="website",
+        keywords={
+            "website": 3, "site": 2, "blog": 2, "landing": 2, "page": 1, "portfolio": 2,
+            "wordpress": 2, "ecommerce": 2, "shop": 1, "store": 1, "domain": 1, "seo": 1,
+        },
+        tasks=[
+            TaskTemplate("Define goals and content", "List the pages, audience and content needed for {subject}", 1, (), "High", 0.9),
+            TaskTemplate("Choose platform and hosting", "Pick a site builder or stack, domain and hosting", 1, (0,), "High", 0.9),
+            TaskTemplate("Design layout", "Create wireframes and the visual style", 2, (0,), "Medium", 0.8),
+            TaskTemplate("Write and gather content", "Write copy and collect images for every page", 3, (0,), "High", 0.75),
+            TaskTemplate("Build pages", "Implement the pages on the chosen platform", 3, (1, 2), "High", 0.8),
+            TaskTemplate("Add content and SEO basics", "Publish the content, set titles, descriptions and analytics", 1, (3, 4), "Medium", 0.85),
+            TaskTemplate("Test and launch", "Check links, mobile layout and forms, then go live", 1, (5,), "High", 0.85),
+        ],
+        summary="Plan content, pick a platform, design and build the pages, then add content and launch.",
+    ),
+    GoalCategory(
+        name="learning",
+        keywords={
+            "learn": 3, "study": 3, "course": 2, "master": 1.5, "understand": 1.5, "language": 1.5,
+            "certification": 2, "exam": 2, "skill": 1.5, "practice": 1, "tutorial": 1.5, "read": 1,
+        },
+        tasks=[
+            TaskTemplate("Assess starting level", "Find out what you already know about {subject} and set a target level", 1, (), "High", 0.9),
+            TaskTemplate("Gather learning resources", "Pick a primary course or book and supporting material", 1, (0,), "High", 0.9),
+            TaskTemplate("Learn the fundamentals", "Work through the core concepts with daily practice", 5, (1,), "High", 0.75),
+            TaskTemplate("Practice with exercises", "Solve exercises and review mistakes", 4, (2,), "High", 0.75),
+            TaskTemplate("Build a small project", "Apply {subject} in a self-contained project", 4, (3,), "Medium", 0.7),
+            TaskTemplate("Review and self-test", "Revisit weak areas and take a practice test", 2, (4,), "Medium", 0.8),
+        ],
+        summary="Assess your level, gather resources, learn the fundamentals, practice, apply and review.",
+    ),
+    GoalCategory(
+        name="fitness",
+        keywords={
+            "fitness": 3, "marathon": 3, "run": 2, "running": 2, "weight": 2, "gym": 2, "workout": 2,
+            "exercise": 2, "diet": 2, "health": 1.5, "muscle": 2, "lose": 1, "train": 1, "5k": 2, "10k": 2,
+        },
+        tasks=[
+            TaskTemplate("Set baseline and target", "Measure your current fitness and define the target for {subject}", 1, (), "High", 0.9),
+            TaskTemplate("Create training schedule", "Plan weekly sessions, rest days and progression", 1, (0,), "High", 0.9),
+            TaskTemplate("Adjust nutrition", "Plan meals and hydration that support the training", 1, (0,), "Medium", 0.8),
+            TaskTemplate("Base training phase", "Build consistency with moderate sessions", 7, (1, 2), "High", 0.75),
+            TaskTemplate("Build phase", "Increase intensity and volume step by step", 7, (3,), "High", 0.7),
+            TaskTemplate("Taper and final check", "Reduce load, recover and measure progress against the target", 3, (4,), "Medium", 0.8),
+        ],
+        summary="Measure a baseline, plan training and nutrition, then build up in phases and check progress.",
+    ),
+    GoalCategory(
+        name="event",
+        keywords={
+            "event": 3, "wedding": 3, "party": 3, "conference": 3, "meetup": 2, "birthday": 2,
+            "ceremony": 2, "workshop": 1.5, "venue": 2, "guests": 2, "festival": 2, "celebration": 2,
+        },
+        tasks=[
+            TaskTemplate("Set budget and guest list", "Decide the budget, date range and who to invite to {subject}", 1, (), "High", 0.9),
+            TaskTemplate("Book venue", "Compare and book a venue for the chosen date", 2, (0,), "High", 0.8),
+            TaskTemplate("Book vendors", "Arrange catering, equipment and other vendors", 3, (1,), "High", 0.75),
+            TaskTemplate("Send invitations", "Send invitations and track RSVPs", 1, (1,), "High", 0.85),
+            TaskTemplate("Plan schedule", "Prepare the run of show and assign responsibilities", 2, (2, 3), "Medium", 0.8),
+            TaskTemplate("Final confirmations", "Confirm vendors, headcount and logistics", 1, (4,), "High", 0.85),
+            TaskTemplate("Run the event", "Host {subject} and handle on-site issues", 1, (5,), "High", 0.8),
+        ],
+        summary="Fix budget and guests, book venue and vendors, invite, plan the schedule and run the event.",
+    ),
+    GoalCategory(
+        name="marketing",
+        keywords={
+            "marketing": 3, "campaign": 3, "launch": 1.5, "brand": 2, "social": 1.5, "audience": 2,
+            "ads": 2, "newsletter": 2, "promote": 2, "growth": 1.5, "customers": 1.5, "sales": 1.5,
+        },
+        tasks=[
+            TaskTemplate("Define audience and goals", "Describe the target audience and measurable goals for {subject}", 1, (), "High", 0.9),
+            TaskTemplate("Research competitors", "Review competitor positioning and channels", 2, (0,), "Medium", 0.8),
+            TaskTemplate("Plan channels and budget", "Choose channels, budget split and timeline", 1, (1,), "High", 0.85),
+            TaskTemplate("Create content and assets", "Produce copy, visuals and landing pages", 4, (2,), "High", 0.7),
+            TaskTemplate("Launch campaign", "Publish content and start paid and organic activity", 1, (3,), "High", 0.8),
+            TaskTemplate("Measure and optimize", "Track results against goals and adjust", 3, (4,), "Medium", 0.75),
+        ],
+        summary="Define the audience, research, plan channels, produce assets, launch and optimize.",
+    ),
+    GoalCategory(
+        name="writing",
+        keywords={
+            "write": 3, "book": 2.5, "thesis": 3, "paper": 2.5, "article": 2, "novel": 3, "report": 2,
+            "research": 1.5, "publish": 1.5, "dissertation": 3, "essay": 2, "chapter": 2,
+        },
+        tasks=[
+            TaskTemplate("Define topic and outline", "Narrow the topic and outline the structure of {subject}", 2, (), "High", 0.85),
+            TaskTemplate("Research and collect sources", "Collect and summarize the sources you will use", 4, (0,), "High", 0.75),
+            TaskTemplate("Write first draft", "Write the complete first draft following the outline", 7, (1,), "High", 0.7),
+            TaskTemplate("Revise content", "Restructure and strengthen arguments or story", 3, (2,), "High", 0.75),
+            TaskTemplate("Get feedback", "Share the draft with reviewers and collect feedback", 2, (3,), "Medium", 0.8),
+            TaskTemplate("Final edit and proofread", "Apply feedback, edit language and format", 2, (4,), "High", 0.8),
+            TaskTemplate("Submit or publish", "Submit or publish {subject}", 1, (5,), "High", 0.85),
+        ],
+        summary="Outline, research, draft, revise, get feedback, edit and publish.",
+    ),
+    GoalCategory(
+        name="job_search",
+        keywords={
+            "job": 3, "career": 2.5, "interview": 3, "resume": 3, "cv": 3, "hired": 2, "offer": 1.5,
+            "position": 1.5, "role": 1, "linkedin": 2, "apply": 1.5, "internship": 2.5,
+        },
+        tasks=[
+            TaskTemplate("Define target roles", "List target roles, companies and requirements for {subject}", 1, (), "High", 0.9),
+            TaskTemplate("Update resume and profiles", "Tailor the resume and update online profiles", 2, (0,), "High", 0.85),
+            TaskTemplate("Build application pipeline", "Find openings and track applications", 2, (1,), "High", 0.8),
+            TaskTemplate("Network and get referrals", "Reach out to contacts at target companies", 3, (1,), "Medium", 0.7),
+            TaskTemplate("Prepare for interviews", "Practice common and role-specific interview questions", 4, (1,), "High", 0.75),
+            TaskTemplate("Interview and follow up", "Attend interviews and send follow-ups", 5, (2, 3, 4), "High", 0.65),
+            TaskTemplate("Evaluate offers", "Compare offers and negotiate", 2, (5,), "Medium", 0.75),
+        ],
+        summary="Target roles, update materials, apply and network, prepare, interview and evaluate offers.",
+    ),
+    GoalCategory(
+        name="moving",
+        keywords={
+            "move": 3, "moving": 3, "relocate": 3, "relocation": 3, "apartment": 2, "house": 1.5,
+            "home": 1, "city": 1, "rent": 1.5, "packing": 2,
+        },
+        tasks=[
+            TaskTemplate("Set budget and timeline", "Decide the budget and moving date for {subject}", 1, (), "High", 0.9),
+            TaskTemplate("Find new place", "Search, visit and secure the new home", 5, (0,), "High", 0.65),
+            TaskTemplate("Book movers", "Compare quotes and book movers or a van", 1, (1,), "High", 0.85),
+            TaskTemplate("Declutter and pack", "Sort belongings and pack room by room", 4, (1,), "Medium", 0.75),
+            TaskTemplate("Update address and utilities", "Transfer utilities and update your address", 1, (1,), "Medium", 0.85),
+            TaskTemplate("Moving day", "Move and check the inventory", 1, (2, 3, 4), "High", 0.8),
+            TaskTemplate("Unpack and settle in", "Unpack essentials first, then the rest", 3, (5,), "Low", 0.8),
+        ],
+        summary="Budget, find a place, book movers, pack and update your address, move and settle in.",
+    ),
+]
+
+GENERIC_CATEGORY = GoalCategory(
+    name="generic",
+    keywords={},
+    tasks=[
+        TaskTemplate("Clarify scope and success criteria", "Define what done looks like for {subject}", 1, (), "High", 0.85),
+        TaskTemplate("Research and plan approach", "Research options and plan the approach for {subject}", 2, (0,), "High", 0.8),
+        TaskTemplate("Prepare resources", "Gather the tools, people and materials needed", 1, (1,), "Medium", 0.8),
+        TaskTemplate("Execute main work", "Carry out the core work", 4, (2,), "High", 0.65),
+        TaskTemplate("Review and refine", "Check results against the success criteria and refine", 2, (3,), "Medium", 0.75),
+        TaskTemplate("Wrap up", "Finalize, share results and note lessons learned", 1, (4,), "Low", 0.85),
+    ],
+    summary="Clarify scope, research, prepare, execute, review and wrap up.",
+)
+
+_PLAN_TYPE_SCALE = {"aggressive": 0.8, "moderate": 1.0, "conservative": 1.25}
+_HORIZON = re.compile(r"(\d+|one|two|three|four|five|six|eight|ten|twelve)\s*(day|week|month)s?", re.I)
+_NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "eight": 8, "ten": 10, "twelve": 12}
+_UNIT_DAYS = {"day": 1, "week": 5, "month": 21}  # Working days
+_LEADING_PHRASES = re.compile(r"^(i\s+(want|need|would like)\s+to|help\s+me|i'm\s+going\s+to|my\s+goal\s+is\s+to)\s+", re.I)
+
+
+class HeuristicPlanner:
+    """Classify a goal by keywords and fill in the matching task templates"""
+
+    def classify(self, goal_text: str) -> Tuple[GoalCategory, float]:
+        """
+        Pick the goal category with the highest keyword score
+
+        Confidence grows with the winning score and its margin over the
+        runner-up, so goals that match several categories score lower.
+
+        Args:
+            goal_text: The user's goal description
+
+        Returns:
+            Tuple of (category, confidence between 0 and 1)
+        """
+        words = set(re.findall(r"[a-z0-9]+", goal_text.lower()))
+        scores = sorted(
+            ((sum(weight for keyword, weight in category.keywords.items() if keyword in words), category)
+             for category in CATEGORIES),
+            key=lambda item: item[0],
+            reverse=True
+        )
+        best_score, best = scores[0]
+        if best_score == 0:
+            return GENERIC_CATEGORY, 0.3
+        runner_up = scores[1][0] if len(scores) > 1 else 0.0
+        confidence = min(0.4 + 0.1 * best_score, 0.95) * (1 - 0.5 * runner_up / best_score)
+        return best, round(confidence, 2)
+
+    def generate_plan(
+        self,
+        goal_text: str,
+        constraints: Optional[Constraints] = None,
+        plan_type: str = "moderate"
+    ) -> LLMPlanResponse:
+        """
+        Build a plan from the templates of the goal's category
+
+        Durations are scaled to a time horizon found in the goal text
+        ("in 3 weeks") and to the plan type.
+
+        Args:
+            goal_text: The user's goal description
+            constraints: Optional constraints (accepted for interface parity;
+                dates are applied later by PlanGenerator)
+            plan_type: Type of plan (moderate, aggressive, conservative)
+
+        Returns:
+            LLMPlanResponse with metadata source "heuristic"
+        """
+        category, confidence = self.classify(goal_text)
+        scale = self._duration_scale(goal_text, category) * _PLAN_TYPE_SCALE.get(getattr(plan_type, "value", plan_type), 1.0)
+        subject = self._subject(goal_text)
+
+        tasks = [
+            LLMTaskResponse(
+                id=f"T{index + 1}",
+                title=template.title,
+                description=template.description.format(subject=subject),
+                duration_days=min(max(round(template.duration_days * scale), 1), 30),
+                depends_on=[f"T{dep + 1}" for dep in template.depends_on],
+                priority=template.priority,
+                confidence=template.confidence
+            )
+            for index, template in enumerate(category.tasks)
+        ]
+        return LLMPlanResponse(
+            tasks=tasks,
+            plan_summary=f"{category.summary} (Template plan for: {goal_text})",
+            metadata={"source": "heuristic", "category": category.name, "confidence": confidence}
+        )
+
+    def _duration_scale(self, goal_text: str, category: GoalCategory) -> float:
+        """Stretch or shrink template durations to a horizon stated in the goal"""
+        match = _HORIZON.search(goal_text)
+        if not match:
+            return 1.0
+        amount = match.group(1).lower()
+        horizon = int(_NUMBER_WORDS.get(amount, amount)) * _UNIT_DAYS[match.group(2).lower()]
+        template_length = self._longest_path(category.tasks)
+        return max(horizon / template_length, 0.25) if template_length else 1.0
+
+    @staticmethod
+    def _longest_path(templates: List[TaskTemplate]) -> int:
+        """Length in days of the longest dependency chain of the templates"""
+        finish = []
+        for template in templates:
+            start = max((finish[dep] for dep in template.depends_on), default=0)
+            finish.append(start + template.duration_days)
+        return max(finish, default=0)
+
+    @staticmethod
+    def _subject(goal_text: str) -> str:
+        """Short form of the goal used inside task descriptions"""
+        subject = _LEADING_PHRASES.sub("", goal_text.strip()).rstrip(".!")
+        return subject[:1].lower() + subject[1:] if subject else "the goal"
+
+
+# Singleton instance
+heuristic_planner = HeuristicPlanner()
+
+
+def plan_without_llm(
+    goal_text: str,
+    constraints: Optional[Constraints],
+    plan_type: str,
+    mode: PlannerMode
+) -> Optional[LLMPlanResponse]:
+    """
+    Return a template plan if the planner mode routes this goal away from the LLM
+
+    Args:
+        goal_text: The user's goal description
+        constraints: Optional constraints
+        plan_type: Type of plan (moderate, aggressive, conservative)
+        mode: Requested planner mode
+
+    Returns:
+        LLMPlanResponse from the heuristic planner, or None to use the LLM
+    """
+    if mode == PlannerMode.LLM:
+        return None
+    response = heuristic_planner.generate_plan(goal_text, constraints, plan_type)
+    if mode == PlannerMode.AUTO and response.metadata["confidence"] < settings.HEURISTIC_CONFIDENCE_THRESHOLD:
+        return None
+    return response
@@ -0,0 +1,312 @@
+"""
+MongoDB-backed job queue for background plan generation and milestone expansion
+"""
+import asyncio
+import logging
+from contextlib import suppress
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from beanie import PydanticObjectId
+from pymongo import ReturnDocument
+
+from config import settings
+from models_mongo import Goal, Job, JobStatus, Plan, Task
+from schemas import Constraints
+from services.llm_service import llm_service
+from services.calendar_registry import calendar_registry
+from services.plan_pipeline import schedule_llm_tasks, save_plan
+from services.plan_expansion import expand_all_milestones
+from services.phased_generation import generate_phased_plan
+from services.similarity_index import similarity_index, find_reusable_plan, is_indexable
+from services.quota import Priority, llm_priority
+from services.heuristic_planner import PlannerMode, plan_without_llm
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseLostError(Exception):
+    """Raised when another worker has taken over a job this worker was running"""
+
+
+async def enqueue_plan_job(goal: Goal, payload: Dict[str, Any]) -> Job:
+    """
+    Persist a plan-generation job for a worker to pick up
+
+    Args:
+        goal: Goal document the plan will belong to
+        payload: JSON-serializable request parameters (goal_text,
+            plan_type, constraints, bypass_cache)
+
+    Returns:
+        The queued Job document
+    """
+    job = Job(
+        payload=payload,
+        goal_id=str(goal.id),
+        max_attempts=settings.JOB_MAX_ATTEMPTS
+    )
+    await job.insert()
+    return job
+
+
+async def claim_next_job(worker_id: str) -> Optional[Job]:
+    """
+    Atomically claim the oldest queued job (or one whose lease expired)
+
+    A single find_one_and_update moves the job to running and stamps the
+    worker and lease, so two workers can never claim the same job. Jobs
+    whose worker died on their last attempt are failed first (see
+    fail_abandoned_jobs).
+
+    Args:
+        worker_id: Identifier of the claiming worker
+
+    Returns:
+        The claimed Job, or None if the queue is empty
+    """
+    await fail_abandoned_jobs()
+    now = datetime.utcnow()
+    document = await Job.get_motor_collection().find_one_and_update(
+        {
+            "$or": [
+                {"status": JobStatus.QUEUED.value},
+                {"status": JobStatus.RUNNING.value, "lease_expires_at": {"$lt": now}},
+            ],
+            "$expr": {"$lt": ["$attempts", "$max_attempts"]},
+        },
+        {
+            "$set": {
+                "status": JobStatus.RUNNING.value,
+                "worker_id": worker_id,
+                "lease_expires_at": now + timedelta(seconds=settings.JOB_LEASE_SECONDS),
+                "started_at": now,
+                "updated_at": now,
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+    return Job.model_validate(document) if document else None
+
+
+async def fail_abandoned_jobs() -> int:
+    """
+    Fail running jobs whose lease expired on their last attempt
+
+    claim_next_job never reclaims them, so without this they would stay
+    running forever and clients would poll them indefinitely.
+
+    Returns:
+        Number of jobs failed
+    """
+    now = datetime.utcnow()
+    result = await Job.get_motor_collection().update_many(
+        {
+            "status": JobStatus.RUNNING.value,
+            "lease_expires_at": {"$lt": now},
+            "$expr": {"$gte": ["$attempts", "$max_attempts"]},
+        },
+        {
+            "$set": {
+                "status": JobStatus.FAILED.value,
+                "stage": "failed",
+                "error": "Worker stopped responding on the last attempt",
+                "lease_expires_at": None,
+                "finished_at": now,
+                "updated_at": now,
+            }
+        }
+    )
+    if result.modified_count:
+        logger.warning(f"Failed {result.modified_count} abandoned job(s)")
+    return result.modified_count
+
+
+async def update_job(job: Job, **fields: Any) -> bool:
+    """
+    Write fields back to a job this worker still owns
+
+    Args:
+        job: Claimed job
+        **fields: Fields to set (stage, progress, status, ...)
+
+    Returns:
+        False if the lease was lost to another worker
+    """
+    fields["updated_at"] = datetime.utcnow()
+    result = await Job.get_motor_collection().update_one(
+        {"_id": job.id, "worker_id": job.worker_id},
+        {"$set": {key: getattr(value, "value", value) for key, value in fields.items()}}
+    )
+    for key, value in fields.items():
+        setattr(job, key, value)
+    return result.matched_count == 1
+
+
+async def checkpoint(job: Job, **fields: Any) -> None:
+    """update_job that aborts the job if the lease was lost"""
+    if not await update_job(job, **fields):
+        raise LeaseLostError(f"Job {job.id} was taken over by another worker")
+
+
+async def renew_lease(job: Job) -> None:
+    """Keep extending the job's lease while it is being processed; returns once it is lost"""
+    interval = max(settings.JOB_LEASE_SECONDS / 3, 1)
+    while True:
+        await asyncio.sleep(interval)
+        lease = datetime.utcnow() + timedelta(seconds=settings.JOB_LEASE_SECONDS)
+        if not await update_job(job, lease_expires_at=lease):
+            return
+
+
+async def enqueue_expansion_job(plan: Plan) -> Job:
+    """
+    Queue background expansion of every milestone of a lazily generated plan
+
+    Args:
+        plan: Plan whose milestones should be expanded
+
+    Returns:
+        The queued Job document
+    """
+    job = Job(
+        job_type="expand_milestones",
+        payload={"plan_id": str(plan.id)},
+        goal_id=plan.goal_id,
+        plan_id=str(plan.id),
+        max_attempts=settings.JOB_MAX_ATTEMPTS
+    )
+    await job.insert()
+    return job
+
+
+async def process_job(job: Job) -> None:
+    """
+    Run a claimed job, reporting progress on the job document
+
+    Failures put the job back in the queue until max_attempts is reached.
+    If the lease is lost (another worker reclaimed the job) the work is
+    cancelled and the job document is left to its new owner.
+
+    Args:
+        job: Job returned by claim_next_job
+    """
+    llm_priority.set(Priority.BACKGROUND)  # Each job runs in its own task context
+    runner = _run_expansion_job if job.job_type == "expand_milestones" else _run_plan_job
+    work = asyncio.ensure_future(runner(job))
+    heartbeat = asyncio.ensure_future(renew_lease(job))
+    try:
+        await asyncio.wait({work, heartbeat}, return_when=asyncio.FIRST_COMPLETED)
+        if not work.done():
+            work.cancel()
+            with suppress(asyncio.CancelledError, Exception):
+                await work
+            raise LeaseLostError(f"Job {job.id} was taken over by another worker")
+        plan_id = work.result()
+
+        await checkpoint(
+            job,
+            status=JobStatus.COMPLETED,
+            stage="completed",
+            progress=100,
+            plan_id=plan_id,
+            error=None,
+            lease_expires_at=None,
+            finished_at=datetime.utcnow()
+        )
+    except LeaseLostError as e:
+        logger.warning(f"{e}; abandoning attempt {job.attempts}")
+    except Exception as e:
+        logger.error(f"Job {job.id} failed (attempt {job.attempts}/{job.max_attempts}): {e}")
+        retry = job.attempts < job.max_attempts
+        await update_job(
+            job,
+            status=JobStatus.QUEUED if retry else JobStatus.FAILED,
+            stage="queued" if retry else "failed",
+            error=str(e),
+            lease_expires_at=None,
+            finished_at=None if retry else datetime.utcnow()
+        )
+    finally:
+        heartbeat.cancel()
+
+
+async def _run_plan_job(job: Job) -> str:
+    """Generate, schedule and store a plan; returns the plan id"""
+    goal = await Goal.get(PydanticObjectId(job.goal_id))
+    if goal is None:
+        raise ValueError(f"Goal {job.goal_id} not found")
+
+    payload = job.payload
+    constraints = Constraints(**payload["constraints"]) if payload.get("constraints") else None
+    plan_type = payload.get("plan_type", "moderate")
+
+    await checkpoint(job, stage="generating", progress=10)
+    bypass_cache = payload.get("bypass_cache", False)
+    planner = PlannerMode(payload.get("planner", "llm"))
+    llm_response = None
+    if not bypass_cache and not payload.get("lazy") and not payload.get("phased") and planner == PlannerMode.LLM:
+        llm_response = await find_reusable_plan(payload["goal_text"], plan_type, constraints)
+    if llm_response is None:
+        llm_response = plan_without_llm(payload["goal_text"], constraints, plan_type, planner)
+    if llm_response is None and payload.get("phased") and not payload.get("lazy"):
+        llm_response = await generate_phased_plan(
+            goal_text=payload["goal_text"],
+            constraints=constraints,
+            plan_type=plan_type,
+            use_cache=not bypass_cache
+        )
+    if llm_response is None:
+        llm_response = await llm_service.generate_plan_async(
+            goal_text=payload["goal_text"],
+            constraints=constraints,
+            plan_type=plan_type,
+            use_cache=not bypass_cache,
+            milestones_only=payload.get("lazy", False)
+        )
+
+    await checkpoint(job, stage="scheduling", progress=60)
+    await calendar_registry.resolve(constraints)
+    scheduled_tasks, critical_path = schedule_llm_tasks(llm_response.tasks, constraints)
+
+    # The plan id is reserved on the job before saving, so a retry replaces
+    # the plan of a failed attempt instead of storing a second one
+    plan_id = PydanticObjectId(job.plan_id) if job.plan_id else PydanticObjectId()
+    await checkpoint(job, stage="saving", progress=80, plan_id=str(plan_id))
+    await _discard_plan(str(plan_id))
+    plan, _ = await save_plan(
+        goal, plan_type, llm_response, scheduled_tasks, critical_path, constraints, plan_id
+    )
+    if is_indexable(llm_response):
+        await similarity_index.add(goal, plan)
+    if payload.get("expand_in_background") and llm_response.metadata.get("milestones"):
+        if not await Job.find_one(Job.job_type == "expand_milestones", Job.plan_id == str(plan.id)):
+            await enqueue_expansion_job(plan)
+    return str(plan.id)
+
+
+async def _discard_plan(plan_id: str) -> None:
+    """Remove whatever an earlier attempt stored under a reserved plan id"""
+    plan = await Plan.get(PydanticObjectId(plan_id))
+    if plan is None:
+        return
+    logger.info(f"Replacing plan {plan_id} from an earlier attempt")
+    await Task.find(Task.plan_id == plan_id).delete()
+    await similarity_index.remove_plan(plan_id)
+    await plan.delete()
+
+
+async def _run_expansion_job(job: Job) -> str:
+    """Expand the remaining milestones of a plan; returns the plan id"""
+    plan = await Plan.get(PydanticObjectId(job.payload["plan_id"]))
+    if plan is None:
+        raise ValueError(f"Plan {job.payload['plan_id']} not found")
+
+    async def report(expanded: int, total: int) -> None:
+        await checkpoint(job, stage="expanding", progress=int(100 * expanded / max(total, 1)))
+
+    await checkpoint(job, stage="expanding", progress=0)
+    await expand_all_milestones(plan, on_progress=report)
+    return str(plan.id)
@@ -0,0 +1,93 @@
+"""
+Salvage parser for truncated or slightly malformed LLM plan JSON
+"""
+import json
+import re
+from typing import Any, List, Optional, Tuple
+
+from schemas import LLMTaskResponse
+
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_PLAN_SUMMARY = re.compile(r'"plan_summary"\s*:\s*"((?:[^"\\]|\\.)*)"', re.S)
+_CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+
+
+def _escape_control_chars(text: str) -> str:
+    """Escape raw newlines and tabs that appear inside JSON strings"""
+    result = []
+    in_string = False
+    escape = False
+    for char in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+            elif char in _CONTROL_ESCAPES:
+                char = _CONTROL_ESCAPES[char]
+        elif char == '"':
+            in_string = True
+        result.append(char)
+    return "".join(result)
+
+
+def repair_json_fragment(fragment: str) -> Optional[Any]:
+    """
+    Decode a JSON fragment, applying light repairs if plain decoding fails
+
+    Handles trailing commas and raw control characters inside strings,
+    the two mistakes models make most often.
+
+    Args:
+        fragment: A complete JSON value (typically one task object)
+
+    Returns:
+        The decoded value, or None if it could not be repaired
+    """
+    try:
+        return json.loads(fragment)
+    except json.JSONDecodeError:
+        pass
+
+    repaired = _TRAILING_COMMA.sub(r"\1", _escape_control_chars(fragment))
+    try:
+        return json.loads(repaired)
+    except json.JSONDecodeError:
+        return None
+
+
+def salvage_plan(text: str) -> Tuple[List[LLMTaskResponse], Optional[str], bool]:
+    """
+    Recover every complete, valid task object from a broken plan response
+
+    Args:
+        text: Raw LLM response text
+
+    Returns:
+        Tuple of (validated tasks in order, plan_summary if present,
+        whether the response was truncated)
+    """
+    # Imported here because json_stream uses repair_json_fragment
+    from services.json_stream import TaskStreamParser
+
+    parser = TaskStreamParser()
+    tasks = []
+    seen_ids = set()
+    for task_data in parser.feed(text):
+        try:
+            task = LLMTaskResponse(**task_data)
+        except Exception:
+            continue
+        if task.id in seen_ids:
+            continue
+        seen_ids.add(task.id)
+        tasks.append(task)
+
+    plan_summary = None
+    match = _PLAN_SUMMARY.search(text)
+    if match:
+        plan_summary = repair_json_fragment(f'"{match.group(1)}"')
+
+    return tasks, plan_summary, parser.truncated
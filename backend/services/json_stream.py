@@ -0,0 +1,102 @@
+"""
+Incremental JSON parser that extracts task objects from a streamed LLM response
+"""
+from typing import Any, Dict, List
+
+from services.json_repair import repair_json_fragment
+
+
+class TaskStreamParser:
+    """
+    Scan streamed plan JSON and emit each object of the top-level "tasks"
+    array (or another top-level array named by array_key) as soon as its
+    closing brace arrives
+
+    The scanner only tracks string/escape state and container nesting, so
+    each chunk is processed in time linear to its length. Completed task
+    objects are sliced from the buffer and decoded (with light repairs
+    for trailing commas and unescaped control characters).
+    """
+
+    def __init__(self, array_key: str = "tasks"):
+        """Initialize an empty scanner"""
+        self.array_key = array_key
+        self.buffer = ""
+        self._pos = 0
+        self._stack: List[str] = []  # Open containers: '{' or '['
+        self._in_string = False
+        self._escape = False
+        self._string_start = -1
+        self._last_string = None  # Last string completed at top-level depth
+        self._current_key = None  # Top-level key whose value is being read
+        self._in_tasks = False
+        self._task_start = -1
+        self.emitted = 0
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """
+        Consume a chunk of text
+
+        Args:
+            chunk: Next piece of the streamed response
+
+        Returns:
+            Task dictionaries completed by this chunk, in order
+        """
+        self.buffer += chunk
+        completed = []
+        text = self.buffer
+
+        for i in range(self._pos, len(text)):
+            char = text[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1:
+                        self._last_string = text[self._string_start + 1:i]
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char == ":" and len(self._stack) == 1:
+                self._current_key = self._last_string
+            elif char == "," and len(self._stack) == 1:
+                self._current_key = None
+            elif char in "{[":
+                self._stack.append(char)
+                if char == "[" and len(self._stack) == 2 and self._current_key == self.array_key:
+                    self._in_tasks = True
+                elif char == "{" and self._in_tasks and len(self._stack) == 3:
+                    self._task_start = i
+            elif char in "}]":
+                if not self._stack:
+                    continue  # Stray closer outside any container
+                self._stack.pop()
+                if char == "}" and self._in_tasks and len(self._stack) == 2 and self._task_start >= 0:
+                    task = self._decode(text[self._task_start:i + 1])
+                    if task is not None:
+                        completed.append(task)
+                        self.emitted += 1
+                    self._task_start = -1
+                elif char == "]" and self._in_tasks and len(self._stack) == 1:
+                    self._in_tasks = False
+
+        self._pos = len(text)
+        return completed
+
+    @property
+    def truncated(self) -> bool:
+        """Whether the text seen so far ends inside an unclosed string or container"""
+        return self._in_string or bool(self._stack)
+
+    @staticmethod
+    def _decode(fragment: str) -> Any:
+        """Decode one task object, ignoring fragments that cannot be repaired"""
+        value = repair_json_fragment(fragment)
+        return value if isinstance(value, dict) else None
@@ -1,21 +1,301 @@
 """
 LLM service for task generation using Google Gemini API
 """
+import asyncio
+import hashlib
 import json
-from typing import Optional
+import math
+import os
+import random
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 import google.generativeai as genai
 from config import settings
 from schemas import LLMPlanResponse, LLMTaskResponse, Constraints
+from services.plan_cache import plan_cache, make_cache_key
+from services.json_stream import TaskStreamParser
+from services.circuit_breaker import CircuitBreaker, CircuitOpenError, LatencyTracker
+from services.json_repair import salvage_plan
+from services.quota import QuotaCoordinator
+from services.heuristic_planner import heuristic_planner
 
 
-class LLMService:
-    """Service for interacting with Google Gemini to generate task plans"""
+# ============================================================================
+# LLM Providers
+# ============================================================================
+
+class CassetteNotFoundError(Exception):
+    """Raised in replay mode when no recording exists for a prompt"""
+
+
+class LLMProvider(ABC):
+    """Backend that turns a prompt into raw response text"""
+    
+    name = "base"
+    rate_limited = True  # Calls count against the provider quota
+    
+    @abstractmethod
+    def generate(self, prompt: str, generation_config: Dict[str, Any]) -> str:
+        """Return the complete response text (blocking)"""
+    
+    @abstractmethod
+    async def generate_async(self, prompt: str, generation_config: Dict[str, Any]) -> str:
+        """Return the complete response text"""
+    
+    async def stream(
+        self,
+        prompt: str,
+        generation_config: Dict[str, Any],
+        usage: Optional[Dict[str, int]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Yield the response text in chunks (a single chunk by default)
+
+        Providers that report token counts write prompt_tokens and
+        output_tokens into usage; the service estimates them otherwise.
+        """
+        yield await self.generate_async(prompt, generation_config)
+
+
+def _record_usage(usage: Optional[Dict[str, int]], usage_metadata: Any) -> None:
+    """Copy Gemini token counts into a usage dict (thinking tokens count as output)"""
+    if usage is None or usage_metadata is None:
+        return
+    prompt_tokens = getattr(usage_metadata, "prompt_token_count", 0) or 0
+    if prompt_tokens:
+        usage["prompt_tokens"] = prompt_tokens
+        usage["output_tokens"] = (
+            (getattr(usage_metadata, "candidates_token_count", 0) or 0)
+            + (getattr(usage_metadata, "thoughts_token_count", 0) or 0)
+        )
+
+
+class GeminiProvider(LLMProvider):
+    """Live Google Gemini backend"""
+    
+    name = "gemini"
     
     def __init__(self):
         """Initialize Gemini client"""
         genai.configure(api_key=settings.GEMINI_API_KEY)
         self.client = genai.GenerativeModel(settings.GEMINI_MODEL)
+    
+    def generate(self, prompt: str, generation_config: Dict[str, Any]) -> str:
+        response = self.client.generate_content(
+            prompt,
+            generation_config=genai.GenerationConfig(**generation_config)
+        )
+        return response.text
+    
+    async def generate_async(self, prompt: str, generation_config: Dict[str, Any]) -> str:
+        response = await self.client.generate_content_async(
+            prompt,
+            generation_config=genai.GenerationConfig(**generation_config)
+        )
+        return response.text
+    
+    async def stream(
+        self,
+        prompt: str,
+        generation_config: Dict[str, Any],
+        usage: Optional[Dict[str, int]] = None
+    ) -> AsyncIterator[str]:
+        response = await self.client.generate_content_async(
+            prompt,
+            generation_config=genai.GenerationConfig(**generation_config),
+            stream=True
+        )
+        async for chunk in response:
+            _record_usage(usage, getattr(chunk, "usage_metadata", None))  # Totals arrive with the last chunk
+            try:
+                yield chunk.text
+            except ValueError:
+                continue  # Chunk without content parts (e.g. finish reason only)
+
+
+def cassette_key(prompt: str) -> str:
+    """Identify a recording by model and prompt"""
+    return hashlib.sha256(f"{settings.GEMINI_MODEL}\n{prompt}".encode("utf-8")).hexdigest()
+
+
+class RecordingProvider(LLMProvider):
+    """Pass calls through to another provider and save prompt -> response cassettes"""
+    
+    name = "record"
+    
+    def __init__(self, inner: LLMProvider, cassette_dir: str):
+        self.inner = inner
+        self.cassette_dir = cassette_dir
+        os.makedirs(cassette_dir, exist_ok=True)
+    
+    def generate(self, prompt: str, generation_config: Dict[str, Any]) -> str:
+        started = time.perf_counter()
+        text = self.inner.generate(prompt, generation_config)
+        self._save(prompt, text, time.perf_counter() - started)
+        return text
+    
+    async def generate_async(self, prompt: str, generation_config: Dict[str, Any]) -> str:
+        started = time.perf_counter()
+        text = await self.inner.generate_async(prompt, generation_config)
+        self._save(prompt, text, time.perf_counter() - started)
+        return text
+    
+    async def stream(
+        self,
+        prompt: str,
+        generation_config: Dict[str, Any],
+        usage: Optional[Dict[str, int]] = None
+    ) -> AsyncIterator[str]:
+        started = time.perf_counter()
+        chunks = []
+        async for chunk in self.inner.stream(prompt, generation_config, usage):
+            chunks.append(chunk)
+            yield chunk
+        self._save(prompt, "".join(chunks), time.perf_counter() - started)
+    
+    def _save(self, prompt: str, text: str, elapsed: float) -> None:
+        """Write one cassette file (last recording for a prompt wins)"""
+        cassette = {
+            "model": settings.GEMINI_MODEL,
+            "prompt": prompt,
+            "response": text,
+            "latency_ms": round(elapsed * 1000, 1),
+            "recorded_at": datetime.utcnow().isoformat()
+        }
+        path = os.path.join(self.cassette_dir, f"{cassette_key(prompt)}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(cassette, f, ensure_ascii=False, indent=2)
+
+
+class ReplayProvider(LLMProvider):
+    """Serve recorded cassettes with synthetic latency and no network access"""
+    
+    name = "replay"
+    rate_limited = False
+    
+    def __init__(self, cassette_dir: str, latency_ms: float, jitter_ms: float):
+        self.cassette_dir = cassette_dir
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self._cassettes: Dict[str, str] = {}  # key -> response text, loaded lazily
+    
+    def generate(self, prompt: str, generation_config: Dict[str, Any]) -> str:
+        text = self._load(prompt)
+        time.sleep(self._latency())
+        return text
+    
+    async def generate_async(self, prompt: str, generation_config: Dict[str, Any]) -> str:
+        text = self._load(prompt)
+        await asyncio.sleep(self._latency())
+        return text
+    
+    async def stream(
+        self,
+        prompt: str,
+        generation_config: Dict[str, Any],
+        usage: Optional[Dict[str, int]] = None
+    ) -> AsyncIterator[str]:
+        """Replay the response in small chunks spread over the synthetic latency"""
+        text = self._load(prompt)
+        chunk_size = 64
+        chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)] or [""]
+        delay = self._latency() / len(chunks)
+        for chunk in chunks:
+            await asyncio.sleep(delay)
+            yield chunk
+    
+    def _latency(self) -> float:
+        """Synthetic latency in seconds"""
+        jitter = random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(self.latency_ms + jitter, 0.0) / 1000
+    
+    def _load(self, prompt: str) -> str:
+        key = cassette_key(prompt)
+        if key not in self._cassettes:
+            path = os.path.join(self.cassette_dir, f"{key}.json")
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self._cassettes[key] = json.load(f)["response"]
+            except FileNotFoundError:
+                raise CassetteNotFoundError(f"No cassette for prompt {key[:12]} in {self.cassette_dir}")
+        return self._cassettes[key]
+
+
+def create_provider() -> LLMProvider:
+    """Build the provider selected by settings.LLM_MODE (live, record or replay)"""
+    mode = settings.LLM_MODE.lower()
+    if mode == "replay":
+        return ReplayProvider(
+            settings.LLM_CASSETTE_DIR,
+            latency_ms=settings.LLM_REPLAY_LATENCY_MS,
+            jitter_ms=settings.LLM_REPLAY_JITTER_MS
+        )
+    if mode == "record":
+        return RecordingProvider(GeminiProvider(), settings.LLM_CASSETTE_DIR)
+    if mode != "live":
+        raise ValueError(f"Unknown LLM_MODE '{settings.LLM_MODE}' (expected live, record or replay)")
+    return GeminiProvider()
+
+
+# ============================================================================
+# LLM Service
+# ============================================================================
+
+class LLMService:
+    """Service for generating task plans through the configured LLM provider"""
+    
+    def __init__(self, provider: Optional[LLMProvider] = None):
+        """Initialize the configured LLM provider"""
+        self.provider = provider or create_provider()
         self.model = settings.GEMINI_MODEL
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._inflight: Dict[str, asyncio.Task] = {}  # cache key -> shared generation
+        self.stats = {
+            "generations": 0,
+            "coalesced": 0,
+            "batch_calls": 0,
+            "batch_goals": 0,
+            "batch_retries": 0,
+            "timeouts": 0,
+            "deadline_exceeded": 0,
+            "short_circuited": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "hedges_skipped": 0,
+            "repairs": 0,
+            "continuations": 0,
+            "regenerations": 0,
+            "expansions": 0,
+            "prompt_tokens": 0,
+            "output_tokens": 0,
+        }
+        self.breaker = CircuitBreaker(
+            window_size=settings.LLM_BREAKER_WINDOW,
+            min_calls=settings.LLM_BREAKER_MIN_CALLS,
+            failure_rate=settings.LLM_BREAKER_FAILURE_RATE,
+            slow_call_seconds=settings.LLM_BREAKER_SLOW_CALL_SECONDS,
+            reset_timeout_seconds=settings.LLM_BREAKER_RESET_SECONDS
+        )
+        self.latency = LatencyTracker(window_size=200)
+        self.ttfb = LatencyTracker(window_size=200)
+        self.output_tokens_per_task = float(settings.LLM_OUTPUT_TOKENS_PER_TASK)  # Running estimate
+        self.tasks_per_plan = {  # Running task count of complete responses per prompt mode
+            mode: float(self._task_cap(mode)) for mode in ("full", "milestones")
+        }
+        self.quota = QuotaCoordinator(
+            bucket_name=settings.LLM_QUOTA_BUCKET,
+            requests_per_minute=settings.LLM_QUOTA_REQUESTS_PER_MINUTE,
+            burst=settings.LLM_QUOTA_BURST
+        )
+    
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        """Concurrency limiter for async Gemini calls (created on first use)"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+        return self._semaphore
     
     def generate_plan(
         self,
@@ -39,32 +319,834 @@ class LLMService:
         user_prompt = self._build_prompt(goal_text, constraints, plan_type)
         
         try:
-            return self._generate_with_gemini(system_prompt, user_prompt)
+            return self._generate_with_llm(system_prompt, user_prompt)
         except Exception as e:
-            print(f"Error generating plan with Gemini: {e}")
+            print(f"Error generating plan with {self.provider.name}: {e}")
             # Return a fallback plan
-            return self._generate_fallback_plan(goal_text)
+            return self._generate_fallback_plan(goal_text, plan_type)
     
-    def _generate_with_gemini(self, system_prompt: str, user_prompt: str) -> LLMPlanResponse:
-        """Generate plan using Google Gemini API"""
-        # Combine system and user prompts for Gemini
-        full_prompt = f"{system_prompt}\n\n{user_prompt}\n\nIMPORTANT: Respond with valid JSON only, no markdown formatting. Ensure all strings are properly escaped."
+    async def generate_plan_async(
+        self,
+        goal_text: str,
+        constraints: Optional[Constraints] = None,
+        plan_type: str = "moderate",
+        use_cache: bool = True,
+        milestones_only: bool = False
+    ) -> LLMPlanResponse:
+        """
+        Generate a task plan using Google Gemini without blocking the event loop
+        
+        At most LLM_MAX_CONCURRENCY generations run at once; each call is
+        bounded by LLM_TIMEOUT_SECONDS and falls back to the default plan
+        on timeout or error. Successful generations are cached by a hash of
+        the normalized prompt inputs, and concurrent calls with the same
+        inputs share a single in-flight generation.
+        
+        Args:
+            goal_text: The user's goal description
+            constraints: Optional constraints (deadline, work hours, etc.)
+            plan_type: Type of plan (moderate, aggressive, conservative)
+            use_cache: Set to False to skip the cache lookup (the fresh
+                result still refreshes the cache)
+            milestones_only: Ask only for high-level milestones, to be
+                expanded into subtasks later with expand_milestone_async
         
-        # Configure generation parameters
-        generation_config = genai.GenerationConfig(
-            temperature=0.7,
-            max_output_tokens=8192,  # Increased from 4096 to allow longer responses
-            response_mime_type="application/json"  # Force JSON response
+        Returns:
+            LLMPlanResponse with tasks and plan summary
+        """
+        mode = "milestones" if milestones_only else "full"
+        cache_key = make_cache_key(goal_text, constraints, plan_type, mode, self.model)
+        if settings.LLM_CACHE_ENABLED and use_cache:
+            cached = await plan_cache.get(cache_key)
+            if cached is not None:
+                if milestones_only:
+                    cached.metadata["milestones"] = True
+                return cached
+        
+        # Single-flight: identical concurrent requests share one generation
+        generation = self._inflight.get(cache_key)
+        if generation is None:
+            generation = asyncio.ensure_future(
+                self._generate_and_cache(goal_text, constraints, plan_type, cache_key, milestones_only)
+            )
+            self._inflight[cache_key] = generation
+            generation.add_done_callback(
+                lambda done, key=cache_key: self._forget_inflight(key, done)
+            )
+        else:
+            self.stats["coalesced"] += 1
+        
+        # Shield so a disconnecting caller does not cancel the shared call
+        response = await asyncio.shield(generation)
+        return response.model_copy(deep=True)
+    
+    def _forget_inflight(self, cache_key: str, generation: asyncio.Task) -> None:
+        """Drop a finished generation from the single-flight table"""
+        if self._inflight.get(cache_key) is generation:
+            del self._inflight[cache_key]
+    
+    async def _generate_and_cache(
+        self,
+        goal_text: str,
+        constraints: Optional[Constraints],
+        plan_type: str,
+        cache_key: str,
+        milestones_only: bool = False
+    ) -> LLMPlanResponse:
+        """Run one bounded Gemini generation and store successful results"""
+        self.stats["generations"] += 1
+        system_prompt = self._get_system_prompt()
+        user_prompt = self._build_prompt(goal_text, constraints, plan_type)
+        if milestones_only:
+            user_prompt = self._build_milestone_prompt(user_prompt)
+        
+        mode = "milestones" if milestones_only else "full"
+        
+        try:
+            response = await asyncio.wait_for(
+                self._generate_with_llm_async(system_prompt, user_prompt, self._expected_tasks(mode), mode),
+                timeout=settings.LLM_DEADLINE_SECONDS
+            )
+        except asyncio.TimeoutError:
+            self.stats["deadline_exceeded"] += 1
+            print(f"Error generating plan with {self.provider.name}: deadline of {settings.LLM_DEADLINE_SECONDS}s exceeded")
+            return self._generate_fallback_plan(goal_text, plan_type)
+        except CircuitOpenError:
+            return self._generate_fallback_plan(goal_text, plan_type)
+        except Exception as e:
+            print(f"Error generating plan with {self.provider.name}: {e}")
+            return self._generate_fallback_plan(goal_text, plan_type)
+        
+        if milestones_only:
+            response.metadata["milestones"] = True
+        if settings.LLM_CACHE_ENABLED and not response.metadata.get("truncated"):
+            await plan_cache.set(cache_key, response, plan_type)
+        return response
+    
+    async def generate_plans_batch(
+        self,
+        requests: List[Tuple[str, Optional[Constraints], str]],
+        use_cache: bool = True
+    ) -> List[LLMPlanResponse]:
+        """
+        Generate plans for many goals, packing several goals into each LLM call
+        
+        Goals are grouped into prompts of up to LLM_BATCH_SIZE that share one
+        copy of the system prompt and ask for one output section per goal,
+        with fewer goals per prompt when their expected output would not
+        fit in LLM_MAX_OUTPUT_TOKENS. Each section is validated separately;
+        goals whose section is missing, cut off or invalid are retried
+        individually through generate_plan_async.
+        
+        Args:
+            requests: (goal_text, constraints, plan_type) tuples
+            use_cache: Set to False to skip cache lookups
+        
+        Returns:
+            One LLMPlanResponse per request, in the same order
+        """
+        results: List[Optional[LLMPlanResponse]] = [None] * len(requests)
+        cache_keys = [make_cache_key(*request, model=self.model) for request in requests]
+        
+        pending = []
+        for index, cache_key in enumerate(cache_keys):
+            if settings.LLM_CACHE_ENABLED and use_cache:
+                results[index] = await plan_cache.get(cache_key)
+            if results[index] is None:
+                pending.append(index)
+        
+        batch_size = self._batch_goals_per_call()
+        chunks = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+        chunk_results = await asyncio.gather(*[
+            self._generate_batch_chunk([requests[index] for index in chunk])
+            for chunk in chunks
+        ])
+        
+        retries = []
+        for chunk, responses in zip(chunks, chunk_results):
+            for index, response in zip(chunk, responses):
+                if response is None:
+                    retries.append(index)
+                    continue
+                results[index] = response
+                if settings.LLM_CACHE_ENABLED:
+                    await plan_cache.set(cache_keys[index], response, requests[index][2])
+        
+        # Retry only the goals whose section failed validation
+        self.stats["batch_retries"] += len(retries)
+        retried = await asyncio.gather(*[
+            self.generate_plan_async(*requests[index], use_cache=False)
+            for index in retries
+        ])
+        for index, response in zip(retries, retried):
+            results[index] = response
+        
+        return results
+    
+    async def _generate_batch_chunk(
+        self,
+        requests: List[Tuple[str, Optional[Constraints], str]]
+    ) -> List[Optional[LLMPlanResponse]]:
+        """
+        Run one multi-goal LLM call
+        
+        Returns:
+            A validated response per goal, or None where the goal's section
+            was missing or invalid (or the whole call failed)
+        """
+        self.stats["batch_calls"] += 1
+        self.stats["batch_goals"] += len(requests)
+        
+        sections = [
+            f"### Goal {index}\n{self._build_prompt(goal_text, constraints, plan_type)}"
+            for index, (goal_text, constraints, plan_type) in enumerate(requests)
+        ]
+        batch_prompt = (
+            f"Plan the following {len(requests)} independent goals.\n"
+            'Respond with JSON of the form {"plans": [{"goal_index": 0, "tasks": [...], "plan_summary": "..."}]} '
+            "containing exactly one entry per goal. Each entry follows the task format above, "
+            "and task IDs restart at T1 for every goal.\n\n" + "\n\n".join(sections)
         )
         
-        # Generate response
-        response = self.client.generate_content(
-            full_prompt,
-            generation_config=generation_config
+        usage = self._new_usage(self._expected_tasks() * len(requests))
+        try:
+            text = await asyncio.wait_for(
+                self._call_llm(
+                    self._build_full_prompt(self._get_system_prompt(), batch_prompt),
+                    self._get_generation_config(usage["max_output_tokens"]),
+                    usage
+                ),
+                timeout=settings.LLM_DEADLINE_SECONDS
+            )
+            usage = self._finish_usage(usage)
+            sections_data = self._load_batch_sections(text)
+        except Exception as e:
+            reason = "timed out" if isinstance(e, asyncio.TimeoutError) else str(e)
+            print(f"Error generating plan batch with {self.provider.name}: {reason}")
+            return [None] * len(requests)
+        
+        responses: List[Optional[LLMPlanResponse]] = [None] * len(requests)
+        for position, section in enumerate(sections_data):
+            if not isinstance(section, dict):
+                continue
+            index = section.get("goal_index", position)
+            if not isinstance(index, int) or not 0 <= index < len(requests) or responses[index] is not None:
+                continue
+            try:
+                response = self._plan_from_data(section)
+            except Exception as e:
+                print(f"Invalid plan for batch goal {index}: {e}")
+                continue
+            response.metadata["batched"] = True
+            response.metadata["usage"] = {**usage, "batch_goals": len(requests)}
+            responses[index] = response
+        return responses
+    
+    def _batch_goals_per_call(self) -> int:
+        """Goals per batch prompt: LLM_BATCH_SIZE, reduced so every plan fits in LLM_MAX_OUTPUT_TOKENS"""
+        goal_budget = self._output_budget(self._expected_tasks())
+        fitting = settings.LLM_MAX_OUTPUT_TOKENS // max(goal_budget, 1)
+        return max(min(settings.LLM_BATCH_SIZE, fitting), 1)
+    
+    def _load_batch_sections(self, text: str) -> List[Any]:
+        """
+        Decode the "plans" array of a batch response
+        
+        A truncated or malformed response keeps every complete section;
+        the goals that lost theirs are retried individually.
+        """
+        try:
+            return self._load_json(text).get("plans", [])
+        except Exception:
+            parser = TaskStreamParser(array_key="plans")
+            sections = parser.feed(text)
+            if not sections:
+                raise
+            self.stats["repairs"] += 1
+            return sections
+    
+    async def stream_plan(
+        self,
+        goal_text: str,
+        constraints: Optional[Constraints] = None,
+        plan_type: str = "moderate",
+        use_cache: bool = True
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Generate a plan with Gemini's streaming mode, yielding tasks as they arrive
+        
+        Yields ("task", LLMTaskResponse) for every task object as soon as it
+        closes in the streamed "tasks" array, then a single ("plan",
+        LLMPlanResponse) with the complete plan. Cache hits and the fallback
+        plan are replayed through the same events.
+        
+        Args:
+            goal_text: The user's goal description
+            constraints: Optional constraints (deadline, work hours, etc.)
+            plan_type: Type of plan (moderate, aggressive, conservative)
+            use_cache: Set to False to skip the cache lookup
+        
+        Yields:
+            (event, payload) tuples
+        """
+        cache_key = make_cache_key(goal_text, constraints, plan_type, model=self.model)
+        if settings.LLM_CACHE_ENABLED and use_cache:
+            cached = await plan_cache.get(cache_key)
+            if cached is not None:
+                for task in cached.tasks:
+                    yield "task", task
+                yield "plan", cached
+                return
+        
+        self.stats["generations"] += 1
+        full_prompt = self._build_full_prompt(
+            self._get_system_prompt(),
+            self._build_prompt(goal_text, constraints, plan_type)
+        )
+        parser = TaskStreamParser()
+        streamed_tasks = []
+        response = None
+        usage = self._new_usage(self._expected_tasks(), "full")
+        call_usage: Dict[str, Any] = {}
+        
+        try:
+            if not self.breaker.allow_request():
+                self.stats["short_circuited"] += 1
+                raise CircuitOpenError("LLM circuit is open")
+            try:
+                await self._acquire_quota()
+                async with self.semaphore:
+                    loop = asyncio.get_running_loop()
+                    started = loop.time()
+                    deadline = started + settings.LLM_TIMEOUT_SECONDS
+                    chunks = self.provider.stream(
+                        full_prompt,
+                        self._get_generation_config(usage["max_output_tokens"]),
+                        call_usage
+                    ).__aiter__()
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(
+                                chunks.__anext__(),
+                                timeout=max(deadline - loop.time(), 0)
+                            )
+                        except StopAsyncIteration:
+                            break
+                        call_usage.setdefault("ttfb_seconds", loop.time() - started)
+                        for task_data in parser.feed(chunk):
+                            try:
+                                task = LLMTaskResponse(**task_data)
+                            except Exception as e:
+                                print(f"Skipping invalid streamed task: {e}")
+                                continue
+                            streamed_tasks.append(task)
+                            yield "task", task
+            except Exception as e:
+                self.breaker.record_failure()
+                await self._check_throttled(e)
+                raise
+            except BaseException:
+                self.breaker.release_probe()  # Client went away mid-stream
+                raise
+            self.breaker.record_success(loop.time() - started)
+            self._add_call_usage(usage, full_prompt, parser.buffer, call_usage, loop.time() - started)
+            
+            try:
+                response = self._parse_plan_response(parser.buffer)
+            except Exception as e:
+                response = await self._repair_plan_response(full_prompt, parser.buffer, e, usage)
+                streamed_ids = {task.id for task in streamed_tasks}
+                for task in response.tasks:
+                    if task.id not in streamed_ids:
+                        yield "task", task
+        except Exception as e:
+            reason = "timed out" if isinstance(e, asyncio.TimeoutError) else str(e)
+            print(f"Error streaming plan from {self.provider.name}: {reason}")
+        
+        if response is None:
+            if streamed_tasks:
+                # Keep what already reached the client rather than replacing it
+                response = LLMPlanResponse(
+                    tasks=streamed_tasks,
+                    plan_summary=f"Partial plan for: {goal_text}",
+                    metadata={
+                        "source": self.provider.name,
+                        "model": self.model,
+                        "partial": True,
+                        "usage": self._finish_usage(usage)
+                    }
+                )
+            else:
+                response = self._generate_fallback_plan(goal_text, plan_type)
+                for task in response.tasks:
+                    yield "task", task
+        else:
+            response.metadata["usage"] = self._finish_usage(usage, response)
+            if settings.LLM_CACHE_ENABLED and not response.metadata.get("truncated"):
+                await plan_cache.set(cache_key, response, plan_type)
+        
+        yield "plan", response
+    
+    async def regenerate_subgraph_async(
+        self,
+        goal_text: str,
+        plan_type: str,
+        region_tasks: List[Dict[str, Any]],
+        upstream_tasks: List[Dict[str, Any]],
+        instructions: Optional[str] = None
+    ) -> LLMPlanResponse:
+        """
+        Regenerate one region of an existing plan
+        
+        The prompt only carries the tasks being replaced and the frozen
+        tasks they depend on, so its size follows the edited region rather
+        than the whole plan. Errors are raised to the caller instead of
+        returning the fallback plan, which would overwrite good tasks.
+        
+        Args:
+            goal_text: The goal the plan belongs to
+            plan_type: Type of plan (moderate, aggressive, conservative)
+            region_tasks: Tasks to replace (id, title, description,
+                duration_days, depends_on)
+            upstream_tasks: Frozen prerequisite tasks (id, title, latest_finish)
+            instructions: Optional user guidance for the new version
+        
+        Returns:
+            LLMPlanResponse with the replacement tasks
+        """
+        self.stats["regenerations"] += 1
+        user_prompt = self._build_regeneration_prompt(
+            goal_text, plan_type, region_tasks, upstream_tasks, instructions
+        )
+        try:
+            return await asyncio.wait_for(
+                self._generate_with_llm_async(
+                    self._get_system_prompt(),
+                    user_prompt,
+                    max(2 * len(region_tasks), 5)
+                ),
+                timeout=settings.LLM_DEADLINE_SECONDS
+            )
+        except asyncio.TimeoutError:
+            self.stats["deadline_exceeded"] += 1
+            raise TimeoutError(f"deadline of {settings.LLM_DEADLINE_SECONDS}s exceeded")
+    
+    async def expand_milestone_async(
+        self,
+        goal_text: str,
+        plan_type: str,
+        milestone: Dict[str, Any],
+        other_milestones: List[Dict[str, Any]],
+        max_subtasks: Optional[int] = None
+    ) -> LLMPlanResponse:
+        """
+        Break one milestone of a lazily generated plan into subtasks
+        
+        Subtask ids are S1, S2, ... and depends_on only references other
+        subtasks of the same milestone; the caller wires them into the plan.
+        Errors are raised to the caller, which keeps the milestone expandable.
+        
+        Args:
+            goal_text: The goal the plan belongs to
+            plan_type: Type of plan (moderate, aggressive, conservative)
+            milestone: Milestone to expand (id, title, description, duration_days)
+            other_milestones: The plan's other milestones (id, title), for context
+            max_subtasks: Upper bound on subtasks (defaults to half of
+                MAX_TASKS_PER_PLAN)
+        
+        Returns:
+            LLMPlanResponse with the milestone's subtasks
+        """
+        self.stats["expansions"] += 1
+        max_subtasks = max_subtasks or max(settings.MAX_TASKS_PER_PLAN // 2, 2)
+        user_prompt = self._build_expansion_prompt(
+            goal_text, plan_type, milestone, other_milestones, max_subtasks
+        )
+        try:
+            return await asyncio.wait_for(
+                self._generate_with_llm_async(self._get_system_prompt(), user_prompt, max_subtasks),
+                timeout=settings.LLM_DEADLINE_SECONDS
+            )
+        except asyncio.TimeoutError:
+            self.stats["deadline_exceeded"] += 1
+            raise TimeoutError(f"deadline of {settings.LLM_DEADLINE_SECONDS}s exceeded")
+    
+    def get_stats(self) -> dict:
+        """Return LLM service counters for the metrics endpoint"""
+        return {
+            **self.stats,
+            "in_flight": len(self._inflight),
+            "cache": plan_cache.get_stats(),
+            "circuit_breaker": self.breaker.get_stats(),
+            "latency_seconds": self.latency.get_stats(),
+            "ttfb_seconds": self.ttfb.get_stats(),
+            "output_tokens_per_task": round(self.output_tokens_per_task, 1),
+            "tasks_per_plan": {mode: round(count, 1) for mode, count in self.tasks_per_plan.items()},
+            "quota": self.quota.get_stats()
+        }
+    
+    def _generate_with_llm(self, system_prompt: str, user_prompt: str) -> LLMPlanResponse:
+        """Generate plan using the configured provider"""
+        text = self.provider.generate(
+            self._build_full_prompt(system_prompt, user_prompt),
+            self._get_generation_config()
         )
+        return self._parse_plan_response(text)
+    
+    async def _generate_with_llm_async(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        expected_tasks: Optional[int] = None,
+        plan_mode: Optional[str] = None
+    ) -> LLMPlanResponse:
+        """
+        Generate plan using the configured provider without blocking
+        
+        The output token budget is sized for expected_tasks, and token
+        counts and latencies are recorded in metadata["usage"]. A
+        plan_mode ("full" or "milestones") lets the response refine that
+        mode's typical task count.
+        """
+        prompt = self._build_full_prompt(system_prompt, user_prompt)
+        usage = self._new_usage(expected_tasks, plan_mode)
+        text = await self._call_llm(prompt, self._get_generation_config(usage["max_output_tokens"]), usage)
+        try:
+            response = self._parse_plan_response(text)
+        except Exception as e:
+            response = await self._repair_plan_response(prompt, text, e, usage)
+        response.metadata["usage"] = self._finish_usage(usage, response)
+        return response
+    
+    def _new_usage(self, expected_tasks: Optional[int] = None, plan_mode: Optional[str] = None) -> Dict[str, Any]:
+        """Start the usage record of one generation (one or more provider calls)"""
+        return {
+            "calls": 0,
+            "prompt_tokens": 0,
+            "output_tokens": 0,
+            "tokens_estimated": False,
+            "ttfb_ms": None,
+            "llm_ms": 0.0,
+            "max_output_tokens": self._output_budget(expected_tasks),
+            "started": time.perf_counter(),
+            "plan_mode": plan_mode,
+        }
+    
+    def _add_call_usage(
+        self,
+        usage: Optional[Dict[str, Any]],
+        prompt: str,
+        text: str,
+        call_usage: Dict[str, Any],
+        latency: Optional[float] = None
+    ) -> None:
+        """Fold one provider call into the generation's usage record and the service totals"""
+        if "prompt_tokens" not in call_usage:
+            # Provider did not report token counts: about 4 characters per token
+            call_usage["prompt_tokens"] = len(prompt) // 4
+            call_usage["output_tokens"] = len(text) // 4
+            call_usage["estimated"] = True
+        self.stats["prompt_tokens"] += call_usage["prompt_tokens"]
+        self.stats["output_tokens"] += call_usage["output_tokens"]
+        if "ttfb_seconds" in call_usage:
+            self.ttfb.record(call_usage["ttfb_seconds"])
+        if usage is None:
+            return
+        usage["calls"] += 1
+        usage["prompt_tokens"] += call_usage["prompt_tokens"]
+        usage["output_tokens"] += call_usage["output_tokens"]
+        usage["tokens_estimated"] = usage["tokens_estimated"] or call_usage.get("estimated", False)
+        if usage["ttfb_ms"] is None and "ttfb_seconds" in call_usage:
+            usage["ttfb_ms"] = round(call_usage["ttfb_seconds"] * 1000, 1)
+        if latency is not None:
+            usage["llm_ms"] += latency * 1000
+    
+    def _finish_usage(
+        self,
+        usage: Dict[str, Any],
+        response: Optional[LLMPlanResponse] = None
+    ) -> Dict[str, Any]:
+        """
+        Close a usage record for plan metadata
+        
+        Complete single-call responses also update the running
+        output-tokens-per-task estimate behind the adaptive budget and,
+        for full plans and outlines, the typical task count of their mode.
+        """
+        finished = {key: value for key, value in usage.items() if key not in ("started", "plan_mode")}
+        finished["total_ms"] = round((time.perf_counter() - usage["started"]) * 1000, 1)
+        finished["llm_ms"] = round(usage["llm_ms"], 1)
+        if (
+            response is not None
+            and response.tasks
+            and usage["calls"] == 1
+            and not response.metadata.get("repaired")
+        ):
+            per_task = usage["output_tokens"] / len(response.tasks)
+            self.output_tokens_per_task += 0.2 * (per_task - self.output_tokens_per_task)
+            mode = usage["plan_mode"]
+            if mode in self.tasks_per_plan and not response.metadata.get("truncated"):
+                self.tasks_per_plan[mode] += 0.2 * (len(response.tasks) - self.tasks_per_plan[mode])
+        return finished
+    
+    def _expected_tasks(self, plan_mode: str = "full") -> int:
+        """
+        Expected task count of a full plan or milestone outline
+        
+        The running task count of recent complete responses of that mode,
+        rounded up and capped at the count the prompt allows. It starts at
+        the cap, so the budget only shrinks once real plans are observed.
+        """
+        return max(min(math.ceil(self.tasks_per_plan[plan_mode]), self._task_cap(plan_mode)), 1)
+    
+    @staticmethod
+    def _task_cap(plan_mode: str = "full") -> int:
+        """Most tasks a full plan (or milestones an outline) may contain"""
+        if plan_mode == "milestones":
+            return max(settings.MAX_TASKS_PER_PLAN // 2, 3)
+        return settings.MAX_TASKS_PER_PLAN
+    
+    def _output_budget(self, expected_tasks: Optional[int] = None) -> int:
+        """
+        max_output_tokens for a response of about expected_tasks tasks
+        
+        Sized from the running output-tokens-per-task estimate with
+        LLM_OUTPUT_TOKEN_HEADROOM to spare, between LLM_MIN_OUTPUT_TOKENS
+        and LLM_MAX_OUTPUT_TOKENS. Truncated responses are still recovered
+        by the repair/continuation path.
+        """
+        if not settings.LLM_ADAPTIVE_OUTPUT_TOKENS or not expected_tasks:
+            return settings.LLM_MAX_OUTPUT_TOKENS
+        budget = int(expected_tasks * self.output_tokens_per_task * settings.LLM_OUTPUT_TOKEN_HEADROOM) + 256  # Plan summary
+        return min(max(budget, settings.LLM_MIN_OUTPUT_TOKENS), settings.LLM_MAX_OUTPUT_TOKENS)
+    
+    async def _repair_plan_response(
+        self,
+        prompt: str,
+        text: str,
+        error: Exception,
+        usage: Optional[Dict[str, Any]] = None
+    ) -> LLMPlanResponse:
+        """
+        Recover a plan from a truncated or malformed response
+        
+        Every complete task object that validates as LLMTaskResponse is
+        kept. If the response was cut off, the model is asked to continue
+        after the last good task (up to LLM_REPAIR_MAX_CONTINUATIONS times)
+        instead of regenerating the whole plan.
+        
+        Args:
+            prompt: The prompt that produced the response
+            text: Raw response text that failed to parse
+            error: The original parse/validation error, re-raised when
+                nothing can be salvaged
+            usage: Usage record of the generation; continuation calls are
+                added to it
+        
+        Returns:
+            LLMPlanResponse built from the salvaged tasks
+        """
+        tasks, plan_summary, truncated = salvage_plan(text)
+        if not tasks:
+            raise error
+        self.stats["repairs"] += 1
+        salvaged = len(tasks)
         
+        continuations = 0
+        while truncated and continuations < settings.LLM_REPAIR_MAX_CONTINUATIONS:
+            continuations += 1
+            self.stats["continuations"] += 1
+            try:
+                more_text = await self._call_llm(
+                    self._build_continuation_prompt(prompt, tasks),
+                    self._get_generation_config(),
+                    usage
+                )
+            except Exception as e:
+                print(f"Error continuing truncated plan with {self.provider.name}: {e}")
+                break
+            more_tasks, more_summary, truncated = salvage_plan(more_text)
+            known_ids = {task.id for task in tasks}
+            new_tasks = [task for task in more_tasks if task.id not in known_ids]
+            tasks.extend(new_tasks)
+            plan_summary = more_summary or plan_summary
+            if not new_tasks:
+                break
+        
+        # Drop dependencies on tasks that never arrived
+        task_ids = {task.id for task in tasks}
+        for task in tasks:
+            task.depends_on = [dep_id for dep_id in task.depends_on if dep_id in task_ids]
+        
+        return LLMPlanResponse(
+            tasks=tasks,
+            plan_summary=plan_summary or f"Plan recovered from a partial response ({len(tasks)} tasks).",
+            metadata={
+                "source": self.provider.name,
+                "model": self.model,
+                "repaired": True,
+                "salvaged_tasks": salvaged,
+                "continuations": continuations,
+                "truncated": truncated
+            }
+        )
+    
+    def _build_continuation_prompt(self, prompt: str, tasks: List[LLMTaskResponse]) -> str:
+        """Ask the model to continue a truncated plan after the last good task"""
+        received = "\n".join(
+            f"- {task.id}: {task.title} (depends on: {', '.join(task.depends_on) or 'none'})"
+            for task in tasks
+        )
+        return (
+            f"{prompt}\n\nYour previous response was cut off after task {tasks[-1].id}. "
+            f"These tasks were already received:\n{received}\n\n"
+            "Continue the plan from where it stopped. Respond with JSON in the same format containing "
+            f"ONLY the remaining tasks (after {tasks[-1].id}) and the plan_summary."
+        )
+    
+    async def _call_llm(
+        self,
+        prompt: str,
+        generation_config: Dict[str, Any],
+        usage: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """
+        Make one guarded provider call
+        
+        Fails fast with CircuitOpenError while the breaker is open, waits
+        for a quota token and a concurrency slot, then bounds the (possibly
+        hedged) call by LLM_TIMEOUT_SECONDS. Outcomes and latencies feed
+        the breaker; token counts and time to first byte are added to
+        usage when given.
+        """
+        if not self.breaker.allow_request():
+            self.stats["short_circuited"] += 1
+            raise CircuitOpenError("LLM circuit is open")
+        
+        try:
+            await self._acquire_quota()
+            async with self.semaphore:
+                started = time.perf_counter()
+                text, call_usage = await asyncio.wait_for(
+                    self._hedged_generate(prompt, generation_config),
+                    timeout=settings.LLM_TIMEOUT_SECONDS
+                )
+        except asyncio.CancelledError:
+            self.breaker.release_probe()
+            raise
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                self.stats["timeouts"] += 1
+            self.breaker.record_failure()
+            await self._check_throttled(e)
+            raise
+        
+        latency = time.perf_counter() - started
+        self.latency.record(latency)
+        self.breaker.record_success(latency)
+        self._add_call_usage(usage, prompt, text, call_usage, latency)
+        return text
+    
+    async def _acquire_quota(self) -> None:
+        """Wait for a cluster-wide quota token (queued by the llm_priority class)"""
+        if settings.LLM_QUOTA_ENABLED and self.provider.rate_limited:
+            await self.quota.acquire()
+    
+    async def _try_acquire_quota(self) -> bool:
+        """Take a quota token without waiting (False when none is free right now)"""
+        if settings.LLM_QUOTA_ENABLED and self.provider.rate_limited:
+            return await self.quota.try_acquire()
+        return True
+    
+    async def _check_throttled(self, error: Exception) -> None:
+        """Drain the shared quota bucket when the provider answered 429"""
+        if not (settings.LLM_QUOTA_ENABLED and self.provider.rate_limited):
+            return
+        if getattr(error, "code", None) == 429 or type(error).__name__ == "ResourceExhausted":
+            await self.quota.report_throttled()
+    
+    async def _hedged_generate(self, prompt: str, generation_config: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """
+        Call the provider, sending a duplicate request if the first one is
+        slower than the observed LLM_HEDGE_PERCENTILE latency
+        
+        Whichever call succeeds first wins and the other is cancelled. The
+        duplicate needs its own quota token; when none is free right away
+        the hedge is skipped and the primary call is awaited alone.
+        
+        Returns:
+            Tuple of (response text, usage of the winning call)
+        """
+        primary = asyncio.ensure_future(self._timed_generate(prompt, generation_config))
+        hedge_delay = self._hedge_delay()
+        if hedge_delay is None:
+            return await primary
+        
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+            if done:
+                return primary.result()
+            
+            if not await self._try_acquire_quota():
+                self.stats["hedges_skipped"] += 1
+                return await primary
+            self.stats["hedges"] += 1
+            hedge = asyncio.ensure_future(self._timed_generate(prompt, generation_config))
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for call in done:
+                    if call.exception() is None:
+                        if call is hedge:
+                            self.stats["hedge_wins"] += 1
+                        return call.result()
+            return primary.result()  # Both failed - surface the primary error
+        finally:
+            for call in (primary, hedge):
+                if call is not None and not call.done():
+                    call.cancel()
+    
+    async def _timed_generate(self, prompt: str, generation_config: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """Stream one provider call to completion, timing its first chunk and collecting token counts"""
+        usage: Dict[str, Any] = {}
+        chunks = []
+        started = time.perf_counter()
+        async for chunk in self.provider.stream(prompt, generation_config, usage):
+            if not chunks:
+                usage["ttfb_seconds"] = time.perf_counter() - started
+            chunks.append(chunk)
+        return "".join(chunks), usage
+    
+    def _hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None when hedging is off"""
+        if not settings.LLM_HEDGE_ENABLED:
+            return None
+        return self.latency.percentile(
+            settings.LLM_HEDGE_PERCENTILE,
+            min_samples=settings.LLM_HEDGE_MIN_SAMPLES
+        )
+    
+    def _build_full_prompt(self, system_prompt: str, user_prompt: str) -> str:
+        """Combine system and user prompts for Gemini"""
+        return f"{system_prompt}\n\n{user_prompt}\n\nIMPORTANT: Respond with valid JSON only, no markdown formatting. Ensure all strings are properly escaped."
+    
+    def _get_generation_config(self, max_output_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """Configure generation parameters (output budget defaults to LLM_MAX_OUTPUT_TOKENS)"""
+        return {
+            "temperature": 0.7,
+            "max_output_tokens": max_output_tokens or settings.LLM_MAX_OUTPUT_TOKENS,
+            "response_mime_type": "application/json"  # Force JSON response
+        }
+    
+    def _parse_plan_response(self, text: str) -> LLMPlanResponse:
+        """Clean and parse a raw Gemini response into an LLMPlanResponse"""
+        return self._plan_from_data(self._load_json(text))
+    
+    def _load_json(self, text: str) -> Dict[str, Any]:
+        """Strip markdown fences from a raw response and decode the JSON"""
         # Extract and clean the response text
-        content = response.text.strip()
+        content = text.strip()
         
         # Remove markdown code blocks if present
         if content.startswith("```json"):
@@ -78,14 +1160,21 @@ class LLMService:
         
         # Parse JSON
         try:
-            plan_data = json.loads(content)
+            return json.loads(content)
         except json.JSONDecodeError as e:
             print(f"ERROR: JSON parse error at line {e.lineno}: {e.msg}")
             print(f"Content preview: {content[:500]}...")
             raise
+    
+    def _plan_from_data(self, plan_data: Dict[str, Any]) -> LLMPlanResponse:
+        """Validate decoded plan JSON into an LLMPlanResponse"""
+        plan_data = {key: value for key, value in plan_data.items() if key in ("tasks", "plan_summary")}
         
         # Create LLMPlanResponse - Pydantic will validate and convert
-        return LLMPlanResponse(**plan_data)
+        response = LLMPlanResponse(**plan_data, metadata={"source": self.provider.name, "model": self.model})
+        if not response.tasks:
+            raise ValueError("Plan contains no tasks")
+        return response
     
     def _get_system_prompt(self) -> str:
         """Get the system prompt for the LLM"""
@@ -164,40 +1253,98 @@ Guidelines:
         
         return "\n".join(prompt_parts)
     
-    def _generate_fallback_plan(self, goal_text: str) -> LLMPlanResponse:
-        """Generate a simple fallback plan if LLM fails"""
-        return LLMPlanResponse(
-            tasks=[
-                LLMTaskResponse(
-                    id="T1",
-                    title="Research and Planning",
-                    description=f"Research and plan approach for: {goal_text}",
-                    duration_days=1,
-                    depends_on=[],
-                    priority="High",
-                    confidence=0.8
-                ),
-                LLMTaskResponse(
-                    id="T2",
-                    title="Implementation Phase 1",
-                    description="Begin implementation of core components",
-                    duration_days=2,
-                    depends_on=["T1"],
-                    priority="High",
-                    confidence=0.7
-                ),
-                LLMTaskResponse(
-                    id="T3",
-                    title="Testing and Refinement",
-                    description="Test implementation and refine based on results",
-                    duration_days=1,
-                    depends_on=["T2"],
-                    priority="Medium",
-                    confidence=0.8
-                )
-            ],
-            plan_summary="Basic 3-phase plan: Research → Implementation → Testing. This is a fallback plan generated when the AI service is unavailable."
+    def _build_regeneration_prompt(
+        self,
+        goal_text: str,
+        plan_type: str,
+        region_tasks: List[Dict[str, Any]],
+        upstream_tasks: List[Dict[str, Any]],
+        instructions: Optional[str]
+    ) -> str:
+        """Build the user prompt for regenerating part of a plan"""
+        prompt_parts = [
+            f"Goal: {goal_text}\n",
+            f"Plan Type: {getattr(plan_type, 'value', plan_type).upper()}\n",
+            "You are revising PART of an existing plan. Replace the tasks below with an improved version."
+        ]
+        
+        if upstream_tasks:
+            prompt_parts.append("\nFrozen prerequisite tasks (already planned, do NOT include them in your answer):")
+            for task in upstream_tasks:
+                prompt_parts.append(f"- {task['id']}: {task['title']} (finishes {task['latest_finish']})")
+        
+        prompt_parts.append("\nTasks to replace:")
+        for task in region_tasks:
+            depends_on = ", ".join(task["depends_on"]) or "none"
+            prompt_parts.append(
+                f"- {task['id']}: {task['title']} - {task['description']} "
+                f"({task['duration_days']} days, depends on: {depends_on})"
+            )
+        
+        if instructions:
+            prompt_parts.append(f"\nRequested changes: {instructions}")
+        
+        prompt_parts.append(
+            "\n\nReturn ONLY the replacement tasks. Keep the id of a task you are revising; "
+            "give brand-new tasks the ids N1, N2, N3, etc. depends_on may reference the frozen "
+            "prerequisite ids, the kept ids and the new ids. The plan_summary should describe "
+            "only what changed. These rules override the task ID and task count guidelines."
+        )
+        
+        return "\n".join(prompt_parts)
+    
+    def _build_milestone_prompt(self, user_prompt: str) -> str:
+        """Turn a full-plan user prompt into a milestone outline request"""
+        return (
+            f"{user_prompt}\n\nOUTLINE MODE: Instead of individual tasks, return only the "
+            f"3-{self._task_cap('milestones')} major milestones of this goal, using ids M1, M2, M3, etc. "
+            "Each milestone needs a one-sentence description, its total duration_days and "
+            "its depends_on between milestones. Subtasks will be planned later. "
+            "These rules override the task ID and task count guidelines."
+        )
+    
+    def _build_expansion_prompt(
+        self,
+        goal_text: str,
+        plan_type: str,
+        milestone: Dict[str, Any],
+        other_milestones: List[Dict[str, Any]],
+        max_subtasks: int
+    ) -> str:
+        """Build the user prompt for breaking one milestone into subtasks"""
+        prompt_parts = [
+            f"Goal: {goal_text}\n",
+            f"Plan Type: {getattr(plan_type, 'value', plan_type).upper()}\n",
+        ]
+        if other_milestones:
+            prompt_parts.append("Plan milestones (for context only):")
+            for other in other_milestones:
+                prompt_parts.append(f"- {other['id']}: {other['title']}")
+        
+        prompt_parts.append(
+            f"\nBreak down milestone {milestone['id']}: {milestone['title']} - {milestone['description']} "
+            f"(estimated {milestone['duration_days']} days)"
+        )
+        prompt_parts.append(
+            f"\n\nReturn 2-{max_subtasks} concrete subtasks for THIS milestone only, "
+            "using ids S1, S2, S3, etc. depends_on may only reference other subtasks of this "
+            "milestone. These rules override the task ID and task count guidelines."
+        )
+        return "\n".join(prompt_parts)
+    
+    def _generate_fallback_plan(self, goal_text: str, plan_type: str = "moderate") -> LLMPlanResponse:
+        """
+        Generate a template plan if the LLM fails
+
+        Uses the heuristic planner so degraded responses still fit the goal.
+        The source stays "fallback" so these plans are never cached or reused.
+        """
+        response = heuristic_planner.generate_plan(goal_text, plan_type=plan_type)
+        response.plan_summary = (
+            f"{response.plan_summary} This is a fallback plan generated when the AI service is unavailable."
         )
+        response.metadata = {**response.metadata, "source": "fallback", "planner": "heuristic"}
+        return response
 
 
 # Singleton instance
@@ -0,0 +1,163 @@
+"""
+Fan-out generation for goals too large for a single LLM response
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+from config import settings
+from schemas import Constraints, LLMPlanResponse, LLMTaskResponse
+from services.llm_service import llm_service
+from services.plan_cache import plan_cache, make_cache_key
+
+logger = logging.getLogger(__name__)
+
+
+async def generate_phased_plan(
+    goal_text: str,
+    constraints: Optional[Constraints] = None,
+    plan_type: str = "moderate",
+    use_cache: bool = True
+) -> LLMPlanResponse:
+    """
+    Generate a large plan as a phase outline plus one LLM call per phase
+
+    The outline comes from the milestone prompt. Phases are then expanded
+    concurrently (at most LLM_FANOUT_CONCURRENCY at once, each up to
+    MAX_TASKS_PER_PLAN tasks), so wall-clock time follows the slowest phase.
+    The results are stitched into one dependency graph: task ids are
+    renumbered T1..Tn, and the first tasks of a phase depend on the last
+    tasks of every phase it depends on. A phase whose call fails is kept
+    as a single task so the plan stays connected. If a phase's subtasks
+    form a cycle and have no first or last task, its first or last listed
+    task is used instead. The outline asks for at most
+    max(MAX_TASKS_PER_PLAN // 2, 3) phases, so plans are capped at about
+    that many times MAX_TASKS_PER_PLAN tasks (7 x 15 = 105 by default).
+
+    Args:
+        goal_text: The user's goal description
+        constraints: Optional constraints (deadline, work hours, etc.)
+        plan_type: Type of plan (moderate, aggressive, conservative)
+        use_cache: Set to False to skip cache lookups
+
+    Returns:
+        LLMPlanResponse with the stitched tasks
+    """
+    cache_key = make_cache_key(goal_text, constraints, plan_type, "phased", llm_service.model)
+    if settings.LLM_CACHE_ENABLED and use_cache:
+        cached = await plan_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    started = time.perf_counter()
+    outline = await llm_service.generate_plan_async(
+        goal_text=goal_text,
+        constraints=constraints,
+        plan_type=plan_type,
+        use_cache=use_cache,
+        milestones_only=True
+    )
+    if outline.metadata.get("source") == "fallback":
+        return outline
+    phases = outline.tasks
+
+    fanout = asyncio.Semaphore(max(settings.LLM_FANOUT_CONCURRENCY, 1))
+
+    async def expand_phase(phase: LLMTaskResponse) -> Optional[LLMPlanResponse]:
+        async with fanout:
+            try:
+                return await llm_service.expand_milestone_async(
+                    goal_text=goal_text,
+                    plan_type=plan_type,
+                    milestone=phase.model_dump(),
+                    other_milestones=[
+                        {"id": other.id, "title": other.title}
+                        for other in phases
+                        if other.id != phase.id
+                    ],
+                    max_subtasks=settings.MAX_TASKS_PER_PLAN
+                )
+            except Exception as e:
+                logger.warning(f"Phase {phase.id} generation failed, keeping it as one task: {e}")
+                return None
+
+    phase_results = await asyncio.gather(*[expand_phase(phase) for phase in phases])
+
+    tasks: List[LLMTaskResponse] = []
+    phase_sources: Dict[str, List[str]] = {}  # phase id -> ids of its first tasks
+    phase_sinks: Dict[str, List[str]] = {}  # phase id -> ids of its last tasks
+    phase_ids = {phase.id for phase in phases}
+    failed = 0
+    for phase, result in zip(phases, phase_results):
+        if result is None:
+            failed += 1
+            subtasks = [phase.model_copy(update={"depends_on": []})]
+        else:
+            subtasks = result.tasks
+
+        id_map = {}
+        for subtask in subtasks:
+            id_map.setdefault(subtask.id, f"T{len(tasks) + len(id_map) + 1}")
+        phase_tasks = []
+        for subtask in subtasks:
+            new_id = id_map[subtask.id]
+            if any(task.id == new_id for task in phase_tasks):
+                continue  # Duplicate id in the response
+            depends_on = list(dict.fromkeys(
+                id_map[dep_id] for dep_id in subtask.depends_on
+                if dep_id in id_map and id_map[dep_id] != new_id
+            ))
+            phase_tasks.append(subtask.model_copy(update={"id": new_id, "depends_on": depends_on}))
+
+        has_dependents = {dep_id for task in phase_tasks for dep_id in task.depends_on}
+        phase_sources[phase.id] = [task.id for task in phase_tasks if not task.depends_on]
+        phase_sinks[phase.id] = [task.id for task in phase_tasks if task.id not in has_dependents]
+        if phase_tasks and not (phase_sources[phase.id] and phase_sinks[phase.id]):
+            # Cyclic subtasks: still link the phase through its first and last tasks
+            logger.warning(f"Phase {phase.id} subtasks have no first or last task, linking it through its ends")
+            phase_sources[phase.id] = phase_sources[phase.id] or [phase_tasks[0].id]
+            phase_sinks[phase.id] = phase_sinks[phase.id] or [phase_tasks[-1].id]
+        tasks.extend(phase_tasks)
+
+    # Cross-phase edges: a phase starts once the phases it depends on are finished
+    by_id = {task.id: task for task in tasks}
+    for phase in phases:
+        upstream = [
+            sink_id
+            for dep_phase in phase.depends_on
+            if dep_phase in phase_ids and dep_phase != phase.id
+            for sink_id in phase_sinks[dep_phase]
+        ]
+        for source_id in phase_sources[phase.id]:
+            by_id[source_id].depends_on = list(dict.fromkeys(by_id[source_id].depends_on + upstream))
+
+    # Token totals over all calls; latency is wall-clock for the whole fan-out
+    usages = [outline.metadata.get("usage") or {}] + [
+        result.metadata.get("usage") or {} for result in phase_results if result is not None
+    ]
+    usage = {
+        "calls": sum(item.get("calls", 0) for item in usages),
+        "prompt_tokens": sum(item.get("prompt_tokens", 0) for item in usages),
+        "output_tokens": sum(item.get("output_tokens", 0) for item in usages),
+        "tokens_estimated": any(item.get("tokens_estimated") for item in usages),
+        "ttfb_ms": usages[0].get("ttfb_ms"),
+        "total_ms": round((time.perf_counter() - started) * 1000, 1),
+        "phase_ms": [item.get("total_ms") for item in usages[1:]],
+    }
+
+    response = LLMPlanResponse(
+        tasks=tasks,
+        plan_summary=outline.plan_summary,
+        metadata={
+            "source": llm_service.provider.name,
+            "model": llm_service.model,
+            "phased": True,
+            "phases": len(phases),
+            "failed_phases": failed,
+            "usage": usage,
+        }
+    )
+    if settings.LLM_CACHE_ENABLED and not failed:
+        await plan_cache.set(cache_key, response, plan_type)
+    return response
@@ -0,0 +1,207 @@
+"""
+Two-tier cache for LLM-generated plans (in-process LRU + MongoDB with TTL)
+"""
+import hashlib
+import json
+import logging
+import re
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from config import settings
+from models_mongo import LLMCacheEntry
+from schemas import LLMPlanResponse
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_goal_text(goal_text: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    text = re.sub(r"\s+", " ", goal_text.strip().lower())
+    return text.rstrip(" .!?")
+
+
+def _normalize_constraints(constraints: Any) -> Dict[str, Any]:
+    """Convert constraints (model, dict or None) into a canonical dictionary"""
+    if constraints is None:
+        return {}
+    if hasattr(constraints, "model_dump"):
+        constraints = constraints.model_dump()
+
+    normalized = {}
+    for key, value in dict(constraints).items():
+        if value is None or value == []:
+            continue
+        if key == "deadline":
+            # datetime or string - only the calendar day matters to the prompt
+            value = value.date().isoformat() if isinstance(value, datetime) else str(value).strip()[:10]
+        elif key == "unavailable_dates":
+            value = sorted({str(d).strip() for d in value})
+        normalized[key] = value
+    return normalized
+
+
+def constraints_fingerprint(constraints: Any) -> str:
+    """
+    Hash of constraints after the normalization used by make_cache_key
+
+    Args:
+        constraints: Optional constraints (model or dict)
+
+    Returns:
+        Hex SHA-256 digest of the canonical constraints
+    """
+    canonical = json.dumps(_normalize_constraints(constraints), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def make_cache_key(
+    goal_text: str,
+    constraints: Any,
+    plan_type: Any,
+    mode: str = "full",
+    model: Optional[str] = None
+) -> str:
+    """
+    Build a canonical hash of the prompt inputs and the model that answers them
+
+    Args:
+        goal_text: The user's goal description
+        constraints: Optional constraints (model or dict)
+        plan_type: Plan type (enum or string)
+        mode: Prompt variant ("full" task plan or "milestones" outline)
+        model: LLM model name (defaults to GEMINI_MODEL), so switching
+            models never serves plans generated by the previous one
+
+    Returns:
+        Hex SHA-256 digest identifying the normalized prompt
+    """
+    payload = {
+        "model": model or settings.GEMINI_MODEL,
+        "goal": normalize_goal_text(goal_text),
+        "plan_type": getattr(plan_type, "value", plan_type),
+        "constraints": _normalize_constraints(constraints),
+    }
+    if mode != "full":
+        payload["mode"] = mode  # Full-plan keys stay unchanged
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class PlanCache:
+    """In-process LRU in front of a MongoDB collection with a TTL index"""
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        """Initialize empty cache tiers and counters"""
+        self.max_entries = max_entries
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, payload)
+        self.stats = {
+            "memory_hits": 0,
+            "mongo_hits": 0,
+            "misses": 0,
+            "writes": 0,
+            "errors": 0,
+        }
+
+    async def get(self, key: str) -> Optional[LLMPlanResponse]:
+        """
+        Look up a cached plan, checking memory first and then MongoDB
+
+        Args:
+            key: Cache key from make_cache_key
+
+        Returns:
+            A fresh LLMPlanResponse copy, or None on a miss
+        """
+        now = datetime.utcnow()
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, payload = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return self._to_response(payload, "memory")
+            del self._entries[key]
+
+        try:
+            document = await LLMCacheEntry.find_one(LLMCacheEntry.cache_key == key)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"Plan cache lookup failed: {e}")
+            document = None
+
+        # The TTL monitor runs about once a minute, so check expiry ourselves too
+        if document is not None and document.expires_at > now:
+            self._remember(key, document.response, document.expires_at)
+            self.stats["mongo_hits"] += 1
+            return self._to_response(document.response, "mongo")
+
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, response: LLMPlanResponse, plan_type: Any = None) -> None:
+        """
+        Store a generated plan in both cache tiers
+
+        Args:
+            key: Cache key from make_cache_key
+            response: Successfully generated LLM response
+            plan_type: Plan type, stored for inspection
+        """
+        now = datetime.utcnow()
+        expires_at = now + self.ttl
+        payload = response.model_dump(exclude={"metadata"})
+        self._remember(key, payload, expires_at)
+        self.stats["writes"] += 1
+
+        try:
+            await LLMCacheEntry.get_motor_collection().update_one(
+                {"cache_key": key},
+                {"$set": {
+                    "plan_type": str(getattr(plan_type, "value", plan_type)),
+                    "response": payload,
+                    "created_at": now,
+                    "expires_at": expires_at,
+                }},
+                upsert=True
+            )
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"Plan cache write failed: {e}")
+
+    def clear(self) -> None:
+        """Drop all in-process entries (MongoDB entries expire via TTL)"""
+        self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current LRU size"""
+        lookups = self.stats["memory_hits"] + self.stats["mongo_hits"] + self.stats["misses"]
+        hits = self.stats["memory_hits"] + self.stats["mongo_hits"]
+        return {
+            **self.stats,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._entries),
+        }
+
+    def _remember(self, key: str, payload: Dict[str, Any], expires_at: datetime) -> None:
+        """Insert into the LRU, evicting the least recently used entry when full"""
+        self._entries[key] = (expires_at, payload)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    @staticmethod
+    def _to_response(payload: Dict[str, Any], tier: str) -> LLMPlanResponse:
+        """Build a new response object so callers never share cached state"""
+        response = LLMPlanResponse(**payload)
+        response.metadata = {"source": "cache", "cache_tier": tier}
+        return response
+
+
+# Singleton instance
+plan_cache = PlanCache(
+    max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.LLM_CACHE_TTL_SECONDS
+)
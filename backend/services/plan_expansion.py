@@ -0,0 +1,264 @@
+"""
+Lazy expansion of milestone plans into subtasks
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+
+from beanie import PydanticObjectId
+from pymongo import UpdateOne
+
+from models_mongo import Goal, Plan, Task, TaskStatus
+from schemas import LLMPlanResponse
+from services.llm_service import llm_service
+from services.calendar_registry import calendar_registry
+from services.plan_pipeline import constraints_from_goal, reschedule_plan, task_priority
+from services.plan_regeneration import downstream_task_ids
+
+EXPANSION_LEASE_SECONDS = 30  # Longest a merge may hold a plan before another one can take over
+EXPANSION_LEASE_POLL_SECONDS = 0.1
+
+# Fields an expansion changes; writing only these keeps concurrent claims intact
+TASK_FIELDS = (
+    "depends_on", "earliest_start", "latest_finish", "late_start", "late_finish",
+    "total_float_days", "free_float_days", "is_critical", "is_expanded",
+)
+PLAN_FIELDS = (
+    "critical_path", "critical_paths", "total_duration_days", "estimated_completion",
+    "plan_data", "updated_at",
+)
+
+
+async def expand_milestone(plan: Plan, task_id: str) -> Tuple[Plan, List[Task]]:
+    """
+    Generate the subtasks of one milestone and wire them into the plan
+
+    The milestone is claimed atomically, so concurrent requests cannot
+    expand it twice. Subtasks of different milestones are generated
+    concurrently, but merged into the plan one at a time under a
+    plan-level lease, each merge starting from freshly loaded documents.
+    Subtasks take over the milestone's place in the dependency graph:
+    the first subtasks inherit its prerequisites and tasks that depended
+    on it now depend on its last subtasks. The milestone stays as a
+    summary whose dates span its subtasks. Dates are recomputed only for
+    the subtasks and what follows them.
+
+    Args:
+        plan: Plan document
+        task_id: Milestone task ID
+
+    Returns:
+        Tuple of (updated Plan document, all Task documents of the plan)
+
+    Raises:
+        KeyError: If task_id is not part of the plan
+        ValueError: If the task is not an unexpanded milestone
+    """
+    plan_id = str(plan.id)
+    milestone = await Task.find_one(Task.plan_id == plan_id, Task.task_id == task_id)
+    if milestone is None:
+        raise KeyError(task_id)
+
+    claimed = await Task.get_motor_collection().update_one(
+        {"_id": milestone.id, "is_expandable": True},
+        {"$set": {"is_expandable": False}}
+    )
+    if claimed.modified_count == 0:
+        raise ValueError(f"Task {task_id} is not an expandable milestone")
+
+    try:
+        goal, llm_response = await _generate_subtasks(plan, milestone)
+        async with _expansion_lease(plan.id):
+            plan, tasks, children, updated = await _merge_subtasks(plan.id, goal, task_id, llm_response)
+            await _write_expansion(plan, children, updated)
+    except Exception:
+        # Drop any subtasks already written and leave the milestone expandable so it can be retried
+        await Task.get_motor_collection().delete_many({"plan_id": plan_id, "parent_task_id": task_id})
+        await Task.get_motor_collection().update_one(
+            {"_id": milestone.id},
+            {"$set": {"is_expandable": True}}
+        )
+        raise
+
+    return plan, tasks
+
+
+@asynccontextmanager
+async def _expansion_lease(plan_id: PydanticObjectId) -> AsyncIterator[None]:
+    """
+    Hold the plan's expansion lease, waiting while another merge holds it
+
+    The lease expires on its own, so a process that dies mid-merge does
+    not block the plan forever.
+    """
+    collection = Plan.get_motor_collection()
+    while True:
+        now = datetime.utcnow()
+        leased = await collection.update_one(
+            {"_id": plan_id, "$or": [
+                {"expansion_lease_until": None},
+                {"expansion_lease_until": {"$lt": now}},
+            ]},
+            {"$set": {"expansion_lease_until": now + timedelta(seconds=EXPANSION_LEASE_SECONDS)}}
+        )
+        if leased.modified_count:
+            break
+        await asyncio.sleep(EXPANSION_LEASE_POLL_SECONDS)
+    try:
+        yield
+    finally:
+        await collection.update_one({"_id": plan_id}, {"$set": {"expansion_lease_until": None}})
+
+
+async def _generate_subtasks(plan: Plan, milestone: Task) -> Tuple[Optional[Goal], LLMPlanResponse]:
+    """Ask the LLM for a claimed milestone's subtasks; returns (goal, LLM response)"""
+    plan_id = str(plan.id)
+    goal = await Goal.get(PydanticObjectId(plan.goal_id))
+    milestones = await Task.find(Task.plan_id == plan_id, Task.parent_task_id == None).to_list()  # noqa: E711
+    llm_response = await llm_service.expand_milestone_async(
+        goal_text=goal.goal_text if goal else plan.plan_summary,
+        plan_type=plan.plan_type,
+        milestone={
+            "id": milestone.task_id,
+            "title": milestone.title,
+            "description": milestone.description,
+            "duration_days": milestone.duration_days,
+        },
+        other_milestones=[
+            {"id": other.task_id, "title": other.title}
+            for other in milestones
+            if other.task_id != milestone.task_id
+        ]
+    )
+    return goal, llm_response
+
+
+async def _merge_subtasks(
+    plan_id: PydanticObjectId,
+    goal: Optional[Goal],
+    task_id: str,
+    llm_response: LLMPlanResponse
+) -> Tuple[Plan, List[Task], List[Task], List[Task]]:
+    """
+    Merge a claimed milestone's subtasks into freshly loaded plan documents
+
+    Must run under the plan's expansion lease.
+
+    Returns:
+        Tuple of (plan, all tasks, new subtasks, existing tasks to update)
+    """
+    # Reload: other milestones may have been expanded during the LLM call
+    plan = await Plan.get(plan_id)
+    tasks = await Task.find(Task.plan_id == str(plan_id)).to_list()
+    milestone = next(task for task in tasks if task.task_id == task_id)
+
+    id_map = {}
+    for llm_task in llm_response.tasks:
+        id_map.setdefault(llm_task.id, f"{task_id}.{len(id_map) + 1}")
+
+    children = []
+    for llm_task in llm_response.tasks:
+        child_id = id_map[llm_task.id]
+        if any(child.task_id == child_id for child in children):
+            continue  # Duplicate id in the response
+        depends_on = []
+        for dep_id in llm_task.depends_on:
+            dep_id = id_map.get(dep_id)
+            if dep_id and dep_id != child_id and dep_id not in depends_on:
+                depends_on.append(dep_id)
+        children.append(Task(
+            plan_id=str(plan_id),
+            task_id=child_id,
+            title=llm_task.title,
+            description=llm_task.description,
+            duration_days=llm_task.duration_days,
+            earliest_start="",
+            latest_finish="",
+            depends_on=depends_on or list(milestone.depends_on),
+            priority=task_priority(llm_task.priority),
+            confidence=llm_task.confidence,
+            status=TaskStatus.PENDING,
+            parent_task_id=task_id
+        ))
+
+    # Tasks that waited for the milestone now wait for its last subtasks
+    child_ids = {child.task_id for child in children}
+    has_dependents = {dep_id for child in children for dep_id in child.depends_on}
+    sinks = [child.task_id for child in children if child.task_id not in has_dependents]
+    rewired = []
+    for task in tasks:
+        if task_id in task.depends_on:
+            task.depends_on = list(dict.fromkeys(
+                dep for dep_id in task.depends_on
+                for dep in (sinks if dep_id == task_id else [dep_id])
+            ))
+            rewired.append(task)
+
+    milestone.is_expanded = True
+    milestone.depends_on = []
+    tasks = tasks + children
+
+    affected = set()
+    for child_id in child_ids:
+        if child_id not in affected:
+            affected |= downstream_task_ids(tasks, child_id)
+    constraints = constraints_from_goal(goal)
+    await calendar_registry.resolve(constraints)
+    changed = reschedule_plan(plan, tasks, affected, constraints)
+
+    # Milestones claimed by expansions still in flight count as pending
+    plan.plan_data = {
+        **(plan.plan_data or {}),
+        "pending_milestones": sum(
+            1 for task in tasks if task.parent_task_id is None and not task.is_expanded
+        ),
+    }
+    updated = {task.task_id: task for task in rewired + changed + [milestone] if task.task_id not in child_ids}
+    return plan, tasks, children, list(updated.values())
+
+
+async def _write_expansion(plan: Plan, children: List[Task], updated: List[Task]) -> None:
+    """Insert the subtasks in one batch, then write only the fields an expansion changes"""
+    if children:
+        await Task.insert_many(children)
+    if updated:
+        await Task.get_motor_collection().bulk_write([
+            UpdateOne({"_id": task.id}, {"$set": task.model_dump(include=set(TASK_FIELDS))})
+            for task in updated
+        ])
+    await Plan.get_motor_collection().update_one(
+        {"_id": plan.id},
+        {"$set": plan.model_dump(include=set(PLAN_FIELDS))}
+    )
+
+
+async def expand_all_milestones(
+    plan: Plan,
+    on_progress: Optional[Callable[[int, int], Awaitable[None]]] = None
+) -> int:
+    """
+    Expand every remaining milestone of a plan, in dependency order
+
+    Milestones are expanded one at a time so each rescheduling step sees
+    the subtasks of the milestones before it.
+
+    Args:
+        plan: Plan document
+        on_progress: Optional callback receiving (expanded, total)
+
+    Returns:
+        Number of milestones expanded
+    """
+    tasks = await Task.find(Task.plan_id == str(plan.id), Task.is_expandable == True).to_list()  # noqa: E712
+    ordered = sorted(tasks, key=lambda task: (task.earliest_start or "", task.task_id))
+    expanded = 0
+    for milestone in ordered:
+        try:
+            plan, _ = await expand_milestone(plan, milestone.task_id)
+        except ValueError:
+            continue  # Expanded meanwhile through the endpoint
+        expanded += 1
+        if on_progress:
+            await on_progress(expanded, len(ordered))
+    return expanded
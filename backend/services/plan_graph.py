@@ -0,0 +1,265 @@
+"""
+Compiled, array-backed dependency graph shared by the scheduling algorithms
+"""
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from config import settings
+from services.critical_path import (
+    BackwardPass,
+    ForwardPass,
+    backward_pass,
+    forward_pass,
+    successor_arrays,
+)
+
+logger = logging.getLogger(__name__)
+
+GraphKey = Tuple[Tuple[str, int, Tuple[str, ...]], ...]
+
+
+class PlanGraph:
+    """
+    Dependency graph of one plan with integer task indices
+
+    Prerequisites and successors are CSR arrays, the topological order and
+    earliest times come from one forward pass at compile time, and the
+    backward pass is computed on first use. Instances are shared through
+    the cache, so they must be treated as read-only.
+    """
+
+    def __init__(
+        self,
+        task_ids: List[str],
+        durations: np.ndarray,
+        pred_indptr: np.ndarray,
+        pred_indices: np.ndarray,
+        dangling: List[Tuple[str, str]]
+    ):
+        """
+        Args:
+            task_ids: Task ids; task i has id task_ids[i]
+            durations: Task durations
+            pred_indptr: CSR row pointers of the prerequisites
+            pred_indices: CSR prerequisite indices, in depends_on order
+            dangling: (task id, unknown prerequisite id) pairs left out of the graph
+        """
+        self.task_ids = task_ids
+        self.index: Dict[str, int] = {task_id: position for position, task_id in enumerate(task_ids)}
+        self.durations = durations
+        self.pred_indptr = pred_indptr
+        self.pred_indices = pred_indices
+        self.successors = successor_arrays(pred_indptr, pred_indices)
+        self.dangling = dangling
+        self.forward: ForwardPass = forward_pass(durations, pred_indptr, pred_indices, self.successors)
+        for array in (durations, pred_indptr, pred_indices, *self.successors, *self.forward):
+            array.flags.writeable = False
+
+        released = np.zeros(len(task_ids), dtype=bool)
+        released[self.forward.order] = True
+        # Tasks on a cycle or depending on one, in task order
+        self.blocked: np.ndarray = np.flatnonzero(~released)
+        self.cycles: List[List[str]] = [
+            [task_ids[index] for index in component] for component in self._cycle_components()
+        ]
+        self._backward: Optional[BackwardPass] = None
+
+    @classmethod
+    def compile(cls, tasks: Sequence) -> "PlanGraph":
+        """
+        Build the graph of a task list
+
+        References to unknown task ids are recorded in dangling and
+        otherwise ignored.
+
+        Args:
+            tasks: Objects with id, duration_days and depends_on
+
+        Returns:
+            PlanGraph
+        """
+        task_ids = [task.id for task in tasks]
+        index = {task_id: position for position, task_id in enumerate(task_ids)}
+        durations = np.fromiter((task.duration_days for task in tasks), dtype=np.int64, count=len(tasks))
+        counts = [0]
+        pred_indices = []
+        dangling = []
+        for task in tasks:
+            deps = []
+            for dep_id in task.depends_on:
+                if dep_id in index:
+                    deps.append(index[dep_id])
+                else:
+                    dangling.append((task.id, dep_id))
+            counts.append(len(deps))
+            pred_indices.extend(deps)
+        pred_indptr = np.cumsum(np.asarray(counts, dtype=np.int64))
+        return cls(task_ids, durations, pred_indptr, np.asarray(pred_indices, dtype=np.int64), dangling)
+
+    @property
+    def order(self) -> List[str]:
+        """Task ids in topological order; blocked tasks are left out"""
+        return [self.task_ids[index] for index in self.forward.order]
+
+    @property
+    def schedule_order(self) -> np.ndarray:
+        """Topological order followed by the blocked tasks, so every task can be dated"""
+        return np.concatenate((self.forward.order, self.blocked))
+
+    @property
+    def backward(self) -> BackwardPass:
+        """Latest times and floats, computed once"""
+        if self._backward is None:
+            self._backward = backward_pass(
+                self.durations, self.pred_indptr, self.pred_indices, self.forward, self.successors
+            )
+        return self._backward
+
+    def predecessors(self, index: int) -> np.ndarray:
+        """Prerequisite indices of task index, in depends_on order"""
+        return self.pred_indices[self.pred_indptr[index]:self.pred_indptr[index + 1]]
+
+    def descendants(self, task_ids: Iterable[str]) -> Set[str]:
+        """Ids of the tasks that transitively depend on any of task_ids (the tasks themselves excluded)"""
+        succ_indptr, _, succ_dst = self.successors
+        roots = [self.index[task_id] for task_id in task_ids if task_id in self.index]
+        seen = set(roots)
+        found = set()
+        stack = list(roots)
+        while stack:
+            index = stack.pop()
+            for successor in succ_dst[succ_indptr[index]:succ_indptr[index + 1]].tolist():
+                found.add(successor)
+                if successor not in seen:
+                    seen.add(successor)
+                    stack.append(successor)
+        return {self.task_ids[index] for index in found}
+
+    def warnings(self) -> List[str]:
+        """Human-readable cycle and dangling-reference diagnostics"""
+        messages = [
+            f"Dependency cycle between tasks {', '.join(cycle)}"
+            for cycle in self.cycles
+        ]
+        in_cycle = {task_id for cycle in self.cycles for task_id in cycle}
+        behind = [self.task_ids[index] for index in self.blocked if self.task_ids[index] not in in_cycle]
+        if behind:
+            messages.append(f"Tasks {', '.join(behind)} depend on a dependency cycle")
+        messages.extend(
+            f"Task {task_id} depends on unknown task {dep_id}; the dependency was ignored"
+            for task_id, dep_id in self.dangling
+        )
+        return messages
+
+    def _cycle_components(self) -> List[List[int]]:
+        """
+        Strongly connected components among the blocked tasks that form a cycle
+
+        Iterative Tarjan over the successor CSR restricted to blocked tasks,
+        so the cost is linear in the blocked part of the graph.
+
+        Returns:
+            Components as ascending task indices, ordered by their first task
+        """
+        if self.blocked.size == 0:
+            return []
+        succ_indptr, _, succ_dst = self.successors
+        blocked = set(self.blocked.tolist())
+        discovery: Dict[int, int] = {}
+        low: Dict[int, int] = {}
+        on_stack = set()
+        stack: List[int] = []
+        components = []
+
+        for root in self.blocked.tolist():
+            if root in discovery:
+                continue
+            work = [(root, int(succ_indptr[root]))]
+            discovery[root] = low[root] = len(discovery)
+            stack.append(root)
+            on_stack.add(root)
+            while work:
+                node, edge = work[-1]
+                if edge < succ_indptr[node + 1]:
+                    work[-1] = (node, edge + 1)
+                    successor = int(succ_dst[edge])
+                    if successor not in blocked:
+                        continue
+                    if successor not in discovery:
+                        discovery[successor] = low[successor] = len(discovery)
+                        stack.append(successor)
+                        on_stack.add(successor)
+                        work.append((successor, int(succ_indptr[successor])))
+                    elif successor in on_stack:
+                        low[node] = min(low[node], discovery[successor])
+                    continue
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == discovery[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    self_loop = node in succ_dst[succ_indptr[node]:succ_indptr[node + 1]]
+                    if len(component) > 1 or self_loop:
+                        components.append(sorted(component))
+        components.sort()
+        return components
+
+
+class PlanGraphCache:
+    """Thread-safe LRU of compiled graphs keyed by task ids, durations and dependencies"""
+
+    def __init__(self, max_entries: int):
+        """Initialize an empty cache"""
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[GraphKey, PlanGraph]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    @staticmethod
+    def key(tasks: Sequence) -> GraphKey:
+        """Everything the graph depends on; dates and other fields are ignored"""
+        return tuple((task.id, task.duration_days, tuple(task.depends_on)) for task in tasks)
+
+    def get(self, tasks: Sequence) -> PlanGraph:
+        """
+        Compiled graph of the tasks, built on a miss
+
+        Args:
+            tasks: Objects with id, duration_days and depends_on
+
+        Returns:
+            PlanGraph (shared; do not modify)
+        """
+        key = self.key(tasks)
+        with self._lock:
+            graph = self._entries.get(key)
+            if graph is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return graph
+
+        graph = PlanGraph.compile(tasks)
+        if graph.cycles or graph.dangling:
+            logger.warning("; ".join(graph.warnings()))
+        with self._lock:
+            self.stats["misses"] += 1
+            self._entries[key] = graph
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return graph
+
+
+# Singleton instance
+plan_graph_cache = PlanGraphCache(max_entries=settings.PLAN_GRAPH_CACHE_SIZE)
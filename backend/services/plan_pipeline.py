@@ -0,0 +1,436 @@
+"""
+Shared pipeline that turns an LLM plan into scheduled, stored Plan and Task documents
+"""
+from typing import Any, List, Optional, Set, Tuple
+from datetime import datetime
+
+from beanie import PydanticObjectId
+
+from config import settings
+from models_mongo import Goal, Plan, Task, PlanType, TaskPriority, TaskStatus
+from schemas import Constraints, LLMPlanResponse, TaskResponse
+from services.calendar_registry import calendar_registry
+from services.plan_service import plan_generator
+from services.work_calendar import WorkCalendar
+
+
+def llm_task_to_dict(llm_task: Any) -> dict:
+    """Normalize an LLM task (dict or LLMTaskResponse) into a plain dictionary"""
+    if isinstance(llm_task, dict):
+        return {
+            "id": llm_task.get("id"),
+            "title": llm_task.get("title"),
+            "description": llm_task.get("description"),
+            "duration_days": llm_task.get("duration_days"),
+            "depends_on": llm_task.get("depends_on", []),
+            "priority": llm_task.get("priority", "Medium"),
+            "confidence": llm_task.get("confidence", 1.0),
+        }
+    return {
+        "id": llm_task.id,
+        "title": llm_task.title,
+        "description": llm_task.description,
+        "duration_days": llm_task.duration_days,
+        "depends_on": llm_task.depends_on,
+        "priority": llm_task.priority,
+        "confidence": llm_task.confidence,
+    }
+
+
+def task_priority(value: Any) -> TaskPriority:
+    """Map an LLM priority string to TaskPriority (Medium if unrecognized)"""
+    try:
+        return TaskPriority(value)
+    except ValueError:
+        return TaskPriority.MEDIUM
+
+
+def schedule_llm_tasks(
+    llm_tasks: List[Any],
+    constraints: Optional[Any] = None,
+    start_date: Optional[datetime] = None
+) -> Tuple[List[TaskResponse], List[str]]:
+    """
+    Assign dates and compute the critical path for LLM-generated tasks
+
+    Args:
+        llm_tasks: Tasks from an LLMPlanResponse (dicts or models)
+        constraints: Optional scheduling constraints
+        start_date: Project start date (defaults to now)
+
+    Returns:
+        Tuple of (scheduled TaskResponse objects, critical path task IDs)
+    """
+    tasks = [
+        TaskResponse(**llm_task_to_dict(llm_task))
+        for llm_task in llm_tasks
+    ]
+    tasks = plan_generator.assign_dates(tasks, constraints, start_date or datetime.now())
+    critical_path = plan_generator.calculate_critical_path(tasks)
+    return tasks, critical_path
+
+
+def plan_documents(
+    goal: Goal,
+    plan_type: PlanType,
+    llm_response: LLMPlanResponse,
+    scheduled_tasks: List[TaskResponse],
+    critical_path: List[str],
+    constraints: Optional[Any] = None,
+    plan_id: Optional[PydanticObjectId] = None
+) -> Tuple[Plan, List[Task]]:
+    """
+    Build (unsaved) Plan and Task documents for a scheduled plan
+
+    Ids are assigned up front so the documents can be bulk-inserted.
+    Milestone outlines (llm_response.metadata["milestones"]) get every
+    task flagged as expandable. Late dates, floats, all critical paths
+    and dependency diagnostics are computed here.
+
+    Args:
+        goal: Goal document the plan belongs to
+        plan_type: Plan type
+        llm_response: LLM response (summary and metadata)
+        scheduled_tasks: Tasks with dates assigned
+        critical_path: Critical path task IDs
+        constraints: Optional scheduling constraints (calendar for late dates)
+        plan_id: Optional id to give the plan (a new one by default)
+
+    Returns:
+        Tuple of (Plan document, Task documents)
+    """
+    # Calculate total duration and estimated completion
+    total_duration = max([t.duration_days for t in scheduled_tasks], default=0)
+    finish_dates = [t.latest_finish for t in scheduled_tasks if t.latest_finish]
+    estimated_completion = max(finish_dates) if finish_dates else None
+
+    plan = Plan(
+        id=plan_id or PydanticObjectId(),
+        goal_id=str(goal.id),
+        plan_type=plan_type,
+        critical_path=critical_path,
+        plan_summary=llm_response.plan_summary,
+        total_duration_days=total_duration,
+        estimated_completion=estimated_completion,
+        plan_data={"llm_metadata": llm_response.metadata}
+    )
+    expandable = bool(llm_response.metadata.get("milestones"))
+    if expandable:
+        plan.plan_data["pending_milestones"] = len(scheduled_tasks)
+
+    tasks = [
+        Task(
+            id=PydanticObjectId(),
+            plan_id=str(plan.id),
+            task_id=scheduled.id,
+            title=scheduled.title,
+            description=scheduled.description,
+            duration_days=scheduled.duration_days,
+            earliest_start=scheduled.earliest_start,
+            latest_finish=scheduled.latest_finish,
+            depends_on=scheduled.depends_on,
+            priority=scheduled.priority,
+            confidence=scheduled.confidence,
+            status=TaskStatus.PENDING,
+            is_expandable=expandable
+        )
+        for scheduled in scheduled_tasks
+    ]
+    _, plan.critical_paths = apply_slack(tasks, scheduled_tasks, constraints)
+    if plan_generator.levels_resources(constraints) and plan.critical_paths:
+        plan.critical_path = plan.critical_paths[0]  # Longest chain of the leveled schedule
+    record_dependency_warnings(plan, scheduled_tasks)
+    return plan, tasks
+
+
+def record_dependency_warnings(plan: Plan, scheduled: List[TaskResponse]) -> None:
+    """
+    Store dependency cycle and unknown-reference diagnostics in plan_data
+
+    The entry is removed again once the graph is clean.
+
+    Args:
+        plan: Plan document
+        scheduled: Scheduled tasks of the plan
+    """
+    warnings = plan_generator.compile_graph(scheduled).warnings()
+    if not warnings and "dependency_warnings" not in (plan.plan_data or {}):
+        return
+    plan_data = dict(plan.plan_data or {})
+    plan_data.pop("dependency_warnings", None)
+    if warnings:
+        plan_data["dependency_warnings"] = warnings
+    plan.plan_data = plan_data
+
+
+def apply_slack(
+    tasks: List[Task],
+    scheduled: List[TaskResponse],
+    constraints: Optional[Any] = None,
+    calendar: Optional[WorkCalendar] = None
+) -> Tuple[List[Task], List[List[str]]]:
+    """
+    Store late dates and floats from a CPM pass on Task documents
+
+    Float depends on the whole graph, so every task is refreshed; tasks
+    missing from scheduled (expanded milestones) are left as they are.
+
+    Args:
+        tasks: Task documents of the plan
+        scheduled: The same tasks as scheduled TaskResponse objects
+        constraints: Optional scheduling constraints
+        calendar: Compiled calendar (defaults to the constraints' one)
+
+    Returns:
+        Tuple of (Task documents whose values changed, critical paths)
+    """
+    slack, critical_paths = plan_generator.calculate_slack(
+        scheduled, constraints, settings.MAX_CRITICAL_PATHS, calendar
+    )
+    changed = []
+    for task in tasks:
+        values = slack.get(task.task_id)
+        if values is None:
+            continue
+        if any(getattr(task, field) != value for field, value in values.items()):
+            for field, value in values.items():
+                setattr(task, field, value)
+            changed.append(task)
+    return changed, critical_paths
+
+
+async def save_plan(
+    goal: Goal,
+    plan_type: PlanType,
+    llm_response: LLMPlanResponse,
+    scheduled_tasks: List[TaskResponse],
+    critical_path: List[str],
+    constraints: Optional[Any] = None,
+    plan_id: Optional[PydanticObjectId] = None
+) -> Tuple[Plan, List[Task]]:
+    """
+    Store a scheduled plan and its tasks in MongoDB
+
+    Args:
+        goal: Goal document the plan belongs to
+        plan_type: Plan type
+        llm_response: LLM response (summary and metadata)
+        scheduled_tasks: Tasks with dates assigned
+        critical_path: Critical path task IDs
+        constraints: Optional scheduling constraints
+        plan_id: Optional id to give the plan (a new one by default)
+
+    Returns:
+        Tuple of (Plan document, Task documents)
+    """
+    plans = await save_plans([
+        plan_documents(goal, plan_type, llm_response, scheduled_tasks, critical_path, constraints, plan_id)
+    ])
+    return plans[0]
+
+
+async def save_plans(documents: List[Tuple[Plan, List[Task]]]) -> List[Tuple[Plan, List[Task]]]:
+    """
+    Bulk-insert plans built by plan_documents (one insert_many per collection)
+
+    Args:
+        documents: (Plan, Task documents) pairs
+
+    Returns:
+        The same pairs, now stored
+    """
+    await Plan.insert_many([plan for plan, _ in documents])
+    tasks = [task for _, plan_tasks in documents for task in plan_tasks]
+    if tasks:
+        await Task.insert_many(tasks)
+    return documents
+
+
+async def build_plan(
+    goal: Goal,
+    plan_type: PlanType,
+    llm_response: LLMPlanResponse,
+    constraints: Optional[Any] = None
+) -> Tuple[Plan, List[Task]]:
+    """
+    Schedule an LLM plan and store it for a goal
+
+    Args:
+        goal: Goal document the plan belongs to
+        plan_type: Plan type
+        llm_response: LLM response with tasks and summary
+        constraints: Optional scheduling constraints
+
+    Returns:
+        Tuple of (Plan document, Task documents)
+    """
+    await calendar_registry.resolve(constraints)
+    scheduled_tasks, critical_path = schedule_llm_tasks(llm_response.tasks, constraints)
+    return await save_plan(goal, plan_type, llm_response, scheduled_tasks, critical_path, constraints)
+
+
+def constraints_from_goal(goal: Optional[Goal]) -> Optional[Constraints]:
+    """Rebuild scheduling constraints from the dictionary stored on a goal"""
+    if goal is None or not goal.constraints:
+        return None
+    data = dict(goal.constraints)
+    deadline = data.get("deadline")
+    if isinstance(deadline, datetime):
+        data["deadline"] = deadline.strftime("%Y-%m-%d")
+    return Constraints(**data)
+
+
+def plan_start_date(tasks: List[Task]) -> datetime:
+    """Earliest start date of a stored plan (now if nothing is scheduled)"""
+    starts = [task.earliest_start for task in tasks if task.earliest_start]
+    return datetime.strptime(min(starts), "%Y-%m-%d") if starts else datetime.now()
+
+
+def schedulable_tasks(tasks: List[Task]) -> List[TaskResponse]:
+    """Stored tasks that take part in scheduling (expanded milestones excluded) as TaskResponse objects"""
+    return [
+        TaskResponse(
+            id=task.task_id,
+            title=task.title,
+            description=task.description,
+            duration_days=task.duration_days,
+            earliest_start=task.earliest_start or None,
+            latest_finish=task.latest_finish or None,
+            depends_on=task.depends_on,
+            priority=getattr(task.priority, "value", task.priority),
+            confidence=task.confidence
+        )
+        for task in tasks
+        if not task.is_expanded
+    ]
+
+
+def reschedule_plan(
+    plan: Plan,
+    tasks: List[Task],
+    affected_ids: Set[str],
+    constraints: Optional[Any] = None
+) -> List[Task]:
+    """
+    Recompute dates for part of a stored plan and refresh the plan totals
+
+    Tasks outside affected_ids keep their dates and are only read as
+    dependencies. The critical path, floats, dependency diagnostics, total
+    duration and estimated completion are recomputed from the full task
+    list. Expanded milestones are not scheduled themselves; their dates
+    span their subtasks. Documents are updated in memory; the caller
+    saves them.
+
+    Args:
+        plan: Plan document
+        tasks: All Task documents of the plan (already holding any edits)
+        affected_ids: Task IDs whose dates must be recomputed
+        constraints: Optional scheduling constraints
+
+    Returns:
+        Task documents whose dates or floats changed
+    """
+    scheduled = schedulable_tasks(tasks)
+    calendar = calendar_registry.compile(constraints)
+    plan_generator.assign_dates(
+        scheduled, constraints, plan_start_date(tasks), only=affected_ids, calendar=calendar
+    )
+    return _apply_schedule(plan, tasks, scheduled, affected_ids, constraints, calendar)
+
+
+def propagate_task_changes(
+    plan: Plan,
+    tasks: List[Task],
+    dirty_ids: Set[str],
+    constraints: Optional[Any] = None,
+    pinned_ids: Set[str] = frozenset()
+) -> List[Task]:
+    """
+    Incrementally reschedule a stored plan after some tasks changed
+
+    Only tasks downstream of the changed ones whose dates actually move
+    are recomputed (see PlanGenerator.propagate_dates); plan totals and
+    floats are then refreshed as in reschedule_plan. With resource
+    leveling the changed tasks and their open descendants are releveled
+    around the other tasks' dates; only those whose dates move are
+    returned. Documents are updated in memory; the caller saves them.
+
+    Args:
+        plan: Plan document
+        tasks: All Task documents of the plan (already holding the edits)
+        dirty_ids: Task IDs whose dates must be recomputed from their prerequisites
+        constraints: Optional scheduling constraints
+        pinned_ids: Task IDs whose new dates were already set (e.g. actual finish)
+
+    Returns:
+        Task documents whose dates or floats changed (the pinned tasks
+        themselves only when their floats changed)
+    """
+    scheduled = schedulable_tasks(tasks)
+    if plan_generator.levels_resources(constraints):
+        # Relevel the changed tasks and what depends on them; the rest keep
+        # their dates and hold capacity only while they run
+        graph = plan_generator.compile_graph(scheduled)
+        completed = {task.task_id for task in tasks if task.is_completed}
+        affected = (set(dirty_ids) | graph.descendants(set(dirty_ids) | set(pinned_ids))) - completed - set(pinned_ids)
+        return reschedule_plan(plan, tasks, affected, constraints)
+
+    calendar = calendar_registry.compile(constraints)
+    moved = plan_generator.propagate_dates(
+        scheduled, dirty_ids, constraints, plan_start_date(tasks), pinned=pinned_ids, calendar=calendar
+    )
+    return _apply_schedule(plan, tasks, scheduled, moved | set(pinned_ids), constraints, calendar)
+
+
+def _apply_schedule(
+    plan: Plan,
+    tasks: List[Task],
+    scheduled: List[TaskResponse],
+    affected_ids: Set[str],
+    constraints: Optional[Any],
+    calendar: WorkCalendar
+) -> List[Task]:
+    """
+    Copy new dates onto Task documents and refresh milestones, floats and plan totals
+
+    Returns:
+        Task documents whose dates or floats changed
+    """
+    work_tasks = [task for task in tasks if not task.is_expanded]
+
+    changed = []
+    for task, dates in zip(work_tasks, scheduled):
+        if task.task_id not in affected_ids:
+            continue
+        earliest_start = dates.earliest_start or ""
+        latest_finish = dates.latest_finish or ""
+        if (task.earliest_start, task.latest_finish) != (earliest_start, latest_finish):
+            task.earliest_start = earliest_start
+            task.latest_finish = latest_finish
+            changed.append(task)
+
+    for milestone in tasks:
+        if not milestone.is_expanded:
+            continue
+        children = [task for task in work_tasks if task.parent_task_id == milestone.task_id]
+        starts = [task.earliest_start for task in children if task.earliest_start]
+        finishes = [task.latest_finish for task in children if task.latest_finish]
+        if starts and finishes and (milestone.earliest_start, milestone.latest_finish) != (min(starts), max(finishes)):
+            milestone.earliest_start = min(starts)
+            milestone.latest_finish = max(finishes)
+            changed.append(milestone)
+
+    slack_changed, plan.critical_paths = apply_slack(work_tasks, scheduled, constraints, calendar)
+    changed_ids = {task.task_id for task in changed}
+    changed.extend(task for task in slack_changed if task.task_id not in changed_ids)
+
+    if plan_generator.levels_resources(constraints) and plan.critical_paths:
+        plan.critical_path = plan.critical_paths[0]  # Longest chain of the leveled schedule
+    else:
+        plan.critical_path = plan_generator.calculate_critical_path(scheduled)
+    record_dependency_warnings(plan, scheduled)
+    plan.total_duration_days = max([t.duration_days for t in scheduled], default=0)
+    finish_dates = [t.latest_finish for t in scheduled if t.latest_finish]
+    plan.estimated_completion = max(finish_dates) if finish_dates else None
+    plan.updated_at = datetime.utcnow()
+    return changed
@@ -0,0 +1,187 @@
+"""
+Regenerate one task and everything downstream of it in a stored plan
+"""
+import re
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from beanie import PydanticObjectId
+from beanie.operators import In
+
+from models_mongo import Goal, Plan, Task, TaskStatus
+from services.llm_service import llm_service
+from services.calendar_registry import calendar_registry
+from services.plan_pipeline import constraints_from_goal, reschedule_plan, task_priority
+
+
+def downstream_task_ids(tasks: List[Task], root_id: str) -> Set[str]:
+    """
+    Collect a task and every task that transitively depends on it
+
+    Args:
+        tasks: All tasks of the plan
+        root_id: Task ID to start from
+
+    Returns:
+        Set of task IDs in the downstream region (including root_id)
+    """
+    dependents: Dict[str, List[str]] = {}
+    for task in tasks:
+        for dep_id in task.depends_on:
+            dependents.setdefault(dep_id, []).append(task.task_id)
+
+    region = {root_id}
+    queue = deque([root_id])
+    while queue:
+        for dependent_id in dependents.get(queue.popleft(), []):
+            if dependent_id not in region:
+                region.add(dependent_id)
+                queue.append(dependent_id)
+    return region
+
+
+def _next_task_number(task_ids: Set[str]) -> int:
+    """First unused number for T-style task IDs"""
+    numbers = [int(match.group(1)) for match in map(re.compile(r"T(\d+)$").match, task_ids) if match]
+    return max(numbers, default=0) + 1
+
+
+async def regenerate_subtree(
+    plan: Plan,
+    task_id: str,
+    instructions: Optional[str] = None
+) -> Tuple[Plan, List[Task]]:
+    """
+    Regenerate a task and its downstream region, keeping the rest of the plan
+
+    Only the region and the frozen tasks it directly depends on are sent to
+    the LLM. Returned tasks are merged into the existing Task documents:
+    revised tasks keep their status, new tasks are inserted, dropped tasks
+    are deleted. Dates are recomputed for the region only.
+
+    Args:
+        plan: Plan document
+        task_id: Task to regenerate from
+        instructions: Optional user guidance for the new version
+
+    Returns:
+        Tuple of (updated Plan document, all Task documents of the plan)
+
+    Raises:
+        KeyError: If task_id is not part of the plan
+        ValueError: If task_id is an expanded milestone
+    """
+    plan_id = str(plan.id)
+    tasks = await Task.find(Task.plan_id == plan_id).to_list()
+    by_id = {task.task_id: task for task in tasks}
+    if task_id not in by_id:
+        raise KeyError(task_id)
+    if by_id[task_id].is_expanded:
+        raise ValueError(f"Task {task_id} is an expanded milestone; regenerate one of its subtasks instead")
+
+    region = downstream_task_ids(tasks, task_id)
+    region_tasks = [task for task in tasks if task.task_id in region]
+    upstream_ids = {
+        dep_id
+        for task in region_tasks
+        for dep_id in task.depends_on
+        if dep_id not in region and dep_id in by_id
+    }
+    frozen_ids = set(by_id) - region
+
+    goal = await Goal.get(PydanticObjectId(plan.goal_id))
+    llm_response = await llm_service.regenerate_subgraph_async(
+        goal_text=goal.goal_text if goal else plan.plan_summary,
+        plan_type=plan.plan_type,
+        region_tasks=[
+            {
+                "id": task.task_id,
+                "title": task.title,
+                "description": task.description,
+                "duration_days": task.duration_days,
+                "depends_on": task.depends_on,
+            }
+            for task in region_tasks
+        ],
+        upstream_tasks=[
+            {"id": dep_id, "title": by_id[dep_id].title, "latest_finish": by_id[dep_id].latest_finish}
+            for dep_id in sorted(upstream_ids)
+        ],
+        instructions=instructions
+    )
+
+    # Kept ids stay, anything else (N1, N2, collisions with frozen tasks) gets a fresh T-number
+    llm_tasks = []
+    id_map = {}
+    next_number = _next_task_number(set(by_id))
+    for llm_task in llm_response.tasks:
+        if llm_task.id in id_map:
+            continue  # Duplicate id - keep the first occurrence
+        llm_tasks.append(llm_task)
+        if llm_task.id in region:
+            id_map[llm_task.id] = llm_task.id
+        else:
+            id_map[llm_task.id] = f"T{next_number}"
+            next_number += 1
+
+    new_ids = set(id_map.values())
+    merged = []
+    for llm_task in llm_tasks:
+        new_id = id_map[llm_task.id]
+        depends_on = []
+        for dep_id in llm_task.depends_on:
+            dep_id = dep_id if dep_id in frozen_ids else id_map.get(dep_id)
+            if dep_id and dep_id != new_id and dep_id not in depends_on:
+                depends_on.append(dep_id)
+
+        task = by_id.get(new_id) if new_id in region else None
+        if task is None:
+            task = Task(
+                plan_id=plan_id,
+                task_id=new_id,
+                title=llm_task.title,
+                description=llm_task.description,
+                duration_days=llm_task.duration_days,
+                earliest_start="",
+                latest_finish="",
+                status=TaskStatus.PENDING
+            )
+        task.title = llm_task.title
+        task.description = llm_task.description
+        task.duration_days = llm_task.duration_days
+        task.depends_on = depends_on
+        task.priority = task_priority(llm_task.priority)
+        task.confidence = llm_task.confidence
+        merged.append(task)
+
+    removed = [task for task in region_tasks if task.task_id not in new_ids]
+    tasks = [task for task in tasks if task.task_id in frozen_ids] + merged
+
+    constraints = constraints_from_goal(goal)
+    await calendar_registry.resolve(constraints)
+    changed = reschedule_plan(plan, tasks, new_ids, constraints)
+    plan.plan_data = {
+        **(plan.plan_data or {}),
+        "last_regeneration": {
+            "task_id": task_id,
+            "region_size": len(region),
+            "replaced_with": len(merged),
+            "regenerated_at": datetime.utcnow().isoformat(),
+            "llm_metadata": llm_response.metadata,
+        },
+    }
+
+    if removed:
+        await Task.find(In(Task.id, [task.id for task in removed])).delete()
+    for task in merged:
+        if task.id is None:
+            await task.insert()
+        else:
+            await task.save()
+    for task in changed:
+        if task.task_id not in new_ids:
+            await task.save()  # Frozen task whose float changed
+    await plan.save()
+
+    return plan, tasks
@@ -1,22 +1,174 @@
 """
 Core business logic for plan generation and management
 """
-from typing import List, Dict, Set, Optional, Tuple
-from datetime import datetime, timedelta
+import heapq
+from typing import Any, Iterable, List, Dict, Set, Optional, Tuple
+from datetime import datetime
 from dateutil import parser
+from config import settings
 from schemas import Constraints, TaskResponse, LLMPlanResponse
+from services.calendar_registry import calendar_registry
+from services.work_calendar import WorkCalendar
+from services.critical_path import critical_path_indices, zero_float_paths
+from services.plan_graph import PlanGraph, plan_graph_cache
+from services.resource_leveling import level_schedule, schedule_float, work_lanes, working_days_needed
+
+# Start order among equally urgent tasks when leveling resources
+PRIORITY_RANK = {"High": 0, "Medium": 1, "Low": 2}
 
 
 class PlanGenerator:
     """Handles plan generation, scheduling, and critical path calculation"""
     
+    @staticmethod
+    def compile_graph(tasks: List[TaskResponse]) -> PlanGraph:
+        """
+        Compiled dependency graph of the tasks
+        
+        Graphs are cached by task ids, durations and dependencies, so the
+        scheduling passes of one plan share a single compilation.
+        
+        Args:
+            tasks: List of TaskResponse objects
+        
+        Returns:
+            PlanGraph (shared; do not modify)
+        """
+        return plan_graph_cache.get(tasks)
+    
     @staticmethod
     def calculate_critical_path(tasks: List[TaskResponse]) -> List[str]:
         """
         Calculate the critical path through the task network
         
         The critical path is the longest sequence of dependent tasks
-        that determines the minimum project duration.
+        that determines the minimum project duration. Runs on the NumPy
+        engine in services.critical_path; results match
+        _calculate_critical_path_reference.
+        
+        Args:
+            tasks: List of TaskResponse objects
+        
+        Returns:
+            List of task IDs in the critical path
+        """
+        if not tasks:
+            return []
+        
+        graph = PlanGenerator.compile_graph(tasks)
+        path = critical_path_indices(graph.pred_indptr, graph.pred_indices, graph.forward)
+        return [graph.task_ids[index] for index in path]
+    
+    @staticmethod
+    def _topological_sort(tasks: List[TaskResponse]) -> List[str]:
+        """
+        Sort tasks in topological order (dependencies before dependents)
+        
+        Same order as _topological_sort_reference, computed level by level
+        with NumPy. Tasks on or behind a dependency cycle are left out.
+        
+        Args:
+            tasks: List of TaskResponse objects
+        
+        Returns:
+            List of task IDs in topological order
+        """
+        if not tasks:
+            return []
+        return PlanGenerator.compile_graph(tasks).order
+    
+    @staticmethod
+    def calculate_slack(
+        tasks: List[TaskResponse],
+        constraints: Optional[Constraints] = None,
+        max_paths: int = 10,
+        calendar: Optional[WorkCalendar] = None
+    ) -> Tuple[Dict[str, Dict[str, Any]], List[List[str]]]:
+        """
+        Full CPM pass: late dates, total/free float and every critical path
+        
+        Floats are in working days from durations and dependencies. When
+        resources are leveled they are measured against the leveled
+        dates instead, so tasks held back by capacity are linked to the
+        tasks that freed it (see resource_leveling.schedule_float). Late
+        dates are the task's assigned dates (earliest_start, and
+        latest_finish, which holds the early finish) pushed back by its
+        total float on the constraints' working calendar.
+        
+        Args:
+            tasks: List of TaskResponse objects with dates assigned
+            constraints: Optional constraints (weekends, unavailable dates)
+            max_paths: Maximum number of critical paths to report
+            calendar: Compiled calendar (defaults to the constraints' one)
+        
+        Returns:
+            Tuple of (task ID -> late_start, late_finish, total_float_days,
+            free_float_days and is_critical; critical paths as task ID lists).
+            Tasks on or behind a dependency cycle are left out.
+        """
+        if not tasks:
+            return {}, []
+        
+        graph = PlanGenerator.compile_graph(tasks)
+        calendar = calendar or calendar_registry.compile(constraints)
+        if PlanGenerator.levels_resources(constraints):
+            total_float, free_float, paths = PlanGenerator._leveled_float(tasks, graph, calendar, max_paths)
+        else:
+            forward, backward = graph.forward, graph.backward
+            total_float = {index: int(backward.total_float[index]) for index in forward.order.tolist()}
+            free_float = {index: int(backward.free_float[index]) for index in forward.order.tolist()}
+            paths = zero_float_paths(
+                graph.pred_indptr, graph.pred_indices, forward, backward, max_paths, graph.successors
+            )
+        
+        def late_date(date_str: Optional[str], total_float: int) -> Optional[str]:
+            if not date_str:
+                return None
+            date = calendar.add_working_days(parser.parse(date_str), total_float)
+            return date.strftime('%Y-%m-%d')
+        
+        slack = {}
+        for index, task_float in total_float.items():
+            task = tasks[index]
+            slack[task.id] = {
+                "late_start": late_date(task.earliest_start, task_float),
+                "late_finish": late_date(task.latest_finish, task_float),
+                "total_float_days": task_float,
+                "free_float_days": free_float[index],
+                "is_critical": task_float <= 0,
+            }
+        return slack, [[graph.task_ids[index] for index in path] for path in paths]
+    
+    @staticmethod
+    def _leveled_float(
+        tasks: List[TaskResponse],
+        graph: PlanGraph,
+        calendar: WorkCalendar,
+        max_paths: int
+    ) -> Tuple[Dict[int, int], Dict[int, int], List[List[int]]]:
+        """
+        Floats and critical paths of the tasks' leveled dates
+        
+        Returns:
+            Tuple of (task index -> total float, task index -> free float,
+            critical paths as task index lists)
+        """
+        dates = [task.earliest_start for task in tasks if task.earliest_start]
+        if not dates:
+            return {}, {}, []
+        start_date = parser.parse(min(dates))
+        
+        def day_of(date_str: Optional[str]) -> Optional[int]:
+            return calendar.working_days_between(start_date, parser.parse(date_str)) if date_str else None
+        
+        starts = [day_of(task.earliest_start) for task in tasks]
+        finishes = [day_of(task.latest_finish) for task in tasks]
+        return schedule_float(graph, starts, finishes, max_paths)
+    
+    @staticmethod
+    def _calculate_critical_path_reference(tasks: List[TaskResponse]) -> List[str]:
+        """
+        Pure-Python critical path, kept as the reference for the NumPy engine
         
         Args:
             tasks: List of TaskResponse objects
@@ -35,7 +187,7 @@ class PlanGenerator:
         earliest_finish = {}
         
         # Sort tasks topologically (dependencies first)
-        sorted_tasks = PlanGenerator._topological_sort(tasks)
+        sorted_tasks = PlanGenerator._topological_sort_reference(tasks)
         
         for task_id in sorted_tasks:
             task = task_dict[task_id]
@@ -86,9 +238,9 @@ class PlanGenerator:
         return critical_path
     
     @staticmethod
-    def _topological_sort(tasks: List[TaskResponse]) -> List[str]:
+    def _topological_sort_reference(tasks: List[TaskResponse]) -> List[str]:
         """
-        Sort tasks in topological order (dependencies before dependents)
+        Pure-Python Kahn sort, kept as the reference for the NumPy engine
         
         Args:
             tasks: List of TaskResponse objects
@@ -126,18 +278,28 @@ class PlanGenerator:
     def assign_dates(
         tasks: List[TaskResponse],
         constraints: Optional[Constraints] = None,
-        start_date: Optional[datetime] = None
+        start_date: Optional[datetime] = None,
+        only: Optional[Set[str]] = None,
+        calendar: Optional[WorkCalendar] = None
     ) -> List[TaskResponse]:
         """
         Assign earliest_start and latest_finish dates to tasks
         
+        When resources are leveled (see levels_resources), tasks also wait
+        for free capacity instead of all starting as soon as their
+        dependencies finish.
+        
         Args:
             tasks: List of TaskResponse objects
             constraints: Optional constraints (weekends, unavailable dates)
             start_date: Project start date (defaults to today)
+            only: Optional set of task IDs to reschedule; other tasks keep
+                their existing dates and are only read as dependencies
+            calendar: Compiled calendar (defaults to the constraints' one)
         
         Returns:
-            Updated list of tasks with dates assigned
+            Updated list of tasks with dates assigned (tasks on a dependency
+            cycle included)
         """
         if not tasks:
             return tasks
@@ -145,53 +307,40 @@ class PlanGenerator:
         if start_date is None:
             start_date = datetime.now()
         
-        # Parse unavailable dates
-        unavailable_dates = set()
-        if constraints and constraints.unavailable_dates:
-            for date_str in constraints.unavailable_dates:
-                try:
-                    unavailable_dates.add(parser.parse(date_str).date())
-                except:
-                    pass
-        
-        # Whether to skip weekends
-        skip_weekends = constraints.no_work_on_weekends if constraints else True
+        # Working days: weekends (unless worked) and unavailable dates are skipped
+        calendar = calendar or calendar_registry.compile(constraints)
         
-        # Build task dictionary
-        task_dict = {task.id: task for task in tasks}
+        graph = PlanGenerator.compile_graph(tasks)
+        if PlanGenerator.levels_resources(constraints):
+            return PlanGenerator._assign_leveled_dates(
+                tasks, graph, calendar, constraints.max_hours_per_day,
+                PlanGenerator.effort_hours(constraints), start_date, only
+            )
         
-        # Calculate dates for each task
-        task_dates = {}
-        sorted_tasks = PlanGenerator._topological_sort(tasks)
+        # Finish date of every task dated so far, by task index. Tasks on or
+        # behind a dependency cycle come last and only wait for prerequisites
+        # that already have a date.
+        finish_dates: List[Optional[datetime]] = [None] * len(tasks)
         
-        for task_id in sorted_tasks:
-            task = task_dict[task_id]
+        for index in graph.schedule_order.tolist():
+            task = tasks[index]
             
-            # Determine earliest start date
-            if not task.depends_on:
-                earliest_start = start_date
-            else:
-                # Start after all dependencies finish
-                max_finish = start_date
-                for dep_id in task.depends_on:
-                    if dep_id in task_dates:
-                        dep_finish = task_dates[dep_id]['finish']
-                        if dep_finish > max_finish:
-                            max_finish = dep_finish
-                earliest_start = max_finish
+            # Keep the dates of tasks outside the rescheduled subset
+            if only is not None and task.id not in only:
+                if task.latest_finish:
+                    finish_dates[index] = parser.parse(task.latest_finish)
+                continue
             
-            # Calculate finish date considering working days
-            finish_date = PlanGenerator._add_working_days(
-                earliest_start,
-                task.duration_days,
-                skip_weekends,
-                unavailable_dates
-            )
+            # Start after all dependencies finish
+            earliest_start = start_date
+            for dep_index in graph.predecessors(index).tolist():
+                dep_finish = finish_dates[dep_index]
+                if dep_finish is not None and dep_finish > earliest_start:
+                    earliest_start = dep_finish
             
-            task_dates[task_id] = {
-                'start': earliest_start,
-                'finish': finish_date
-            }
+            # Calculate finish date considering working days
+            finish_date = calendar.add_working_days(earliest_start, task.duration_days)
+            finish_dates[index] = finish_date
             
             # Update task with dates
             task.earliest_start = earliest_start.strftime('%Y-%m-%d')
@@ -199,6 +348,164 @@ class PlanGenerator:
         
         return tasks
     
+    @staticmethod
+    def levels_resources(constraints: Optional[Constraints]) -> bool:
+        """Whether the plan opted in to max_hours_per_day limiting how much work runs in parallel"""
+        return bool(
+            settings.RESOURCE_LEVELING_ENABLED
+            and constraints
+            and getattr(constraints, "level_resources", False)
+            and constraints.max_hours_per_day
+        )
+    
+    @staticmethod
+    def effort_hours(constraints: Optional[Constraints]) -> int:
+        """Work hours behind one day of task duration (plan value or TASK_EFFORT_HOURS_PER_DAY)"""
+        return getattr(constraints, "effort_hours_per_day", None) or settings.TASK_EFFORT_HOURS_PER_DAY
+    
+    @staticmethod
+    def _assign_leveled_dates(
+        tasks: List[TaskResponse],
+        graph: PlanGraph,
+        calendar: WorkCalendar,
+        max_hours_per_day: int,
+        effort_hours: int,
+        start_date: datetime,
+        only: Optional[Set[str]] = None
+    ) -> List[TaskResponse]:
+        """
+        assign_dates with the daily hours as a shared capacity
+        
+        Each day of duration is effort_hours hours of work.
+        Tasks with the least total float start first, then higher priority,
+        then more effort. Tasks outside only keep their dates and hold
+        capacity while they run.
+        
+        Args:
+            tasks: List of TaskResponse objects
+            graph: Compiled graph of the tasks
+            calendar: Working-day calendar
+            max_hours_per_day: Hours available per working day
+            effort_hours: Work hours behind one day of task duration
+            start_date: Project start date
+            only: Optional set of task IDs to reschedule
+        
+        Returns:
+            Updated list of tasks with dates assigned
+        """
+        lanes, rate = work_lanes(max_hours_per_day, effort_hours)
+        days = [working_days_needed(task.duration_days, effort_hours, rate) for task in tasks]
+        total_float = graph.backward.total_float.tolist()
+        priority = [
+            # Tasks on a dependency cycle have no float (-1) and go last
+            (total_float[index] < 0, total_float[index], PRIORITY_RANK.get(task.priority, 1), -days[index], index)
+            for index, task in enumerate(tasks)
+        ]
+        
+        def day_of(date_str: Optional[str]) -> Optional[int]:
+            return calendar.working_days_between(start_date, parser.parse(date_str)) if date_str else None
+        
+        fixed = {
+            index: (day_of(task.earliest_start), day_of(task.latest_finish))
+            for index, task in enumerate(tasks)
+            if only is not None and task.id not in only
+        }
+        starts, finishes = level_schedule(graph, days, priority, lanes, fixed)
+        
+        for index, task in enumerate(tasks):
+            if index in fixed:
+                continue
+            task.earliest_start = calendar.add_working_days(start_date, starts[index]).strftime('%Y-%m-%d')
+            task.latest_finish = calendar.add_working_days(start_date, finishes[index]).strftime('%Y-%m-%d')
+        return tasks
+    
+    @staticmethod
+    def propagate_dates(
+        tasks: List[TaskResponse],
+        dirty: Iterable[str],
+        constraints: Optional[Constraints] = None,
+        start_date: Optional[datetime] = None,
+        pinned: Iterable[str] = (),
+        calendar: Optional[WorkCalendar] = None
+    ) -> Set[str]:
+        """
+        Incrementally reschedule after some tasks changed
+        
+        Dirty tasks are recomputed from their prerequisites' current dates
+        in topological order, and a task's successors only become dirty
+        when its dates actually move, so the work is proportional to the
+        part of the plan that shifts. Pinned tasks keep the dates already
+        set on them (e.g. an actual finish) but still push their
+        successors. Matches a full assign_dates run without resource
+        leveling when the other tasks' dates are consistent with it.
+        
+        Args:
+            tasks: List of TaskResponse objects with dates assigned
+            dirty: Task IDs to recompute
+            constraints: Optional constraints (weekends, unavailable dates)
+            start_date: Project start date (defaults to today)
+            pinned: Task IDs whose new dates are already set
+            calendar: Compiled calendar (defaults to the constraints' one)
+        
+        Returns:
+            IDs of the tasks whose dates were changed
+        """
+        if not tasks:
+            return set()
+        
+        if start_date is None:
+            start_date = datetime.now()
+        
+        calendar = calendar or calendar_registry.compile(constraints)
+        graph = PlanGenerator.compile_graph(tasks)
+        succ_indptr, _, succ_dst = graph.successors
+        
+        # Position in the same order assign_dates dates tasks
+        position = [0] * len(tasks)
+        for rank, index in enumerate(graph.schedule_order.tolist()):
+            position[index] = rank
+        
+        def finish_of(index: int) -> Optional[datetime]:
+            latest_finish = tasks[index].latest_finish
+            return parser.parse(latest_finish) if latest_finish else None
+        
+        pinned_indices = {graph.index[task_id] for task_id in pinned if task_id in graph.index}
+        heap = [
+            (position[index], index)
+            for index in {graph.index[task_id] for task_id in dirty if task_id in graph.index} | pinned_indices
+        ]
+        heapq.heapify(heap)
+        queued = {index for _, index in heap}
+        changed = set()
+        
+        while heap:
+            _, index = heapq.heappop(heap)
+            queued.discard(index)
+            task = tasks[index]
+            
+            if index not in pinned_indices:
+                earliest_start = start_date
+                for dep_index in graph.predecessors(index).tolist():
+                    # Prerequisites behind a cycle are only waited for when dated first
+                    if position[dep_index] > position[index]:
+                        continue
+                    dep_finish = finish_of(dep_index)
+                    if dep_finish is not None and dep_finish > earliest_start:
+                        earliest_start = dep_finish
+                finish_date = calendar.add_working_days(earliest_start, task.duration_days)
+                dates = (earliest_start.strftime('%Y-%m-%d'), finish_date.strftime('%Y-%m-%d'))
+                if dates == (task.earliest_start, task.latest_finish):
+                    continue  # Nothing downstream moves
+                task.earliest_start, task.latest_finish = dates
+                changed.add(task.id)
+            
+            for successor in succ_dst[succ_indptr[index]:succ_indptr[index + 1]].tolist():
+                if successor not in queued and position[successor] > position[index]:
+                    heapq.heappush(heap, (position[successor], successor))
+                    queued.add(successor)
+        
+        return changed
+    
     @staticmethod
     def _add_working_days(
         start_date: datetime,
@@ -218,23 +525,7 @@ class PlanGenerator:
         Returns:
             End date
         """
-        current_date = start_date
-        days_added = 0
-        
-        while days_added < days:
-            current_date += timedelta(days=1)
-            
-            # Skip weekends if required
-            if skip_weekends and current_date.weekday() >= 5:  # 5=Saturday, 6=Sunday
-                continue
-            
-            # Skip unavailable dates
-            if current_date.date() in unavailable_dates:
-                continue
-            
-            days_added += 1
-        
-        return current_date
+        return WorkCalendar(skip_weekends, unavailable_dates).add_working_days(start_date, days)
     
     @staticmethod
     def validate_constraints(
@@ -245,6 +536,9 @@ class PlanGenerator:
         """
         Validate that the plan meets the specified constraints
         
+        Dependency cycles and unknown dependencies are reported as warnings
+        too, with or without constraints.
+        
         Args:
             tasks: List of tasks
             constraints: User constraints
@@ -253,10 +547,10 @@ class PlanGenerator:
         Returns:
             Tuple of (is_valid, list of warning messages)
         """
-        warnings = []
+        warnings = PlanGenerator.compile_graph(tasks).warnings() if tasks else []
         
         if not constraints:
-            return True, warnings
+            return len(warnings) == 0, warnings
         
         if start_date is None:
             start_date = datetime.now()
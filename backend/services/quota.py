@@ -0,0 +1,188 @@
+"""
+Cluster-wide LLM quota coordinator: MongoDB token bucket plus a local priority queue
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from models_mongo import QuotaBucket
+from services.circuit_breaker import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Quota priority classes (lower value is served first)"""
+    INTERACTIVE = 0  # A user is waiting on the response
+    BULK = 1  # Batch endpoints
+    BACKGROUND = 2  # Worker jobs
+
+
+# Priority of LLM calls made from the current task; async tasks inherit it
+llm_priority: ContextVar[Priority] = ContextVar("llm_priority", default=Priority.INTERACTIVE)
+
+
+class QuotaCoordinator:
+    """
+    Shares a provider request quota between all backend replicas
+
+    The bucket lives in one MongoDB document and is refilled and debited in
+    a single atomic pipeline update using the server clock, so replicas
+    never need synchronized clocks or locks. Inside each process, callers
+    wait in a priority queue and a single dispatcher hands out tokens in
+    priority order, so interactive requests overtake bulk and background
+    work when the quota is tight.
+    """
+
+    def __init__(self, bucket_name: str, requests_per_minute: float, burst: int):
+        """Initialize an empty local queue"""
+        self.bucket_name = bucket_name
+        self.rate_per_second = requests_per_minute / 60.0
+        self.burst = max(burst, 1)
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []  # (priority, seq, future) heap
+        self._sequence = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.waits = {priority: LatencyTracker(window_size=200) for priority in Priority}
+        self.stats = {
+            "granted": 0,
+            "denied_polls": 0,
+            "throttled": 0,
+            "errors": 0,
+        }
+
+    async def acquire(self, priority: Optional[Priority] = None) -> None:
+        """
+        Wait until a request token is granted to this caller
+
+        Args:
+            priority: Priority class (defaults to the llm_priority context)
+        """
+        priority = llm_priority.get() if priority is None else priority
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (int(priority), next(self._sequence), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+
+        started = time.perf_counter()
+        await future  # Cancelling the caller cancels the future; the dispatcher skips it
+        self.waits[priority].record(time.perf_counter() - started)
+
+    async def try_acquire(self) -> bool:
+        """
+        Take a token only if one is available right now
+
+        Never waits and never overtakes callers already queued in this
+        process, so optional requests (hedges) cannot exceed the quota or
+        starve required ones.
+
+        Returns:
+            True if a token was taken
+        """
+        if any(not future.done() for _, _, future in self._waiters):
+            return False
+        granted, _ = await self._take_token()
+        if granted:
+            self.stats["granted"] += 1
+        return granted
+
+    async def report_throttled(self) -> None:
+        """Empty the shared bucket after the provider answered 429"""
+        self.stats["throttled"] += 1
+        try:
+            await QuotaBucket.get_motor_collection().update_one(
+                {"name": self.bucket_name},
+                [{"$set": {"tokens": 0.0, "updated_at": "$$NOW"}}]
+            )
+        except Exception as e:
+            logger.warning(f"Could not drain quota bucket {self.bucket_name}: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return grant counters, queue depth and wait percentiles per priority class"""
+        waiting = {priority.name.lower(): 0 for priority in Priority}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                waiting[Priority(priority).name.lower()] += 1
+        return {
+            **self.stats,
+            "waiting": waiting,
+            "wait_seconds": {
+                priority.name.lower(): tracker.get_stats()
+                for priority, tracker in self.waits.items()
+            },
+        }
+
+    async def _dispatch(self) -> None:
+        """Take tokens from the shared bucket and hand them out in priority order"""
+        while True:
+            while self._waiters and self._waiters[0][2].done():
+                heapq.heappop(self._waiters)  # Cancelled while waiting
+            if not self._waiters:
+                return
+
+            granted, retry_after = await self._take_token()
+            if not granted:
+                self.stats["denied_polls"] += 1
+                await asyncio.sleep(retry_after)
+                continue
+
+            while self._waiters:
+                _, _, future = heapq.heappop(self._waiters)
+                if not future.done():
+                    self.stats["granted"] += 1
+                    future.set_result(None)
+                    break
+
+    async def _take_token(self) -> Tuple[bool, float]:
+        """
+        Atomically refill the bucket and take one token if available
+
+        Returns:
+            Tuple of (granted, seconds to wait before polling again)
+        """
+        capacity = float(self.burst)
+        elapsed_seconds = {"$divide": [
+            {"$subtract": ["$$NOW", {"$ifNull": ["$updated_at", "$$NOW"]}]},
+            1000
+        ]}
+        refill = [
+            {"$set": {
+                "tokens": {"$min": [
+                    capacity,
+                    {"$add": [
+                        {"$ifNull": ["$tokens", capacity]},
+                        {"$multiply": [elapsed_seconds, self.rate_per_second]}
+                    ]}
+                ]},
+                "updated_at": "$$NOW",
+            }},
+            {"$set": {"granted": {"$gte": ["$tokens", 1]}}},
+            {"$set": {"tokens": {"$cond": ["$granted", {"$subtract": ["$tokens", 1]}, "$tokens"]}}},
+        ]
+        try:
+            bucket = await QuotaBucket.get_motor_collection().find_one_and_update(
+                {"name": self.bucket_name},
+                refill,
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            return False, 0.0  # Another replica created the bucket first - retry
+        except Exception as e:
+            # Fail open: a quota store outage should not stop plan generation
+            self.stats["errors"] += 1
+            logger.warning(f"Quota bucket {self.bucket_name} unavailable, proceeding without it: {e}")
+            return True, 0.0
+
+        if bucket["granted"]:
+            return True, 0.0
+        if self.rate_per_second <= 0:
+            return False, 1.0
+        return False, max((1 - bucket["tokens"]) / self.rate_per_second, 0.01)
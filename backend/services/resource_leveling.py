@@ -0,0 +1,229 @@
+"""
+Resource-constrained list scheduling over a compiled plan graph
+"""
+import heapq
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from services.plan_graph import PlanGraph
+
+
+def work_lanes(max_hours_per_day: int, effort_hours_per_day: int) -> Tuple[int, int]:
+    """
+    Daily capacity expressed as parallel lanes
+
+    Every task is worked at the same daily rate (effort_hours_per_day,
+    or less if a whole day holds fewer hours), so capacity reduces to the
+    number of tasks that can run side by side.
+
+    Args:
+        max_hours_per_day: Hours available per working day
+        effort_hours_per_day: Hours one day of task duration takes
+
+    Returns:
+        Tuple of (lanes, hours worked per task per day)
+    """
+    rate = max(1, min(effort_hours_per_day, max_hours_per_day))
+    return max(1, max_hours_per_day // rate), rate
+
+
+def working_days_needed(duration_days: int, effort_hours_per_day: int, rate: int) -> int:
+    """Working days a task takes at the given daily rate (its duration when the rate is not capped)"""
+    return math.ceil(duration_days * effort_hours_per_day / rate)
+
+
+def level_schedule(
+    graph: PlanGraph,
+    days: Sequence[int],
+    priority: Sequence[tuple],
+    lanes: int,
+    fixed: Optional[Dict[int, Tuple[Optional[int], Optional[int]]]] = None
+) -> Tuple[List[Optional[int]], List[Optional[int]]]:
+    """
+    Parallel list scheduler: start the most urgent ready tasks while lanes are free
+
+    Time is counted in working days from the project start. A task becomes
+    ready once all of its prerequisites have started and it is past their
+    finish. On each decision day (a task becomes ready or a lane is freed)
+    ready tasks are started in priority order if a lane stays free for
+    their whole duration. Lane use is kept as a per-day profile, so fixed
+    tasks hold a lane only on the days they actually run, including when
+    they start later than work scheduled around them. The cost is
+    O((V + E) log V) plus the total scheduled duration. With enough lanes
+    the result is the unconstrained earliest schedule.
+
+    Prerequisites that come later in graph.schedule_order (the back edges
+    of a dependency cycle) are ignored, as in PlanGenerator.assign_dates.
+
+    Args:
+        graph: Compiled plan graph
+        days: Working days each task takes
+        priority: Sort key per task; smaller keys start first
+        lanes: Number of tasks that can run at the same time
+        fixed: Task index -> (start, finish) day for tasks that keep their
+            dates; they hold a lane from start to finish, and None means undated
+
+    Returns:
+        Tuple of (start days, finish days) per task index
+    """
+    n = len(days)
+    fixed = fixed or {}
+    succ_indptr, _, succ_dst = graph.successors
+    position = [0] * n
+    for rank, index in enumerate(graph.schedule_order.tolist()):
+        position[index] = rank
+
+    remaining = [0] * n
+    for index in range(n):
+        remaining[index] = sum(
+            1 for dep_index in graph.predecessors(index).tolist() if position[dep_index] < position[index]
+        )
+
+    start: List[Optional[int]] = [None] * n
+    finish: List[Optional[int]] = [None] * n
+    release = [0] * n
+    pending: List[Tuple[int, int]] = []  # (earliest day, index) of tasks whose prerequisites all started
+    ready: List[Tuple[tuple, int]] = []
+    finishes: List[int] = []  # Days on which lanes are freed
+    usage: List[int] = []  # Lanes in use per day
+
+    def hold(first: int, last: int) -> None:
+        """Take a lane on days first..last-1"""
+        if last > len(usage):
+            usage.extend([0] * (last - len(usage)))
+        for day in range(first, last):
+            usage[day] += 1
+        heapq.heappush(finishes, last)
+
+    def fits(first: int, last: int) -> bool:
+        """Whether a lane is free on every day first..last-1"""
+        return all(usage[day] < lanes for day in range(first, min(last, len(usage))))
+
+    def started(index: int) -> None:
+        """Pass a scheduled task's finish on to its successors"""
+        for successor in succ_dst[succ_indptr[index]:succ_indptr[index + 1]].tolist():
+            if position[successor] < position[index]:
+                continue
+            if finish[index] is not None:
+                release[successor] = max(release[successor], finish[index])
+            remaining[successor] -= 1
+            if remaining[successor] == 0 and successor not in fixed:
+                heapq.heappush(pending, (release[successor], successor))
+
+    for index, (fixed_start, fixed_finish) in fixed.items():
+        start[index], finish[index] = fixed_start, fixed_finish
+        # Only the part inside the scheduling window (day 0 onwards) takes capacity
+        if fixed_start is not None and fixed_finish is not None and fixed_finish > max(fixed_start, 0):
+            hold(max(fixed_start, 0), fixed_finish)
+    for index in range(n):
+        if remaining[index] == 0 and index not in fixed:
+            heapq.heappush(pending, (0, index))
+    for index in fixed:
+        started(index)
+
+    day = 0
+    while pending or ready:
+        while finishes and finishes[0] <= day:
+            heapq.heappop(finishes)
+        while pending and pending[0][0] <= day:
+            _, index = heapq.heappop(pending)
+            heapq.heappush(ready, (priority[index], index))
+
+        waiting = []  # Ready tasks that would run into a later reservation
+        while ready and (day >= len(usage) or usage[day] < lanes):
+            key, index = heapq.heappop(ready)
+            if not fits(day, day + days[index]):
+                waiting.append((key, index))
+                continue
+            start[index], finish[index] = day, day + days[index]
+            hold(day, finish[index])
+            started(index)
+        for entry in waiting:
+            heapq.heappush(ready, entry)
+
+        upcoming = ([finishes[0]] if finishes else []) + ([pending[0][0]] if pending else [])
+        if not upcoming:
+            break
+        day = max(day, min(upcoming))
+    return start, finish
+
+
+def schedule_float(
+    graph: PlanGraph,
+    starts: Sequence[Optional[int]],
+    finishes: Sequence[Optional[int]],
+    max_paths: int
+) -> Tuple[Dict[int, int], Dict[int, int], List[List[int]]]:
+    """
+    Total and free float of a leveled schedule, and its critical paths
+
+    CPM float only looks at dependencies, so in a leveled schedule it
+    contradicts the dates. Here a task that starts later than its
+    prerequisites allow gets a resource link from every task that freed a
+    lane on its start day. The backward pass then runs over
+    dependencies and resource links, anchored at the leveled project end.
+    Float is what a task can slip without moving the schedule's end, and
+    critical paths may cross resource links. Tasks on a dependency cycle,
+    undated tasks and links that point backwards in time are left out.
+
+    Args:
+        graph: Compiled plan graph
+        starts: Start day per task index (None if undated)
+        finishes: Finish day per task index (None if undated)
+        max_paths: Maximum number of critical paths to report
+
+    Returns:
+        Tuple of (task index -> total float, task index -> free float,
+        critical paths as task index lists)
+    """
+    dated = [
+        index for index in graph.forward.order.tolist()
+        if starts[index] is not None and finishes[index] is not None
+    ]
+    if not dated:
+        return {}, {}, []
+    dated_set = set(dated)
+    freed: Dict[int, List[int]] = {}
+    for index in dated:
+        freed.setdefault(finishes[index], []).append(index)
+
+    successors: Dict[int, List[int]] = {index: [] for index in dated}
+    for index in dated:
+        links = [
+            dep_index for dep_index in graph.predecessors(index).tolist()
+            if dep_index in dated_set and starts[dep_index] < starts[index]
+        ]
+        gate = max((finishes[dep_index] for dep_index in links), default=0)
+        if starts[index] > gate:
+            # Waited for capacity: the tasks finishing that day held it back
+            links.extend(other for other in freed.get(starts[index], ()) if starts[other] < starts[index])
+        for link in set(links):
+            successors[link].append(index)
+
+    project_end = max(finishes[index] for index in dated)
+    latest_start: Dict[int, int] = {}
+    total_float: Dict[int, int] = {}
+    free_float: Dict[int, int] = {}
+    for index in sorted(dated, key=lambda i: starts[i], reverse=True):
+        following = successors[index]
+        latest_finish = min((latest_start[other] for other in following), default=project_end)
+        latest_start[index] = latest_finish - (finishes[index] - starts[index])
+        total_float[index] = latest_start[index] - starts[index]
+        free_float[index] = min((starts[other] for other in following), default=project_end) - finishes[index]
+
+    first_day = min(starts[index] for index in dated)
+    paths: List[List[int]] = []
+    stack = [
+        [index] for index in sorted(dated, key=lambda i: (starts[i], i), reverse=True)
+        if total_float[index] <= 0 and starts[index] == first_day
+    ]
+    while stack and len(paths) < max_paths:
+        path = stack.pop()
+        last = path[-1]
+        if finishes[last] == project_end:
+            paths.append(path)
+            continue
+        for successor in sorted(set(successors[last]), reverse=True):
+            if total_float[successor] <= 0 and starts[successor] == finishes[last]:
+                stack.append(path + [successor])
+    return total_float, free_float, paths
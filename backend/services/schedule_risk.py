@@ -0,0 +1,225 @@
+"""
+Monte Carlo schedule risk: sampled task durations pushed through the plan graph with NumPy
+"""
+import math
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import numpy as np
+from dateutil import parser
+
+from models_mongo import PlanType, Task
+from schemas import Constraints
+from services.critical_path import gather_ranges
+from services.calendar_registry import calendar_registry
+from services.plan_graph import PlanGraph
+from services.plan_pipeline import plan_start_date, schedulable_tasks
+from services.plan_service import plan_generator
+
+# How far a task at confidence 0 can overrun its estimate (as a fraction of it), by plan type;
+# aggressive estimates leave the least slack and conservative ones are already padded
+OVERRUN_SPREAD = {
+    PlanType.AGGRESSIVE: 1.5,
+    PlanType.MODERATE: 1.0,
+    PlanType.CONSERVATIVE: 0.6,
+}
+UNDERRUN_SPREAD = 0.3  # How much faster than estimated a task at confidence 0 can finish
+
+CHUNK_ELEMENTS = 4_000_000  # Samples x tasks simulated at once (bounds memory)
+FLOAT_TOLERANCE = 1e-5  # Relative slack still counted as zero float (samples are float32)
+PERCENTILES = (50, 80, 95)
+
+
+class RiskSimulation(NamedTuple):
+    """Result of simulate"""
+    completion_days: np.ndarray  # Project length per sample, in working days
+    criticality: np.ndarray  # Share of samples in which each task had zero float
+
+
+def sample_durations(
+    rng: np.random.Generator,
+    estimates: np.ndarray,
+    underrun: np.ndarray,
+    overrun: np.ndarray,
+    samples: int
+) -> np.ndarray:
+    """
+    Triangular duration samples around each estimate
+
+    Task i ranges from estimates[i] * (1 - underrun[i]) to
+    estimates[i] * (1 + overrun[i]), most likely at the estimate. Sampled
+    by inverting the CDF, which also handles zero spread.
+
+    Returns:
+        Array of shape (tasks, samples)
+    """
+    estimates = estimates[:, None].astype(np.float32)
+    low = estimates * (1 - underrun[:, None].astype(np.float32))
+    high = estimates * (1 + overrun[:, None].astype(np.float32))
+    width = high - low
+    u = rng.random((len(estimates), samples), dtype=np.float32)
+    return np.where(
+        u * width < estimates - low,
+        low + np.sqrt(u * width * (estimates - low)),
+        high - np.sqrt((1 - u) * width * (high - estimates))
+    )
+
+
+def simulate(
+    graph: PlanGraph,
+    underrun: np.ndarray,
+    overrun: np.ndarray,
+    samples: int,
+    seed: Optional[int] = None
+) -> RiskSimulation:
+    """
+    Forward and backward CPM passes over many duration samples at once
+
+    Each task is a row of sampled durations, so each dependency level is a
+    handful of array operations over all samples: earliest starts are a max-reduce
+    over prerequisite finishes and latest finishes a min-reduce over
+    successor starts. Tasks on or behind a dependency cycle are left out
+    and get criticality 0.
+
+    Args:
+        graph: Compiled plan graph (durations are the estimates)
+        underrun: Per-task fraction a task can finish early
+        overrun: Per-task fraction a task can run late
+        samples: Number of samples
+        seed: Optional random seed for reproducible results
+
+    Returns:
+        RiskSimulation
+    """
+    n = len(graph.task_ids)
+    order, _, _, level_bounds = graph.forward
+    if order.size == 0:
+        return RiskSimulation(np.zeros(samples), np.zeros(n))
+
+    succ_indptr, _, succ_dst = graph.successors
+    released = np.zeros(n, dtype=bool)
+    released[order] = True
+
+    # Per level: nodes, and prerequisite / successor segments for reduceat
+    levels = []
+    for level in range(len(level_bounds) - 1):
+        nodes = order[level_bounds[level]:level_bounds[level + 1]]
+        pred_counts = np.diff(graph.pred_indptr)[nodes]
+        pred_edges = gather_ranges(graph.pred_indptr, nodes)
+
+        # Successors that were never released do not constrain the latest finish
+        succ_counts = np.diff(succ_indptr)[nodes]
+        succ_targets = succ_dst[gather_ranges(succ_indptr, nodes)]
+        keep = released[succ_targets]
+        owner = np.repeat(np.arange(nodes.size), succ_counts)
+        counts = np.bincount(owner[keep], minlength=nodes.size)
+        has_successor = counts > 0
+        levels.append((
+            nodes,
+            graph.pred_indices[pred_edges],
+            np.cumsum(pred_counts) - pred_counts,
+            nodes[has_successor],
+            succ_targets[keep],
+            np.cumsum(counts[has_successor]) - counts[has_successor],
+        ))
+
+    estimates = graph.durations.astype(np.float32)
+    rng = np.random.default_rng(seed)
+    chunk = max(1, CHUNK_ELEMENTS // n)
+    completion = np.empty(samples)
+    critical_counts = np.zeros(n)
+
+    for first in range(0, samples, chunk):
+        size = min(chunk, samples - first)
+        durations = sample_durations(rng, estimates, underrun, overrun, size)
+        earliest_start = np.zeros((n, size), dtype=np.float32)
+        earliest_finish = np.zeros((n, size), dtype=np.float32)
+        for level, (nodes, pred_sources, pred_offsets, _, _, _) in enumerate(levels):
+            if level:
+                earliest_start[nodes] = np.maximum.reduceat(earliest_finish[pred_sources], pred_offsets)
+            earliest_finish[nodes] = earliest_start[nodes] + durations[nodes]
+
+        end = earliest_finish[order].max(axis=0)
+        completion[first:first + size] = end
+
+        latest_start = np.zeros((n, size), dtype=np.float32)
+        latest_finish = np.broadcast_to(end, (n, size)).copy()
+        for nodes, _, _, with_successors, succ_targets, succ_offsets in reversed(levels):
+            if with_successors.size:
+                latest_finish[with_successors] = np.minimum.reduceat(latest_start[succ_targets], succ_offsets)
+            latest_start[nodes] = latest_finish[nodes] - durations[nodes]
+
+        total_float = latest_start[order] - earliest_start[order]
+        # Zero float up to float32 rounding along the path
+        critical_counts[order] += (total_float <= FLOAT_TOLERANCE * np.maximum(end, 1.0)).sum(axis=1)
+
+    return RiskSimulation(completion, critical_counts / samples)
+
+
+def assess_plan_risk(
+    plan_type: PlanType,
+    tasks: List[Task],
+    constraints: Optional[Constraints] = None,
+    samples: int = 10000,
+    seed: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Completion-date percentiles and task criticality for a stored plan
+
+    Duration spread grows as confidence drops and is wider for aggressive
+    plans. Completed tasks keep their estimate. Only dependencies are
+    simulated, not resource leveling, so dates are measured as working
+    days after the plan start on the plan's calendar.
+
+    Args:
+        plan_type: Plan type
+        tasks: All Task documents of the plan
+        constraints: Optional scheduling constraints (calendar and deadline)
+        samples: Number of Monte Carlo samples
+        seed: Optional random seed for reproducible results
+
+    Returns:
+        Dictionary with completion (date per percentile), completion_days
+        (working days per percentile), on_time_probability (None without
+        a deadline) and criticality (task ID -> share of samples)
+    """
+    scheduled = schedulable_tasks(tasks)
+    if not scheduled:
+        return {"completion": {}, "completion_days": {}, "on_time_probability": None, "criticality": {}}
+
+    graph = plan_generator.compile_graph(scheduled)
+    completed = {task.task_id for task in tasks if task.is_completed}
+    uncertainty = np.array([
+        0.0 if task.id in completed else 1.0 - task.confidence
+        for task in scheduled
+    ])
+    overrun_spread = OVERRUN_SPREAD.get(PlanType(plan_type), OVERRUN_SPREAD[PlanType.MODERATE])
+    result = simulate(graph, uncertainty * UNDERRUN_SPREAD, uncertainty * overrun_spread, samples, seed)
+
+    start = plan_start_date(tasks)
+    calendar = calendar_registry.compile(constraints)
+    completion_days = {
+        f"p{percentile}": round(float(days), 2)
+        for percentile, days in zip(PERCENTILES, np.percentile(result.completion_days, PERCENTILES))
+    }
+    completion = {
+        key: calendar.add_working_days(start, math.ceil(days)).strftime("%Y-%m-%d")
+        for key, days in completion_days.items()
+    }
+
+    on_time_probability = None
+    if constraints and constraints.deadline:
+        try:
+            deadline_days = calendar.working_days_between(start, parser.parse(constraints.deadline))
+            on_time_probability = round(float(np.mean(result.completion_days <= deadline_days)), 4)
+        except Exception:
+            pass  # Ignore an unparseable deadline
+
+    return {
+        "completion": completion,
+        "completion_days": completion_days,
+        "on_time_probability": on_time_probability,
+        "criticality": {
+            task_id: round(float(value), 4)
+            for task_id, value in zip(graph.task_ids, result.criticality)
+        },
+    }
@@ -0,0 +1,319 @@
+"""
+MinHash/LSH similarity index over goals of successfully generated plans
+"""
+import hashlib
+import logging
+import random
+import re
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from beanie import PydanticObjectId
+
+from config import settings
+from models_mongo import Goal, GoalSignature, Plan, Task
+from schemas import LLMPlanResponse, LLMTaskResponse
+from services.plan_cache import constraints_fingerprint
+
+logger = logging.getLogger(__name__)
+
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16  # 16 bands x 4 rows: pairs above ~0.5 Jaccard usually collide
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+_SYNC_OVERLAP_SECONDS = 60  # Re-read window for signatures inserted during a refresh
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(1337)  # Fixed seed - persisted signatures must stay comparable
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERMUTATIONS)
+]
+
+_STOPWORDS = {
+    "a", "an", "and", "the", "to", "of", "for", "in", "on", "at", "by", "with", "within",
+    "our", "my", "your", "their", "we", "i", "is", "are", "be", "it", "this", "that",
+    "into", "from", "as", "up", "new", "next", "over", "about", "under",
+}
+_NUMBER_WORDS = {
+    "one": "1", "two": "2", "three": "3", "four": "4", "five": "5", "six": "6",
+    "seven": "7", "eight": "8", "nine": "9", "ten": "10", "twelve": "12",
+}
+# Common planning verbs that are interchangeable in goal statements
+_SYNONYMS = {
+    "ship": "launch", "release": "launch", "deploy": "launch", "publish": "launch",
+    "develop": "build", "create": "build", "make": "build", "implement": "build",
+    "study": "learn", "master": "learn",
+    "application": "app", "website": "site", "webpage": "site",
+    "days": "day", "weeks": "week", "months": "month",
+}
+
+
+def tokenize_goal(goal_text: str) -> Set[str]:
+    """
+    Normalize a goal into a set of content tokens
+
+    Lowercases, drops stopwords, maps number words to digits and folds
+    common synonyms and plurals so paraphrases share tokens.
+    """
+    tokens = set()
+    for word in re.findall(r"[a-z0-9]+", goal_text.lower()):
+        if word in _STOPWORDS:
+            continue
+        word = _NUMBER_WORDS.get(word, word)
+        word = _SYNONYMS.get(word, word)
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = _SYNONYMS.get(word[:-1], word[:-1])
+        tokens.add(word)
+    return tokens
+
+
+def minhash_signature(tokens: Set[str]) -> List[int]:
+    """Compute the MinHash signature of a token set"""
+    hashes = [
+        int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+        for token in tokens
+    ] or [0]
+    return [
+        min((a * value + b) % _MERSENNE_PRIME for value in hashes)
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def jaccard(left: Set[str], right: Set[str]) -> float:
+    """Exact Jaccard similarity of two token sets"""
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+class SimilarityIndex:
+    """
+    In-memory LSH index of goal signatures, persisted in MongoDB
+
+    Signatures are computed once when a plan is stored and saved in the
+    goal_signatures collection, so startup only loads them. Lookups
+    periodically pick up signatures stored by other API replicas and
+    workers (see refresh). Candidates from the LSH buckets are ranked by
+    exact Jaccard similarity.
+    """
+
+    def __init__(self):
+        """Initialize an empty index"""
+        self._entries: Dict[str, Tuple[str, str, str, Set[str]]] = {}  # plan_id -> (goal_id, plan_type, constraints_key, tokens)
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], Set[str]] = defaultdict(set)
+        self._signatures: Dict[str, List[int]] = {}
+        self.stats = {"lookups": 0, "reuses": 0}
+        self._synced_at: Optional[datetime] = None  # created_at up to which signatures were read
+        self._refreshed_at = 0.0  # Monotonic time of the last load or refresh
+
+    async def load(self) -> int:
+        """
+        Load all persisted signatures into memory
+
+        Returns:
+            Number of entries loaded
+        """
+        synced_at = datetime.utcnow()
+        self._entries.clear()
+        self._buckets.clear()
+        self._signatures.clear()
+        async for entry in GoalSignature.find_all():
+            self._index_entry(entry)
+        self._synced_at = synced_at
+        self._refreshed_at = time.monotonic()
+        return len(self._entries)
+
+    async def refresh(self) -> int:
+        """
+        Index signatures stored since the last load or refresh
+
+        Reads a little further back than the last sync so inserts that
+        were in flight at the time are not missed.
+
+        Returns:
+            Number of new entries
+        """
+        if self._synced_at is None:
+            return await self.load()
+        synced_at = datetime.utcnow()
+        since = self._synced_at - timedelta(seconds=_SYNC_OVERLAP_SECONDS)
+        added = 0
+        async for entry in GoalSignature.find(GoalSignature.created_at >= since):
+            if entry.plan_id not in self._entries:
+                self._index_entry(entry)
+                added += 1
+        self._synced_at = synced_at
+        self._refreshed_at = time.monotonic()
+        return added
+
+    async def refresh_if_stale(self) -> None:
+        """refresh() at most once per SIMILARITY_REFRESH_SECONDS"""
+        if time.monotonic() - self._refreshed_at >= settings.SIMILARITY_REFRESH_SECONDS:
+            await self.refresh()
+
+    async def add(self, goal: Goal, plan: Plan) -> None:
+        """Index a successfully generated plan (with its goal's constraints) and persist its signature"""
+        tokens = tokenize_goal(goal.goal_text)
+        if not tokens:
+            return
+        entry = GoalSignature(
+            goal_id=str(goal.id),
+            plan_id=str(plan.id),
+            plan_type=getattr(plan.plan_type, "value", plan.plan_type),
+            constraints_key=constraints_fingerprint(goal.constraints),
+            tokens=sorted(tokens),
+            signature=minhash_signature(tokens)
+        )
+        await entry.insert()
+        self._index_entry(entry)
+
+    async def remove_plan(self, plan_id: str) -> None:
+        """Drop a deleted plan from the index"""
+        self._unindex(plan_id)
+        await GoalSignature.find(GoalSignature.plan_id == plan_id).delete()
+
+    def find_similar(
+        self,
+        goal_text: str,
+        plan_type: str,
+        constraints: Optional[Any] = None
+    ) -> Optional[Tuple[str, str, float]]:
+        """
+        Find the most similar indexed goal with the same plan type and constraints
+
+        Args:
+            goal_text: New goal description
+            plan_type: Requested plan type
+            constraints: Requested constraints; only goals whose normalized
+                constraints are identical qualify (a plan sized for a
+                two-week deadline does not fit a six-month one)
+
+        Returns:
+            (plan_id, goal_id, similarity) of the best match at or above
+            SIMILARITY_THRESHOLD, or None
+        """
+        self.stats["lookups"] += 1
+        tokens = tokenize_goal(goal_text)
+        if not tokens:
+            return None
+        plan_type = getattr(plan_type, "value", plan_type)
+        constraints_key = constraints_fingerprint(constraints)
+
+        candidates = set()
+        for key in self._band_keys(minhash_signature(tokens)):
+            candidates |= self._buckets.get(key, set())
+
+        best = None
+        for plan_id in candidates:
+            goal_id, candidate_type, candidate_constraints, candidate_tokens = self._entries[plan_id]
+            if candidate_type != plan_type or candidate_constraints != constraints_key:
+                continue
+            score = jaccard(tokens, candidate_tokens)
+            if score >= settings.SIMILARITY_THRESHOLD and (best is None or score > best[2]):
+                best = (plan_id, goal_id, score)
+        return best
+
+    def get_stats(self) -> Dict[str, int]:
+        """Return index size and lookup counters"""
+        return {"entries": len(self._entries), **self.stats}
+
+    def _index_entry(self, entry: GoalSignature) -> None:
+        self._entries[entry.plan_id] = (entry.goal_id, entry.plan_type, entry.constraints_key, set(entry.tokens))
+        self._signatures[entry.plan_id] = entry.signature
+        for key in self._band_keys(entry.signature):
+            self._buckets[key].add(entry.plan_id)
+
+    def _unindex(self, plan_id: str) -> None:
+        signature = self._signatures.pop(plan_id, None)
+        self._entries.pop(plan_id, None)
+        if signature is None:
+            return
+        for key in self._band_keys(signature):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(plan_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    @staticmethod
+    def _band_keys(signature: List[int]) -> List[Tuple[int, Tuple[int, ...]]]:
+        return [
+            (band, tuple(signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]))
+            for band in range(LSH_BANDS)
+        ]
+
+
+async def find_reusable_plan(
+    goal_text: str,
+    plan_type: str,
+    constraints: Optional[Any] = None
+) -> Optional[LLMPlanResponse]:
+    """
+    Build an LLM-style response from the tasks of a sufficiently similar past plan
+
+    The tasks keep their ids, durations and dependencies; dates are assigned
+    fresh by the normal scheduling pipeline. Only full LLM plans are
+    indexed, so callers skip this for lazy, phased and template requests.
+
+    Args:
+        goal_text: New goal description
+        plan_type: Requested plan type
+        constraints: Requested constraints, which must match the past goal's
+
+    Returns:
+        LLMPlanResponse cloned from the matching plan, or None
+    """
+    if not settings.SIMILARITY_REUSE_ENABLED:
+        return None
+    await similarity_index.refresh_if_stale()
+    match = similarity_index.find_similar(goal_text, plan_type, constraints)
+    if match is None:
+        return None
+    plan_id, goal_id, score = match
+
+    plan = await Plan.get(PydanticObjectId(plan_id))
+    tasks = await Task.find(Task.plan_id == plan_id).to_list() if plan else []
+    if not tasks:
+        # The source plan is gone - stop offering it
+        await similarity_index.remove_plan(plan_id)
+        return None
+
+    similarity_index.stats["reuses"] += 1
+    return LLMPlanResponse(
+        tasks=[
+            LLMTaskResponse(
+                id=task.task_id,
+                title=task.title,
+                description=task.description,
+                duration_days=task.duration_days,
+                depends_on=list(task.depends_on),
+                priority=getattr(task.priority, "value", task.priority),
+                confidence=task.confidence
+            )
+            for task in tasks
+        ],
+        plan_summary=plan.plan_summary,
+        metadata={
+            "source": "similar_plan",
+            "matched_plan_id": plan_id,
+            "matched_goal_id": goal_id,
+            "similarity": round(score, 3)
+        }
+    )
+
+
+def is_indexable(llm_response: LLMPlanResponse) -> bool:
+    """Whether a generated plan should be offered for reuse"""
+    metadata = llm_response.metadata
+    return (
+        metadata.get("source") not in ("fallback", "similar_plan", "heuristic")
+        and not metadata.get("partial")
+        and not metadata.get("truncated")
+        and not metadata.get("milestones")
+        and not metadata.get("phased")
+    )
+
+
+# Singleton instance
+similarity_index = SimilarityIndex()
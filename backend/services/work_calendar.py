@@ -0,0 +1,105 @@
+"""
+Business-day arithmetic with a weekmask and a sorted holiday array
+"""
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+from typing import Iterable, List, Optional, Set
+
+from dateutil import parser
+
+
+class WorkCalendar:
+    """
+    Working-day calendar answering offsets in O(log h) for h holidays
+
+    Days are numbered by their rank among working days since 0001-01-01:
+    weekdays are counted in closed form from the date ordinal (or every
+    day counts when weekends are worked), minus the holidays up to that
+    day found by binary search. Adding n working days is then a rank
+    lookup instead of a day-by-day walk.
+    """
+
+    def __init__(self, skip_weekends: bool = True, unavailable_dates: Iterable[date] = ()):
+        """
+        Args:
+            skip_weekends: Whether Saturdays and Sundays are non-working
+            unavailable_dates: Dates that are never worked
+        """
+        self.skip_weekends = skip_weekends
+        # Only holidays that fall on otherwise working days change any count
+        self.holidays: List[int] = sorted({
+            day.toordinal()
+            for day in unavailable_dates
+            if not (skip_weekends and day.weekday() >= 5)
+        })
+
+    @staticmethod
+    def parse_dates(date_strs: Optional[Iterable[str]]) -> Set[date]:
+        """Parse date strings, ignoring unparseable ones"""
+        dates = set()
+        for date_str in date_strs or ():
+            try:
+                dates.add(parser.parse(date_str).date())
+            except Exception:
+                pass  # Ignore unparseable dates
+        return dates
+
+    def add_working_days(self, start: datetime, days: int) -> datetime:
+        """
+        Date of the days-th working day after start (start itself never counts)
+
+        The time of day of start is preserved; days <= 0 returns start.
+
+        Args:
+            start: Starting date
+            days: Number of working days to add
+
+        Returns:
+            End date
+        """
+        if days <= 0:
+            return start
+        start_ordinal = start.toordinal()
+        target_rank = self._rank(start_ordinal) + days
+
+        # Smallest k with: the working day found by skipping the first k holidays
+        # comes before holiday k (true for every larger k once it holds)
+        low, high = 0, len(self.holidays)
+        while low < high:
+            k = (low + high) // 2
+            if self.holidays[k] > self._nth_workday(target_rank + k):
+                high = k
+            else:
+                low = k + 1
+        end_ordinal = self._nth_workday(target_rank + low)
+        return start + timedelta(days=end_ordinal - start_ordinal)
+
+    def working_days_between(self, start: datetime, end: datetime) -> int:
+        """Working days after start up to and including end (negative if end is earlier)"""
+        return self._rank(end.toordinal()) - self._rank(start.toordinal())
+
+    def is_working_day(self, day: date) -> bool:
+        """Whether day is worked under this calendar"""
+        if self.skip_weekends and day.weekday() >= 5:
+            return False
+        ordinal = day.toordinal()
+        index = bisect_right(self.holidays, ordinal)
+        return not (index and self.holidays[index - 1] == ordinal)
+
+    def _rank(self, ordinal: int) -> int:
+        """Number of working days on or before the given date ordinal"""
+        return self._weekdays_through(ordinal) - bisect_right(self.holidays, ordinal)
+
+    def _weekdays_through(self, ordinal: int) -> int:
+        """Number of weekmask days on or before the ordinal (ordinal 1 is a Monday)"""
+        if not self.skip_weekends:
+            return ordinal
+        weeks, remainder = divmod(ordinal, 7)
+        return weeks * 5 + min(remainder, 5)
+
+    def _nth_workday(self, n: int) -> int:
+        """Ordinal of the n-th weekmask day, ignoring holidays (inverse of _weekdays_through)"""
+        if not self.skip_weekends:
+            return n
+        weeks, remainder = divmod(n - 1, 5)
+        return weeks * 7 + remainder + 1
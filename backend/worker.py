@@ -0,0 +1,73 @@
+"""
+Standalone plan-generation worker
+
+Claims jobs queued by POST /api/plans/jobs from MongoDB and runs the LLM +
+scheduling pipeline, so generation capacity scales separately from the API.
+
+Run with: python worker.py
+"""
+import asyncio
+import logging
+import os
+import signal
+import socket
+import uuid
+
+from config import settings
+from database_mongo import connect_to_mongodb, close_mongodb_connection
+from services.calendar_registry import calendar_registry
+from services.job_queue import claim_next_job, process_job
+from services.similarity_index import similarity_index
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger("worker")
+
+
+async def run_worker() -> None:
+    """Claim and process jobs until SIGINT/SIGTERM"""
+    worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    await connect_to_mongodb()
+    await calendar_registry.load()
+    indexed = await similarity_index.load()
+    logger.info(f"✓ Worker {worker_id} started (concurrency {settings.WORKER_CONCURRENCY}, {indexed} indexed goals)")
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stopping.set)
+        except NotImplementedError:
+            pass  # Windows: rely on KeyboardInterrupt
+
+    slots = asyncio.Semaphore(settings.WORKER_CONCURRENCY)
+    running = set()
+
+    try:
+        while not stopping.is_set():
+            await slots.acquire()
+            job = await claim_next_job(worker_id)
+            if job is None:
+                slots.release()
+                try:
+                    await asyncio.wait_for(stopping.wait(), timeout=settings.JOB_POLL_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            logger.info(f"Claimed job {job.id} (attempt {job.attempts})")
+            task = asyncio.ensure_future(process_job(job))
+            running.add(task)
+            task.add_done_callback(running.discard)
+            task.add_done_callback(lambda _: slots.release())
+
+        # Let in-flight jobs finish before exiting
+        if running:
+            logger.info(f"Waiting for {len(running)} running job(s) to finish")
+            await asyncio.gather(*running, return_exceptions=True)
+    finally:
+        await close_mongodb_connection()
+        logger.info(f"✓ Worker {worker_id} stopped")
+
+
+if __name__ == "__main__":
+    asyncio.run(run_worker())
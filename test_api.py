@@ -233,3 +233,30 @@ def test_timeline_calculation():
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
+
+
+def test_create_plan_variants():
+    """Test generating several plan types for one goal in one request"""
+    request_data = {
+        "goal_text": "Organize a community charity run",
+        "plan_types": ["conservative", "aggressive"]
+    }
+    
+    response = client.post("/api/plans/variants", json=request_data)
+    assert response.status_code == 201
+    
+    data = response.json()
+    assert [plan["plan_type"] for plan in data] == ["conservative", "aggressive"]
+    assert len({plan["goal_id"] for plan in data}) == 1  # One shared goal
+    for plan in data:
+        assert len(plan["tasks"]) >= 1
+
+
+def test_create_plan_variants_validation():
+    """Test that a variants request needs at least one plan type"""
+    response = client.post("/api/plans/variants", json={
+        "goal_text": "Organize a community charity run",
+        "plan_types": []
+    })
+    assert response.status_code == 422
+
@@ -0,0 +1,848 @@
+"""
+LLM pipeline tests for Smart Task Planner (no database or LLM needed)
+Run with: pytest test_llm_services.py -v
+"""
+import asyncio
+import json
+import sys
+import os
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+# Add backend to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+
+from config import settings
+from models_mongo import JobStatus, PlanType
+from services import job_queue, phased_generation
+from schemas import Constraints, LLMPlanResponse, LLMTaskResponse
+from services.circuit_breaker import CircuitBreaker
+from services.heuristic_planner import PlannerMode, heuristic_planner, plan_without_llm
+from services.json_repair import repair_json_fragment, salvage_plan
+from services.json_stream import TaskStreamParser
+from services.llm_service import (
+    CassetteNotFoundError,
+    LLMProvider,
+    LLMService,
+    RecordingProvider,
+    ReplayProvider,
+)
+from services.plan_cache import PlanCache, constraints_fingerprint, make_cache_key
+from services.plan_regeneration import downstream_task_ids
+from services.quota import Priority, QuotaCoordinator
+from services.similarity_index import (
+    SimilarityIndex,
+    is_indexable,
+    jaccard,
+    minhash_signature,
+    tokenize_goal,
+)
+
+
+class ScriptedProvider(LLMProvider):
+    """Provider that answers with fixed text (or text(prompt)) after a delay"""
+
+    name = "scripted"
+    rate_limited = False
+
+    def __init__(self, text, delay=0.0, chunk_size=None):
+        self.text = text
+        self.delay = delay
+        self.chunk_size = chunk_size
+        self.prompts = []
+
+    def generate(self, prompt, generation_config):
+        self.prompts.append(prompt)
+        return self._answer(prompt)
+
+    async def generate_async(self, prompt, generation_config):
+        self.prompts.append(prompt)
+        await asyncio.sleep(self.delay)
+        return self._answer(prompt)
+
+    async def stream(self, prompt, generation_config, usage=None):
+        if not self.chunk_size:
+            yield await self.generate_async(prompt, generation_config)
+            return
+        self.prompts.append(prompt)
+        text = self._answer(prompt)
+        for start in range(0, len(text), self.chunk_size):
+            await asyncio.sleep(0)
+            yield text[start:start + self.chunk_size]
+
+    def _answer(self, prompt):
+        return self.text(prompt) if callable(self.text) else self.text
+
+
+@pytest.fixture(autouse=True)
+def no_shared_state(monkeypatch):
+    """Keep the plan cache and the MongoDB quota out of service tests"""
+    monkeypatch.setattr(settings, "LLM_CACHE_ENABLED", False)
+    monkeypatch.setattr(settings, "LLM_QUOTA_ENABLED", False)
+
+
+def _plan(*task_ids, summary="Plan"):
+    """Plan response whose tasks form a chain in the given order"""
+    tasks = [
+        LLMTaskResponse(
+            id=task_id,
+            title=f"Task {task_id}",
+            description=f"Do {task_id}",
+            duration_days=1,
+            depends_on=[task_ids[index - 1]] if index else []
+        )
+        for index, task_id in enumerate(task_ids)
+    ]
+    return LLMPlanResponse(tasks=tasks, plan_summary=summary)
+
+
+def _plan_json(*task_ids):
+    """Raw LLM response text for a chain of tasks"""
+    return _plan(*task_ids).model_dump_json(exclude={"metadata"})
+
+
+def test_async_generations_respect_the_concurrency_limit(monkeypatch):
+    """At most LLM_MAX_CONCURRENCY provider calls run at once; the rest wait their turn"""
+    monkeypatch.setattr(settings, "LLM_MAX_CONCURRENCY", 2)
+    running = [0, 0]  # Current, peak
+
+    class CountingProvider(ScriptedProvider):
+        async def generate_async(self, prompt, generation_config):
+            running[0] += 1
+            running[1] = max(running)
+            try:
+                return await super().generate_async(prompt, generation_config)
+            finally:
+                running[0] -= 1
+
+    service = LLMService(CountingProvider(_plan_json("T1"), delay=0.02))
+
+    async def scenario():
+        return await asyncio.gather(*[
+            service.generate_plan_async(f"Independent goal {index}", None, "moderate")
+            for index in range(5)
+        ])
+
+    responses = asyncio.run(scenario())
+    assert running[1] == 2
+    assert all(response.metadata["source"] == "scripted" for response in responses)
+
+
+def test_slow_generation_times_out_to_the_fallback_plan(monkeypatch):
+    """A call exceeding LLM_TIMEOUT_SECONDS is abandoned for the fallback plan"""
+    monkeypatch.setattr(settings, "LLM_TIMEOUT_SECONDS", 0.05)
+    service = LLMService(ScriptedProvider(_plan_json("T1"), delay=5))
+
+    started = time.perf_counter()
+    response = asyncio.run(service.generate_plan_async("Repaint the fence", None, "moderate"))
+    assert time.perf_counter() - started < 1
+    assert response.metadata["source"] == "fallback"
+    assert service.stats["timeouts"] == 1
+
+
+def test_cache_key_ignores_formatting_of_the_same_request():
+    """Case, whitespace, trailing punctuation and constraint order do not change the key"""
+    key = make_cache_key(
+        "Launch a mobile app",
+        Constraints(deadline="2026-12-01T09:30:00", unavailable_dates=["2026-11-02", "2026-11-01"]),
+        "moderate"
+    )
+    assert key == make_cache_key(
+        "  launch a   Mobile app!! ",
+        Constraints(deadline="2026-12-01", unavailable_dates=["2026-11-01", "2026-11-02", "2026-11-01"]),
+        PlanType.MODERATE
+    )
+    assert make_cache_key("Goal", {"deadline": datetime(2026, 12, 1, 18, 0)}, "moderate") == make_cache_key(
+        "Goal", {"deadline": "2026-12-01"}, "moderate"
+    )
+    assert make_cache_key("Goal", None, "moderate") == make_cache_key("goal", {"unavailable_dates": []}, "moderate")
+
+
+def test_cache_key_separates_requests_that_differ():
+    """Plan type, prompt mode, constraints and model each change the key"""
+    base = make_cache_key("Goal", None, "moderate")
+    assert base != make_cache_key("Goal", None, "aggressive")
+    assert base != make_cache_key("Goal", None, "moderate", "milestones")
+    assert base != make_cache_key("Goal", {"max_hours_per_day": 4}, "moderate")
+    assert base != make_cache_key("Goal", None, "moderate", model="another-model")
+
+
+def test_plan_cache_memory_tier_is_an_lru_of_copies():
+    """Memory hits return fresh copies and the least recently used entry is evicted"""
+    cache = PlanCache(max_entries=2, ttl_seconds=60)
+
+    async def scenario():
+        await cache.set("a", _plan("T1", "T2"))
+        await cache.set("b", _plan("T1"))
+        first = await cache.get("a")
+        first.tasks.clear()
+        assert len((await cache.get("a")).tasks) == 2
+        await cache.set("c", _plan("T1"))  # Evicts "b", the least recently used
+        return first
+
+    first = asyncio.run(scenario())
+    assert first.metadata == {"source": "cache", "cache_tier": "memory"}
+    assert list(cache._entries) == ["a", "c"]
+    assert cache.stats["memory_hits"] == 2
+
+
+def test_identical_concurrent_generations_share_one_call():
+    """Concurrent identical requests coalesce; different ones do not"""
+    provider = ScriptedProvider(_plan_json("T1", "T2"), delay=0.05)
+    service = LLMService(provider)
+
+    async def scenario():
+        return await asyncio.gather(
+            service.generate_plan_async("Write a novel", None, "moderate"),
+            service.generate_plan_async("write a NOVEL.", None, "moderate"),
+            service.generate_plan_async("Write a novel", None, "moderate"),
+            service.generate_plan_async("Write a novel", None, "aggressive"),
+        )
+
+    responses = asyncio.run(scenario())
+    assert len(provider.prompts) == 2
+    assert service.stats["coalesced"] == 2
+    assert not service._inflight
+    assert all(len(response.tasks) == 2 for response in responses)
+    responses[0].tasks.clear()  # Callers get independent copies
+    assert len(responses[1].tasks) == 2
+
+
+STREAMED_PLAN = (
+    '{"plan_summary": "Tricky {strings} and [brackets]", "tasks": ['
+    '{"id": "T1", "title": "Say \\"hi\\" {twice}", "description": "a ] b } c",'
+    ' "duration_days": 1, "depends_on": []},'
+    '{"id": "T2", "title": "Nested", "description": "d", "duration_days": 2,'
+    ' "depends_on": ["T1"], "notes": {"tasks": [{"id": "X"}]}}'
+    '], "metadata": {"tasks": [{"id": "Y"}]}}'
+)
+
+
+def test_stream_parser_is_independent_of_chunk_boundaries():
+    """Every split of the response yields the same top-level tasks"""
+    expected = [task["id"] for task in json.loads(STREAMED_PLAN)["tasks"]]
+    for split in range(len(STREAMED_PLAN) + 1):
+        parser = TaskStreamParser()
+        tasks = parser.feed(STREAMED_PLAN[:split]) + parser.feed(STREAMED_PLAN[split:])
+        assert [task["id"] for task in tasks] == expected
+        assert not parser.truncated
+
+    parser = TaskStreamParser()
+    tasks = [task for char in STREAMED_PLAN for task in parser.feed(char)]
+    assert tasks == json.loads(STREAMED_PLAN)["tasks"]
+
+
+def test_stream_parser_emits_tasks_as_soon_as_they_close():
+    """A task is emitted by the chunk holding its closing brace; an open one is held back"""
+    parser = TaskStreamParser()
+    first_end = STREAMED_PLAN.index('"T2"') - 1
+    assert [task["id"] for task in parser.feed(STREAMED_PLAN[:first_end])] == ["T1"]
+    assert parser.feed(STREAMED_PLAN[first_end:first_end + 40]) == []
+    assert parser.truncated
+
+
+def test_stream_plan_yields_tasks_before_the_plan():
+    """stream_plan sends each task event first and the complete plan last"""
+    provider = ScriptedProvider(_plan_json("T1", "T2", "T3"), chunk_size=7)
+    service = LLMService(provider)
+
+    async def scenario():
+        return [event async for event in service.stream_plan("Paint the house", None, "moderate")]
+
+    events = asyncio.run(scenario())
+    assert [kind for kind, _ in events] == ["task", "task", "task", "plan"]
+    assert [task.id for _, task in events[:3]] == ["T1", "T2", "T3"]
+    assert [task.id for task in events[-1][1].tasks] == ["T1", "T2", "T3"]
+
+
+def test_recorded_cassettes_replay_the_same_plan(tmp_path):
+    """A plan recorded through RecordingProvider replays offline, stream included"""
+    recorder = LLMService(RecordingProvider(ScriptedProvider(_plan_json("T1", "T2")), str(tmp_path)))
+    replayer = LLMService(ReplayProvider(str(tmp_path), latency_ms=0, jitter_ms=0))
+
+    async def scenario():
+        recorded = await recorder.generate_plan_async("Plant a garden", None, "moderate")
+        replayed = await replayer.generate_plan_async("Plant a garden", None, "moderate")
+        streamed = [event async for event in replayer.stream_plan("Plant a garden", None, "moderate")]
+        return recorded, replayed, streamed
+
+    recorded, replayed, streamed = asyncio.run(scenario())
+    assert len(list(tmp_path.iterdir())) == 1
+    assert replayed.tasks == recorded.tasks
+    assert streamed[-1][1].tasks == recorded.tasks
+    with pytest.raises(CassetteNotFoundError):
+        replayer.provider.generate("A prompt that was never recorded", {})
+
+
+def test_incomplete_provider_fails_when_created():
+    """LLMProvider subclasses must implement both generate methods"""
+    class SyncOnlyProvider(LLMProvider):
+        def generate(self, prompt, generation_config):
+            return ""
+
+    with pytest.raises(TypeError):
+        SyncOnlyProvider()
+
+
+def test_batch_prompts_hold_only_as_many_goals_as_fit_the_output_budget(monkeypatch):
+    """Goals per batch prompt shrink until their expected plans fit LLM_MAX_OUTPUT_TOKENS"""
+    service = LLMService(ScriptedProvider(""))
+    monkeypatch.setattr(settings, "LLM_BATCH_SIZE", 4)
+    monkeypatch.setattr(settings, "LLM_MAX_OUTPUT_TOKENS", 1000000)
+    assert service._batch_goals_per_call() == 4
+    monkeypatch.setattr(settings, "LLM_MAX_OUTPUT_TOKENS", service._output_budget(service._expected_tasks()) * 2)
+    assert service._batch_goals_per_call() == 2
+    monkeypatch.setattr(settings, "LLM_ADAPTIVE_OUTPUT_TOKENS", False)
+    assert service._batch_goals_per_call() == 1
+
+
+def test_batch_keeps_complete_sections_and_retries_the_rest(monkeypatch):
+    """Only goals whose section is invalid or cut off are generated again on their own"""
+    monkeypatch.setattr(settings, "LLM_BATCH_SIZE", 3)
+    monkeypatch.setattr(settings, "LLM_MAX_OUTPUT_TOKENS", 1000000)
+    section = json.loads(_plan_json("T1", "T2"))
+    batch = json.dumps({"plans": [
+        {"goal_index": 0, **section},
+        {"goal_index": 1, "tasks": "not a list", "plan_summary": "Broken"},
+        {"goal_index": 2, **section},
+    ]})
+    cut_off = batch[:batch.rindex('"T2"')]
+
+    def answer(prompt):
+        return cut_off if "independent goals" in prompt else _plan_json("T1")
+
+    provider = ScriptedProvider(answer)
+    service = LLMService(provider)
+    goals = [(f"Goal number {index}", None, "moderate") for index in range(3)]
+    responses = asyncio.run(service.generate_plans_batch(goals))
+
+    assert len(responses[0].tasks) == 2 and responses[0].metadata["batched"]
+    assert [len(response.tasks) for response in responses[1:]] == [1, 1]
+    assert service.stats["batch_retries"] == 2
+    assert len(provider.prompts) == 3
+
+
+def test_circuit_breaker_opens_probes_and_closes(monkeypatch):
+    """closed -> open on a bad window, half-open after the timeout, closed on a good probe"""
+    clock = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: clock[0])
+    breaker = CircuitBreaker(
+        window_size=4, min_calls=4, failure_rate=0.5, slow_call_seconds=1.0, reset_timeout_seconds=30
+    )
+
+    breaker.record_success(0.1)
+    breaker.record_failure()
+    breaker.record_success(2.0)  # Slow calls count as bad
+    assert breaker.state == CircuitBreaker.CLOSED  # Fewer than min_calls outcomes
+    breaker.record_success(0.1)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+
+    clock[0] += 30
+    assert breaker.allow_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow_request()  # Only one probe at a time
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock[0] += 30
+    assert breaker.allow_request()
+    breaker.record_success(0.1)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow_request() and breaker.allow_request()
+    assert breaker.get_stats()["trips"] == 2
+
+
+def test_open_circuit_skips_the_provider():
+    """While the circuit is open, plans come from the fallback without calling the provider"""
+    provider = ScriptedProvider(_plan_json("T1"))
+    service = LLMService(provider)
+    service.breaker.state = CircuitBreaker.OPEN
+    service.breaker._opened_at = time.monotonic()
+
+    response = asyncio.run(service.generate_plan_async("Learn to juggle", None, "moderate"))
+    assert not provider.prompts
+    assert service.stats["short_circuited"] == 1
+    assert response.metadata["source"] != provider.name
+
+
+def test_slow_call_is_hedged(monkeypatch):
+    """A call slower than the hedge percentile is duplicated and the faster answer wins"""
+    monkeypatch.setattr(settings, "LLM_HEDGE_ENABLED", True)
+    monkeypatch.setattr(settings, "LLM_HEDGE_MIN_SAMPLES", 1)
+    delays = [1.0, 0.0]
+
+    class SlowFirstProvider(ScriptedProvider):
+        async def generate_async(self, prompt, generation_config):
+            self.prompts.append(prompt)
+            await asyncio.sleep(delays[len(self.prompts) - 1])
+            return self.text
+
+    provider = SlowFirstProvider(_plan_json("T1", "T2"))
+    service = LLMService(provider)
+    service.latency.record(0.01)
+
+    started = time.perf_counter()
+    response = asyncio.run(service.generate_plan_async("Bake bread", None, "moderate"))
+    assert time.perf_counter() - started < 0.5
+    assert len(response.tasks) == 2
+    assert service.stats["hedges"] == service.stats["hedge_wins"] == 1
+
+
+def test_salvage_keeps_complete_tasks_of_truncated_json():
+    """Complete, valid tasks survive truncation, trailing commas and raw newlines"""
+    text = (
+        '{"plan_summary": "Move house", "tasks": ['
+        '{"id": "T1", "title": "Pack", "description": "Line one\nline two", "duration_days": 2, "depends_on": [],},'
+        '{"id": "T2", "title": "Invalid", "description": "No duration"},'
+        '{"id": "T1", "title": "Duplicate", "description": "d", "duration_days": 1},'
+        '{"id": "T3", "title": "Move", "description": "d", "duration_days": 1, "depends_on": ["T1"]},'
+        '{"id": "T4", "title": "Unpa'
+    )
+    tasks, plan_summary, truncated = salvage_plan(text)
+    assert [task.id for task in tasks] == ["T1", "T3"]
+    assert tasks[0].description == "Line one\nline two"
+    assert plan_summary == "Move house"
+    assert truncated
+    assert repair_json_fragment('{"a": [1, 2,],}') == {"a": [1, 2]}
+    assert repair_json_fragment('{"a": ') is None
+
+
+def test_truncated_response_is_continued_after_the_last_good_task():
+    """A cut-off plan is completed by a continuation call instead of a full regeneration"""
+    first = _plan_json("T1", "T2", "T3")
+    first = first[:first.index('{"id":"T3"') + 12]
+
+    def answer(prompt):
+        if "was cut off after task T2" in prompt:
+            return json.dumps({"tasks": [
+                {"id": "T3", "title": "Finish", "description": "d", "duration_days": 1, "depends_on": ["T2"]},
+            ], "plan_summary": "Done"})
+        return first
+
+    provider = ScriptedProvider(answer)
+    service = LLMService(provider)
+    response = asyncio.run(service.generate_plan_async("Build a shed", None, "moderate"))
+
+    assert [task.id for task in response.tasks] == ["T1", "T2", "T3"]
+    assert response.metadata["repaired"] and not response.metadata["truncated"]
+    assert response.metadata["salvaged_tasks"] == 2
+    assert response.metadata["usage"]["calls"] == 2
+
+
+def _run_job(monkeypatch, runner, attempts=1, lease_kept=True):
+    """Process a fake claimed job and return the job updates it wrote"""
+    updates = []
+
+    async def update_job(job, **fields):
+        updates.append(fields)
+        return lease_kept
+
+    async def renew_lease(job):
+        if lease_kept:
+            await asyncio.Event().wait()
+        await asyncio.sleep(0.01)
+
+    monkeypatch.setattr(job_queue, "update_job", update_job)
+    monkeypatch.setattr(job_queue, "renew_lease", renew_lease)
+    monkeypatch.setattr(job_queue, "_run_plan_job", runner)
+    job = SimpleNamespace(id="job1", job_type="generate_plan", attempts=attempts, max_attempts=3)
+    asyncio.run(job_queue.process_job(job))
+    return updates
+
+
+def test_completed_job_records_its_plan(monkeypatch):
+    """A successful run completes the job with the plan id"""
+    async def runner(job):
+        return "plan1"
+
+    updates = _run_job(monkeypatch, runner)
+    assert updates[-1]["status"] == JobStatus.COMPLETED
+    assert updates[-1]["plan_id"] == "plan1"
+
+
+def test_failed_job_is_retried_until_its_last_attempt(monkeypatch):
+    """Errors requeue the job while attempts remain and fail it on the last one"""
+    async def runner(job):
+        raise RuntimeError("boom")
+
+    assert _run_job(monkeypatch, runner, attempts=1)[-1]["status"] == JobStatus.QUEUED
+    final = _run_job(monkeypatch, runner, attempts=3)[-1]
+    assert final["status"] == JobStatus.FAILED
+    assert final["error"] == "boom"
+
+
+def test_lost_lease_cancels_the_work(monkeypatch):
+    """Once another worker owns the job, the work stops and nothing more is written"""
+    cancelled = []
+
+    async def runner(job):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(job.id)
+            raise
+
+    assert _run_job(monkeypatch, runner, lease_kept=False) == []
+    assert cancelled == ["job1"]
+
+
+def _similarity_index(*goals):
+    """Index of (plan_id, goal_text, plan_type[, constraints]) entries, built without MongoDB"""
+    index = SimilarityIndex()
+    for plan_id, goal_text, plan_type, *constraints in goals:
+        tokens = tokenize_goal(goal_text)
+        index._index_entry(SimpleNamespace(
+            plan_id=plan_id,
+            goal_id=f"goal-{plan_id}",
+            plan_type=plan_type,
+            constraints_key=constraints_fingerprint(constraints[0] if constraints else None),
+            tokens=sorted(tokens),
+            signature=minhash_signature(tokens)
+        ))
+    return index
+
+
+def test_goal_tokens_fold_paraphrases():
+    """Stopwords, number words, synonyms and plurals do not change the tokens"""
+    assert tokenize_goal("Ship the new mobile application in three weeks") == tokenize_goal(
+        "Launch a mobile app within 3 week"
+    )
+    assert jaccard(set(), {"app"}) == 0.0
+
+
+def test_similar_goal_is_reused_only_above_the_threshold(monkeypatch):
+    """Paraphrases of an indexed goal match; weaker overlaps and other plan types do not"""
+    monkeypatch.setattr(settings, "SIMILARITY_THRESHOLD", 0.8)
+    index = _similarity_index(
+        ("p1", "Launch a mobile app for our bakery in three weeks", "moderate"),
+        ("p2", "Launch a mobile app for our bakery in three weeks", "aggressive"),
+        ("p3", "Write a fantasy novel", "moderate"),
+    )
+
+    plan_id, goal_id, score = index.find_similar("Ship the bakery mobile application within 3 weeks", "moderate")
+    assert (plan_id, goal_id, score) == ("p1", "goal-p1", 1.0)
+    assert index.find_similar("Launch a mobile app for our bakery", "moderate") is None  # Jaccard 4/6
+    assert index.find_similar("Write a fantasy novel", "conservative") is None
+    monkeypatch.setattr(settings, "SIMILARITY_THRESHOLD", 0.6)
+    assert index.find_similar("Launch a mobile app for our bakery", "moderate")[0] == "p1"
+
+    index._unindex("p1")
+    assert index.find_similar("Ship the bakery mobile application within 3 weeks", "moderate") is None
+    assert not any("p1" in bucket for bucket in index._buckets.values())
+
+
+def test_similar_goal_must_have_the_same_constraints():
+    """A plan sized for one deadline is not reused for another"""
+    index = _similarity_index(
+        ("p1", "Launch a mobile app for our bakery", "moderate", Constraints(deadline="2026-12-01").model_dump()),
+    )
+    goal_text = "Launch a mobile app for our bakery"
+    assert index.find_similar(goal_text, "moderate", Constraints(deadline="2026-12-01"))[0] == "p1"
+    assert index.find_similar(goal_text, "moderate", Constraints(deadline="2027-06-01")) is None
+    assert index.find_similar(goal_text, "moderate") is None
+
+
+def test_only_complete_generated_plans_are_indexed():
+    """Fallback, reused, heuristic, partial, truncated, outline and phased plans are never offered for reuse"""
+    assert is_indexable(_plan("T1"))
+    for metadata in (
+        {"source": "fallback"},
+        {"source": "similar_plan"},
+        {"source": "heuristic"},
+        {"partial": True},
+        {"truncated": True},
+        {"milestones": True},
+        {"phased": True},
+    ):
+        assert not is_indexable(_plan("T1").model_copy(update={"metadata": metadata}))
+
+
+def test_regeneration_region_is_the_task_and_its_dependents():
+    """The region holds the root and every transitive dependent, nothing upstream or beside it"""
+    tasks = [
+        SimpleNamespace(task_id="T1", depends_on=[]),
+        SimpleNamespace(task_id="T2", depends_on=["T1"]),
+        SimpleNamespace(task_id="T3", depends_on=["T2"]),
+        SimpleNamespace(task_id="T4", depends_on=["T1", "T3"]),
+        SimpleNamespace(task_id="T5", depends_on=["T1"]),
+    ]
+    assert downstream_task_ids(tasks, "T2") == {"T2", "T3", "T4"}
+    assert downstream_task_ids(tasks, "T5") == {"T5"}
+
+
+def test_regeneration_prompt_describes_the_region():
+    """The regeneration prompt lists the replaced tasks, frozen prerequisites and instructions"""
+    provider = ScriptedProvider(_plan_json("T2", "N1"))
+    service = LLMService(provider)
+    response = asyncio.run(service.regenerate_subgraph_async(
+        "Renovate the kitchen",
+        "moderate",
+        region_tasks=[{"id": "T2", "title": "Tile walls", "description": "d", "duration_days": 2, "depends_on": ["T1"]}],
+        upstream_tasks=[{"id": "T1", "title": "Remove cabinets", "latest_finish": "2026-11-02"}],
+        instructions="Use cheaper tiles"
+    ))
+    prompt = provider.prompts[0]
+    assert "T1: Remove cabinets (finishes 2026-11-02)" in prompt
+    assert "T2: Tile walls" in prompt and "Use cheaper tiles" in prompt
+    assert [task.id for task in response.tasks] == ["T2", "N1"]
+
+
+def _quota(tokens):
+    """Coordinator whose shared bucket holds the given number of tokens"""
+    quota = QuotaCoordinator("test", requests_per_minute=60, burst=1)
+    bucket = {"tokens": tokens}
+
+    async def take_token():
+        await asyncio.sleep(0)
+        if bucket["tokens"] >= 1:
+            bucket["tokens"] -= 1
+            return True, 0.0
+        return False, 0.01
+
+    quota._take_token = take_token
+    return quota, bucket
+
+
+def test_quota_serves_waiters_in_priority_order():
+    """Queued interactive calls get tokens before bulk, and bulk before background"""
+    quota, bucket = _quota(tokens=0)
+    served = []
+
+    async def caller(name, priority):
+        await quota.acquire(priority)
+        served.append(name)
+
+    async def scenario():
+        waiters = [
+            asyncio.ensure_future(caller("background", Priority.BACKGROUND)),
+            asyncio.ensure_future(caller("bulk", Priority.BULK)),
+            asyncio.ensure_future(caller("interactive", Priority.INTERACTIVE)),
+            asyncio.ensure_future(caller("interactive-2", Priority.INTERACTIVE)),
+        ]
+        await asyncio.sleep(0.02)
+        assert quota.get_stats()["waiting"] == {"interactive": 2, "bulk": 1, "background": 1}
+        bucket["tokens"] = 4
+        await asyncio.gather(*waiters)
+
+    asyncio.run(scenario())
+    assert served == ["interactive", "interactive-2", "bulk", "background"]
+    assert quota.stats["granted"] == 4
+
+
+def test_try_acquire_never_waits_or_jumps_the_queue():
+    """try_acquire takes a free token, and refuses when tokens run out or callers are queued"""
+    quota, bucket = _quota(tokens=1)
+
+    async def scenario():
+        assert await quota.try_acquire()
+        assert not await quota.try_acquire()
+        waiter = asyncio.ensure_future(quota.acquire(Priority.BACKGROUND))
+        await asyncio.sleep(0)
+        bucket["tokens"] = 1
+        assert not await quota.try_acquire()  # The queued caller is served first
+        await waiter
+
+    asyncio.run(scenario())
+    assert bucket["tokens"] == 0
+
+
+def test_hedge_is_skipped_without_a_free_quota_token(monkeypatch):
+    """A hedge needs its own quota token; without one only the primary call runs"""
+    monkeypatch.setattr(settings, "LLM_QUOTA_ENABLED", True)
+    monkeypatch.setattr(settings, "LLM_HEDGE_ENABLED", True)
+    monkeypatch.setattr(settings, "LLM_HEDGE_MIN_SAMPLES", 1)
+    provider = ScriptedProvider(_plan_json("T1"), delay=0.05)
+    provider.rate_limited = True
+    service = LLMService(provider)
+    service.quota, _ = _quota(tokens=1)
+    service.latency.record(0.001)
+
+    response = asyncio.run(service.generate_plan_async("Train for a marathon", None, "moderate"))
+    assert len(response.tasks) == 1
+    assert len(provider.prompts) == 1
+    assert service.stats["hedges"] == 0 and service.stats["hedges_skipped"] == 1
+
+
+def test_milestone_outline_and_expansion_prompts():
+    """Outlines ask for milestones only; expansion asks for one milestone's subtasks"""
+    provider = ScriptedProvider(_plan_json("M1", "M2", "M3"))
+    service = LLMService(provider)
+
+    async def scenario():
+        outline = await service.generate_plan_async("Open a cafe", None, "moderate", milestones_only=True)
+        subtasks = await service.expand_milestone_async(
+            "Open a cafe",
+            "moderate",
+            milestone={"id": "M2", "title": "Fit out the shop", "description": "d", "duration_days": 20},
+            other_milestones=[{"id": "M1", "title": "Find a location"}],
+            max_subtasks=4
+        )
+        return outline, subtasks
+
+    outline, subtasks = asyncio.run(scenario())
+    assert outline.metadata["milestones"]
+    assert "OUTLINE MODE" in provider.prompts[0]
+    assert f"3-{max(settings.MAX_TASKS_PER_PLAN // 2, 3)} major milestones" in provider.prompts[0]
+    assert "Fit out the shop" in provider.prompts[1] and "Return 2-4 concrete subtasks" in provider.prompts[1]
+    assert "milestones" not in subtasks.metadata
+
+
+def test_phased_plan_links_phase_sinks_to_the_next_phase_sources(monkeypatch):
+    """Phase subtasks are renumbered and wired through their first and last tasks"""
+    def task(task_id, *depends_on):
+        return LLMTaskResponse(
+            id=task_id, title=task_id, description="d", duration_days=1, depends_on=list(depends_on)
+        )
+
+    outline = LLMPlanResponse(
+        tasks=[task("M1"), task("M2", "M1"), task("M3", "M1"), task("M4", "M2", "M3")],
+        plan_summary="Four phases"
+    )
+    subtasks = {
+        "M1": [task("S1"), task("S2", "S1")],
+        "M2": [task("S1"), task("S2")],  # Two parallel tasks: two sources and two sinks
+        "M4": [task("S1")],
+    }
+
+    async def generate_plan_async(**kwargs):
+        return outline.model_copy(deep=True)
+
+    async def expand_milestone_async(milestone, **kwargs):
+        if milestone["id"] not in subtasks:
+            raise RuntimeError("phase failed")
+        return LLMPlanResponse(tasks=subtasks[milestone["id"]], plan_summary="Phase")
+
+    service = phased_generation.llm_service
+    monkeypatch.setattr(service, "generate_plan_async", generate_plan_async)
+    monkeypatch.setattr(service, "expand_milestone_async", expand_milestone_async)
+    response = asyncio.run(phased_generation.generate_phased_plan("Build a house"))
+
+    assert {task.id: task.depends_on for task in response.tasks} == {
+        "T1": [],
+        "T2": ["T1"],
+        "T3": ["T2"],
+        "T4": ["T2"],
+        "T5": ["T2"],  # Failed phase M3, kept as one task
+        "T6": ["T3", "T4", "T5"],
+    }
+    assert response.metadata["phases"] == 4 and response.metadata["failed_phases"] == 1
+
+
+def test_cyclic_phase_is_linked_through_its_first_and_last_tasks(monkeypatch):
+    """A phase whose subtasks form a cycle still waits for and feeds its neighbours"""
+    def task(task_id, *depends_on):
+        return LLMTaskResponse(
+            id=task_id, title=task_id, description="d", duration_days=1, depends_on=list(depends_on)
+        )
+
+    outline = LLMPlanResponse(tasks=[task("M1"), task("M2", "M1"), task("M3", "M2")], plan_summary="Three phases")
+    subtasks = {
+        "M1": [task("S1")],
+        "M2": [task("S1", "S2"), task("S2", "S1")],
+        "M3": [task("S1")],
+    }
+
+    async def generate_plan_async(**kwargs):
+        return outline.model_copy(deep=True)
+
+    async def expand_milestone_async(milestone, **kwargs):
+        return LLMPlanResponse(tasks=subtasks[milestone["id"]], plan_summary="Phase")
+
+    service = phased_generation.llm_service
+    monkeypatch.setattr(service, "generate_plan_async", generate_plan_async)
+    monkeypatch.setattr(service, "expand_milestone_async", expand_milestone_async)
+    response = asyncio.run(phased_generation.generate_phased_plan("Build a house"))
+
+    assert {task.id: task.depends_on for task in response.tasks} == {
+        "T1": [],
+        "T2": ["T3", "T1"],
+        "T3": ["T2"],
+        "T4": ["T3"],
+    }
+
+
+def _chain_length(tasks):
+    """Days along the longest dependency chain of a plan (tasks in dependency order)"""
+    finish = {}
+    for task in tasks:
+        finish[task.id] = max((finish[dep_id] for dep_id in task.depends_on), default=0) + task.duration_days
+    return max(finish.values())
+
+
+def test_heuristic_plan_fits_the_goal_category_and_horizon():
+    """Template plans are well-formed and stretched to the horizon stated in the goal"""
+    category, confidence = heuristic_planner.classify("Build a mobile app for expense tracking")
+    assert category.name == "software" and confidence >= 0.75
+    assert heuristic_planner.classify("qwerty zxcv")[0].name == "generic"
+
+    plan = heuristic_planner.generate_plan("I want to build a mobile app for expense tracking in 8 weeks")
+    ids = [task.id for task in plan.tasks]
+    assert ids == [f"T{index + 1}" for index in range(len(ids))]
+    for index, task in enumerate(plan.tasks):
+        assert all(dep_id in ids[:index] for dep_id in task.depends_on)
+    assert abs(_chain_length(plan.tasks) - 40) <= len(plan.tasks)  # 8 weeks of working days
+    assert "build a mobile app for expense tracking in 8 weeks" in plan.tasks[0].description
+    assert plan.metadata["source"] == "heuristic"
+
+    aggressive = heuristic_planner.generate_plan("Build a mobile app", plan_type="aggressive")
+    conservative = heuristic_planner.generate_plan("Build a mobile app", plan_type="conservative")
+    assert _chain_length(aggressive.tasks) < _chain_length(conservative.tasks)
+
+
+def test_planner_mode_routes_goals_away_from_the_llm(monkeypatch):
+    """llm never uses templates, heuristic always does, auto only for confident matches"""
+    monkeypatch.setattr(settings, "HEURISTIC_CONFIDENCE_THRESHOLD", 0.75)
+    confident = "Build a mobile app for expense tracking"
+    vague = "Write a song about turtles"
+    assert plan_without_llm(confident, None, "moderate", PlannerMode.LLM) is None
+    assert plan_without_llm(vague, None, "moderate", PlannerMode.HEURISTIC) is not None
+    assert plan_without_llm(confident, None, "moderate", PlannerMode.AUTO) is not None
+    assert plan_without_llm(vague, None, "moderate", PlannerMode.AUTO) is None
+
+
+def test_output_budget_scales_with_expected_tasks_within_bounds(monkeypatch):
+    """The budget grows with the expected task count between the configured limits"""
+    monkeypatch.setattr(settings, "LLM_MIN_OUTPUT_TOKENS", 1024)
+    monkeypatch.setattr(settings, "LLM_MAX_OUTPUT_TOKENS", 8192)
+    monkeypatch.setattr(settings, "LLM_OUTPUT_TOKEN_HEADROOM", 1.5)
+    service = LLMService(ScriptedProvider(""))
+    service.output_tokens_per_task = 100.0
+
+    assert service._output_budget(1) == 1024
+    assert service._output_budget(20) == 20 * 150 + 256
+    assert service._output_budget(500) == 8192
+    assert service._output_budget(None) == 8192
+    monkeypatch.setattr(settings, "LLM_ADAPTIVE_OUTPUT_TOKENS", False)
+    assert service._output_budget(20) == 8192
+
+
+def test_output_budget_follows_the_request(monkeypatch):
+    """Full plans use the observed plan size; expansions use their max_subtasks"""
+    monkeypatch.setattr(settings, "LLM_MIN_OUTPUT_TOKENS", 1)
+    provider = ScriptedProvider(_plan_json("T1", "T2"))
+    service = LLMService(provider)
+    assert service._expected_tasks() == settings.MAX_TASKS_PER_PLAN
+
+    async def scenario():
+        plans = [
+            await service.generate_plan_async(f"Plan number {index}", None, "moderate")
+            for index in range(10)
+        ]
+        expected_budget = service._output_budget(3)
+        expansion = await service.expand_milestone_async(
+            "Plan", "moderate", {"id": "M1", "title": "M", "description": "d", "duration_days": 5}, [], max_subtasks=3
+        )
+        return plans, expansion, expected_budget
+
+    plans, expansion, expected_budget = asyncio.run(scenario())
+    budgets = [plan.metadata["usage"]["max_output_tokens"] for plan in plans]
+    assert budgets == sorted(budgets, reverse=True) and budgets[-1] < budgets[0]
+    assert service._expected_tasks() < settings.MAX_TASKS_PER_PLAN
+    assert service._expected_tasks("milestones") == service._task_cap("milestones")  # No outlines seen yet
+    assert expansion.metadata["usage"]["max_output_tokens"] == expected_budget
+    assert plans[0].metadata["usage"]["calls"] == 1
+    assert "plan_mode" not in plans[0].metadata["usage"]
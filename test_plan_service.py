@@ -0,0 +1,489 @@
+"""
+Scheduler tests for Smart Task Planner (no database or LLM needed)
+Run with: pytest test_plan_service.py -v
+"""
+import random
+import sys
+import os
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+
+# Add backend to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+
+from schemas import Constraints, TaskResponse
+from services.calendar_registry import CalendarRegistry
+from services.plan_service import PlanGenerator
+from services.resource_leveling import level_schedule, schedule_float
+from services.schedule_risk import simulate
+from services.work_calendar import WorkCalendar
+
+
+def reference_add_working_days(start_date, days, skip_weekends, unavailable_dates):
+    """Day-by-day walk the scheduler used before WorkCalendar"""
+    current_date = start_date
+    days_added = 0
+    while days_added < days:
+        current_date += timedelta(days=1)
+        if skip_weekends and current_date.weekday() >= 5:
+            continue
+        if current_date.date() in unavailable_dates:
+            continue
+        days_added += 1
+    return current_date
+
+
+def test_work_calendar_matches_day_by_day_walk():
+    """Business-day offsets match the day-by-day walk for random calendars"""
+    rng = random.Random(42)
+    base = datetime(2025, 1, 1, 9, 30)
+    for _ in range(300):
+        skip_weekends = rng.random() < 0.7
+        unavailable = {
+            (base + timedelta(days=rng.randrange(0, 400))).date()
+            for _ in range(rng.randrange(0, 80))
+        }
+        # Runs of consecutive unavailable days
+        run_start = base + timedelta(days=rng.randrange(0, 300))
+        unavailable |= {(run_start + timedelta(days=i)).date() for i in range(rng.randrange(0, 20))}
+        calendar = WorkCalendar(skip_weekends, unavailable)
+        for _ in range(20):
+            start = base + timedelta(days=rng.randrange(0, 300))
+            days = rng.randrange(-1, 60)
+            assert calendar.add_working_days(start, days) == reference_add_working_days(
+                start, days, skip_weekends, unavailable
+            )
+
+
+def _random_plan(rng, size):
+    """Random DAG of TaskResponse objects with T1..Tn ids"""
+    tasks = []
+    for index in range(size):
+        candidates = [f"T{i + 1}" for i in range(index)]
+        depends_on = rng.sample(candidates, min(len(candidates), rng.randrange(0, 4)))
+        tasks.append(TaskResponse(
+            id=f"T{index + 1}",
+            title=f"Task {index + 1}",
+            description="d",
+            duration_days=rng.randrange(1, 8),
+            depends_on=depends_on
+        ))
+    return tasks
+
+
+def test_assign_dates_unchanged():
+    """assign_dates produces the same dates as the day-by-day scheduler"""
+    rng = random.Random(7)
+    start = datetime(2025, 3, 7, 14, 0)
+    for _ in range(50):
+        holidays = sorted({
+            (start + timedelta(days=rng.randrange(0, 120))).strftime('%Y-%m-%d')
+            for _ in range(rng.randrange(0, 15))
+        })
+        constraints = Constraints(
+            max_hours_per_day=None,  # No resource leveling
+            no_work_on_weekends=rng.random() < 0.7,
+            unavailable_dates=holidays + ["not a date"]
+        )
+        tasks = PlanGenerator.assign_dates(_random_plan(rng, rng.randrange(1, 25)), constraints, start)
+
+        unavailable = {datetime.strptime(day, '%Y-%m-%d').date() for day in holidays}
+        finish = {}
+        for task_id in PlanGenerator._topological_sort(tasks):
+            task = next(task for task in tasks if task.id == task_id)
+            earliest_start = max([start] + [finish[dep_id] for dep_id in task.depends_on])
+            finish[task_id] = reference_add_working_days(
+                earliest_start, task.duration_days, constraints.no_work_on_weekends, unavailable
+            )
+            assert task.earliest_start == earliest_start.strftime('%Y-%m-%d')
+            assert task.latest_finish == finish[task_id].strftime('%Y-%m-%d')
+
+
+def test_validate_constraints_deadline_warning():
+    """A deadline before the computed finish produces a warning"""
+    tasks = [
+        TaskResponse(id="T1", title="A", description="d", duration_days=5),
+        TaskResponse(id="T2", title="B", description="d", duration_days=5, depends_on=["T1"]),
+    ]
+    constraints = Constraints(deadline="2025-01-08", unavailable_dates=["2025-01-06"])
+    is_valid, warnings = PlanGenerator.validate_constraints(tasks, constraints, datetime(2025, 1, 1))
+    assert not is_valid
+    assert "Expected finish: 2025-01-16" in warnings[0]
+
+
+def _random_graph(rng, size):
+    """Random task graph with wide levels, unknown references and sometimes cycles"""
+    tasks = []
+    for index in range(size):
+        depends_on = []
+        if index and rng.random() < 0.8:
+            depends_on = [f"T{rng.randrange(index) + 1}" for _ in range(rng.randrange(1, 4))]
+            if rng.random() < 0.1:
+                depends_on.append("T999999")  # Dangling reference
+        tasks.append(TaskResponse(
+            id=f"T{index + 1}",
+            title=f"Task {index + 1}",
+            description="d",
+            duration_days=rng.randrange(1, 10),
+            depends_on=depends_on
+        ))
+    if size > 2 and rng.random() < 0.3:
+        # Back edge creating a cycle
+        tasks[rng.randrange(size // 2)].depends_on.append(f"T{rng.randrange(size // 2, size) + 1}")
+    rng.shuffle(tasks)
+    return tasks
+
+
+def test_topological_sort_matches_reference():
+    """The NumPy engine releases tasks in the same order as Kahn's algorithm"""
+    rng = random.Random(11)
+    for _ in range(200):
+        tasks = _random_graph(rng, rng.randrange(1, 120))
+        assert PlanGenerator._topological_sort(tasks) == PlanGenerator._topological_sort_reference(tasks)
+
+
+def test_critical_path_matches_reference():
+    """The NumPy engine finds the same critical path, including tie-breaks"""
+    rng = random.Random(12)
+    for _ in range(200):
+        tasks = _random_graph(rng, rng.randrange(1, 120))
+        assert PlanGenerator.calculate_critical_path(tasks) == PlanGenerator._calculate_critical_path_reference(tasks)
+    assert PlanGenerator.calculate_critical_path([]) == []
+
+
+def reference_slack(tasks):
+    """Textbook CPM on dicts: late finish, total float and free float per task"""
+    order = PlanGenerator._topological_sort_reference(tasks)
+    task_dict = {task.id: task for task in tasks}
+    successors = {task_id: [] for task_id in order}
+    early_start, early_finish = {}, {}
+    for task_id in order:
+        deps = [dep_id for dep_id in task_dict[task_id].depends_on if dep_id in task_dict]
+        for dep_id in deps:
+            successors[dep_id].append(task_id)
+        early_start[task_id] = max((early_finish[dep_id] for dep_id in deps), default=0)
+        early_finish[task_id] = early_start[task_id] + task_dict[task_id].duration_days
+    project_end = max(early_finish.values(), default=0)
+    late_finish = {}
+    for task_id in reversed(order):
+        late_finish[task_id] = min(
+            (late_finish[succ_id] - task_dict[succ_id].duration_days for succ_id in successors[task_id]),
+            default=project_end
+        )
+    return {
+        task_id: (
+            late_finish[task_id] - early_finish[task_id],
+            min((early_start[succ_id] for succ_id in successors[task_id]), default=project_end) - early_finish[task_id]
+        )
+        for task_id in order
+    }, early_start, early_finish, project_end
+
+
+def test_slack_matches_reference():
+    """Total and free float match a textbook CPM pass; critical paths are valid zero-float chains"""
+    rng = random.Random(13)
+    for _ in range(200):
+        tasks = _random_graph(rng, rng.randrange(1, 80))
+        expected, early_start, early_finish, project_end = reference_slack(tasks)
+        slack, critical_paths = PlanGenerator.calculate_slack(tasks, max_paths=50)
+        assert {task_id: (values["total_float_days"], values["free_float_days"]) for task_id, values in slack.items()} == expected
+        assert PlanGenerator.calculate_critical_path(tasks) in critical_paths or len(critical_paths) == 50
+        for path in critical_paths:
+            assert early_start[path[0]] == 0 and early_finish[path[-1]] == project_end
+            assert all(slack[task_id]["is_critical"] for task_id in path)
+            assert all(early_finish[a] == early_start[b] for a, b in zip(path, path[1:]))
+
+
+def test_slack_reports_every_critical_path():
+    """Parallel chains of equal length are all critical; late dates follow the working calendar"""
+    tasks = [
+        TaskResponse(id="T1", title="Start", description="d", duration_days=1),
+        TaskResponse(id="T2", title="A", description="d", duration_days=3, depends_on=["T1"]),
+        TaskResponse(id="T3", title="B", description="d", duration_days=3, depends_on=["T1"]),
+        TaskResponse(id="T4", title="C", description="d", duration_days=1, depends_on=["T1"]),
+        TaskResponse(id="T5", title="End", description="d", duration_days=1, depends_on=["T2", "T3", "T4"]),
+    ]
+    PlanGenerator.assign_dates(tasks, Constraints(max_hours_per_day=None), datetime(2025, 1, 1))
+    slack, critical_paths = PlanGenerator.calculate_slack(tasks, Constraints())
+    assert critical_paths == [["T1", "T2", "T5"], ["T1", "T3", "T5"]]
+    assert slack["T4"]["total_float_days"] == 2 and slack["T4"]["free_float_days"] == 2
+    # T4 finishes Friday 2025-01-03; two working days of float give Tuesday
+    assert tasks[3].latest_finish == "2025-01-03"
+    assert slack["T4"]["late_finish"] == "2025-01-07"
+    assert slack["T2"]["late_finish"] == tasks[1].latest_finish
+
+
+def test_plan_graph_reports_cycles_and_dangling_references():
+    """Cycles, tasks behind them and unknown ids are diagnosed, and every task still gets dates"""
+    tasks = [
+        TaskResponse(id="T1", title="A", description="d", duration_days=2),
+        TaskResponse(id="T2", title="B", description="d", duration_days=1, depends_on=["T1", "T3"]),
+        TaskResponse(id="T3", title="C", description="d", duration_days=1, depends_on=["T2"]),
+        TaskResponse(id="T4", title="D", description="d", duration_days=1, depends_on=["T3", "T9"]),
+    ]
+    graph = PlanGenerator.compile_graph(tasks)
+    assert graph.order == ["T1"]
+    assert graph.cycles == [["T2", "T3"]]
+    assert graph.dangling == [("T4", "T9")]
+    assert graph.warnings() == [
+        "Dependency cycle between tasks T2, T3",
+        "Tasks T4 depend on a dependency cycle",
+        "Task T4 depends on unknown task T9; the dependency was ignored",
+    ]
+
+    PlanGenerator.assign_dates(tasks, Constraints(max_hours_per_day=None), datetime(2025, 1, 1))
+    assert [(task.earliest_start, task.latest_finish) for task in tasks] == [
+        ("2025-01-01", "2025-01-03"),
+        ("2025-01-03", "2025-01-06"),
+        ("2025-01-06", "2025-01-07"),
+        ("2025-01-07", "2025-01-08"),
+    ]
+    assert PlanGenerator.compile_graph(tasks) is graph
+
+
+def test_plan_graph_cycle_detection_matches_reference():
+    """Tasks released by the forward pass plus blocked tasks cover the graph, and cycles are real"""
+    rng = random.Random(13)
+    for _ in range(200):
+        tasks = _random_graph(rng, rng.randrange(1, 120))
+        graph = PlanGenerator.compile_graph(tasks)
+        by_id = {task.id: task for task in tasks}
+        reference_order = PlanGenerator._topological_sort_reference(tasks)
+        blocked = {graph.task_ids[index] for index in graph.blocked}
+        assert set(reference_order) | blocked == set(by_id)
+        assert not set(reference_order) & blocked
+        assert bool(graph.cycles) == bool(blocked)
+        for cycle in graph.cycles:
+            members = set(cycle)
+            # Every member of a cycle depends on another member
+            assert all(members & set(by_id[task_id].depends_on) for task_id in cycle)
+
+
+def test_plan_graph_descendants():
+    """Descendants follow successors transitively and leave unrelated branches out"""
+    tasks = [
+        TaskResponse(id="T1", title="A", description="d", duration_days=1),
+        TaskResponse(id="T2", title="B", description="d", duration_days=1, depends_on=["T1"]),
+        TaskResponse(id="T3", title="C", description="d", duration_days=1, depends_on=["T2"]),
+        TaskResponse(id="T4", title="D", description="d", duration_days=1),
+        TaskResponse(id="T5", title="E", description="d", duration_days=1, depends_on=["T4", "T2"]),
+    ]
+    graph = PlanGenerator.compile_graph(tasks)
+    assert graph.descendants({"T2"}) == {"T3", "T5"}
+    assert graph.descendants({"T1", "T4"}) == {"T2", "T3", "T5"}
+    assert graph.descendants({"T3", "T9"}) == set()
+
+
+def test_propagate_dates_matches_full_reschedule():
+    """Incremental rescheduling after duration changes gives the same dates as assign_dates"""
+    rng = random.Random(14)
+    start = datetime(2025, 3, 3)
+    for _ in range(100):
+        constraints = Constraints(max_hours_per_day=None, unavailable_dates=["2025-03-12", "2025-04-01"])
+        tasks = _random_graph(rng, rng.randrange(1, 60))
+        PlanGenerator.assign_dates(tasks, constraints, start)
+        edited = rng.sample(tasks, min(len(tasks), rng.randrange(1, 4)))
+        for task in edited:
+            task.duration_days = rng.randrange(1, 10)
+        before = {task.id: (task.earliest_start, task.latest_finish) for task in tasks}
+
+        changed = PlanGenerator.propagate_dates(tasks, {task.id for task in edited}, constraints, start)
+        expected = PlanGenerator.assign_dates([task.model_copy() for task in tasks], constraints, start)
+        assert [(t.earliest_start, t.latest_finish) for t in tasks] == [
+            (t.earliest_start, t.latest_finish) for t in expected
+        ]
+        assert changed == {task.id for task in tasks if (task.earliest_start, task.latest_finish) != before[task.id]}
+
+
+def test_propagate_dates_keeps_pinned_dates():
+    """A pinned task keeps its new dates and its successors follow them"""
+    tasks = [
+        TaskResponse(id="T1", title="A", description="d", duration_days=5),
+        TaskResponse(id="T2", title="B", description="d", duration_days=1, depends_on=["T1"]),
+        TaskResponse(id="T3", title="C", description="d", duration_days=1),
+    ]
+    PlanGenerator.assign_dates(tasks, Constraints(max_hours_per_day=None), datetime(2025, 1, 1))
+    tasks[0].latest_finish = "2025-01-02"  # Finished early
+    changed = PlanGenerator.propagate_dates(tasks, set(), Constraints(), datetime(2025, 1, 1), pinned={"T1"})
+    assert changed == {"T2"}
+    assert (tasks[1].earliest_start, tasks[1].latest_finish) == ("2025-01-02", "2025-01-03")
+
+
+def test_level_schedule_with_free_capacity_is_the_earliest_schedule():
+    """With a lane per task the list scheduler reproduces the unconstrained dates"""
+    rng = random.Random(15)
+    start = datetime(2025, 1, 1)
+    for _ in range(100):
+        tasks = _random_graph(rng, rng.randrange(1, 60))
+        PlanGenerator.assign_dates(tasks, Constraints(max_hours_per_day=None, no_work_on_weekends=False), start)
+        graph = PlanGenerator.compile_graph(tasks)
+        days = [task.duration_days for task in tasks]
+        starts, finishes = level_schedule(graph, days, list(range(len(tasks))), len(tasks))
+        for index, task in enumerate(tasks):
+            assert starts[index] == (datetime.strptime(task.earliest_start, '%Y-%m-%d') - start).days
+            assert finishes[index] == (datetime.strptime(task.latest_finish, '%Y-%m-%d') - start).days
+
+
+def test_level_schedule_respects_capacity_and_dependencies():
+    """No day runs more tasks than there are lanes, and tasks wait for their prerequisites (fixed ones too)"""
+    rng = random.Random(16)
+    for _ in range(100):
+        tasks = _random_graph(rng, rng.randrange(1, 60))
+        graph = PlanGenerator.compile_graph(tasks)
+        lanes = rng.randrange(1, 4)
+        days = [task.duration_days for task in tasks]
+        priority = [(rng.random(), index) for index in range(len(tasks))]
+        # Some tasks keep the dates of an earlier one-lane schedule
+        starts, finishes = level_schedule(graph, days, priority, 1)
+        fixed = {
+            index: (starts[index], finishes[index])
+            for index in rng.sample(range(len(tasks)), rng.randrange(0, len(tasks) // 4 + 1))
+        }
+        starts, finishes = level_schedule(graph, days, priority, lanes, fixed)
+
+        position = {index: rank for rank, index in enumerate(graph.schedule_order.tolist())}
+        for index in range(len(tasks)):
+            assert finishes[index] == starts[index] + days[index]
+            if index in fixed:
+                continue
+            for dep_index in graph.predecessors(index).tolist():
+                if position[dep_index] < position[index]:
+                    assert starts[index] >= finishes[dep_index]
+        for day in range(max(finishes, default=0)):
+            assert sum(start <= day < finish for start, finish in zip(starts, finishes)) <= lanes
+
+
+def test_leveled_reschedule_of_unchanged_tasks_keeps_their_dates():
+    """Releveling a subset whose inputs did not change leaves its dates alone"""
+    tasks = [
+        TaskResponse(id="T1", title="A", description="d", duration_days=2),
+        TaskResponse(id="T2", title="B", description="d", duration_days=2, depends_on=["T1"]),
+        TaskResponse(id="T3", title="C", description="d", duration_days=2, depends_on=["T2"]),
+        TaskResponse(id="T4", title="D", description="d", duration_days=2, depends_on=["T3"]),
+        TaskResponse(id="T5", title="E", description="d", duration_days=1),
+        TaskResponse(id="T6", title="F", description="d", duration_days=1, depends_on=["T5"]),
+    ]
+    constraints = Constraints(max_hours_per_day=8, no_work_on_weekends=False, level_resources=True)
+    PlanGenerator.assign_dates(tasks, constraints, datetime(2025, 1, 1))
+    dates = [(task.earliest_start, task.latest_finish) for task in tasks]
+    assert dates[5] == ("2025-01-02", "2025-01-03")
+    for task_id in ("T6", "T3", "T4"):
+        PlanGenerator.assign_dates(tasks, constraints, datetime(2025, 1, 1), only={task_id})
+        assert [(task.earliest_start, task.latest_finish) for task in tasks] == dates
+
+
+def test_resource_leveling_is_opt_in():
+    """max_hours_per_day alone (the schema default is 8) does not level; level_resources does"""
+    assert not PlanGenerator.levels_resources(Constraints())
+    assert not PlanGenerator.levels_resources(None)
+    assert PlanGenerator.levels_resources(Constraints(level_resources=True))
+    assert not PlanGenerator.levels_resources(Constraints(level_resources=True, max_hours_per_day=None))
+    assert PlanGenerator.effort_hours(Constraints(effort_hours_per_day=2)) == 2
+
+
+def test_leveled_dates_start_critical_work_first():
+    """With one person, critical and high-priority tasks go first and nothing overlaps"""
+    tasks = [
+        TaskResponse(id="T1", title="A", description="d", duration_days=1, priority="Low"),
+        TaskResponse(id="T2", title="B", description="d", duration_days=1, priority="High"),
+        TaskResponse(id="T3", title="C", description="d", duration_days=3),
+        TaskResponse(id="T4", title="D", description="d", duration_days=1, depends_on=["T3"]),
+    ]
+    # 4 hours per day with 4 effort hours per duration day: one task at a time
+    PlanGenerator.assign_dates(tasks, Constraints(max_hours_per_day=4, no_work_on_weekends=False, level_resources=True), datetime(2025, 1, 1))
+    assert [(task.id, task.earliest_start, task.latest_finish) for task in sorted(tasks, key=lambda t: t.earliest_start)] == [
+        ("T3", "2025-01-01", "2025-01-04"),
+        ("T4", "2025-01-04", "2025-01-05"),
+        ("T2", "2025-01-05", "2025-01-06"),
+        ("T1", "2025-01-06", "2025-01-07"),
+    ]
+
+
+def test_schedule_float_with_free_capacity_is_the_cpm_float():
+    """Without capacity waits the leveled float is the CPM float"""
+    rng = random.Random(19)
+    for _ in range(100):
+        tasks = _random_graph(rng, rng.randrange(1, 60))
+        graph = PlanGenerator.compile_graph(tasks)
+        days = [task.duration_days for task in tasks]
+        starts, finishes = level_schedule(graph, days, list(range(len(tasks))), len(tasks))
+        total_float, free_float, _ = schedule_float(graph, starts, finishes, 10)
+        for index in graph.forward.order.tolist():
+            assert total_float[index] == graph.backward.total_float[index]
+            assert free_float[index] == graph.backward.free_float[index]
+
+
+def test_leveled_slack_matches_the_leveled_dates():
+    """Leveled float never lets a task slip into a successor's late start or past the leveled end"""
+    rng = random.Random(20)
+    for _ in range(30):
+        tasks = _random_graph(rng, rng.randrange(1, 40))
+        constraints = Constraints(max_hours_per_day=rng.choice([4, 8]), level_resources=True, no_work_on_weekends=False)
+        PlanGenerator.assign_dates(tasks, constraints, datetime(2025, 1, 1))
+        slack, paths = PlanGenerator.calculate_slack(tasks, constraints)
+        end = max(task.latest_finish for task in tasks if task.id in slack)
+        for task in tasks:
+            if task.id not in slack:
+                continue
+            values = slack[task.id]
+            assert values["total_float_days"] >= values["free_float_days"] >= 0
+            assert task.earliest_start <= values["late_start"] and values["late_finish"] <= end
+            for dep_id in task.depends_on:
+                if dep_id in slack:
+                    assert slack[dep_id]["late_finish"] <= values["late_start"]
+        assert paths and all(slack[task_id]["is_critical"] for path in paths for task_id in path)
+    
+    # One person: every task holds up the next, so all are critical
+    tasks = [
+        TaskResponse(id="T1", title="A", description="d", duration_days=1),
+        TaskResponse(id="T2", title="B", description="d", duration_days=3),
+        TaskResponse(id="T3", title="C", description="d", duration_days=1, depends_on=["T2"]),
+    ]
+    constraints = Constraints(max_hours_per_day=4, level_resources=True, no_work_on_weekends=False)
+    PlanGenerator.assign_dates(tasks, constraints, datetime(2025, 1, 1))
+    slack, paths = PlanGenerator.calculate_slack(tasks, constraints)
+    assert all(values["total_float_days"] == 0 for values in slack.values())
+    assert paths == [["T2", "T3", "T1"]]
+
+
+def test_risk_simulation_without_spread_is_the_cpm_schedule():
+    """With no duration spread every sample has the CPM length and the zero-float tasks are always critical"""
+    rng = random.Random(17)
+    for _ in range(50):
+        tasks = _random_graph(rng, rng.randrange(1, 80))
+        graph = PlanGenerator.compile_graph(tasks)
+        no_spread = np.zeros(len(tasks))
+        result = simulate(graph, no_spread, no_spread, 20)
+        assert np.all(result.completion_days == max(graph.forward.earliest_finish.max(), 0))
+        assert np.array_equal(result.criticality == 1, graph.backward.total_float == 0)
+
+
+def test_risk_simulation_spreads_completion():
+    """Uncertain durations push completion past the estimate, reproducibly for a seed"""
+    tasks = _random_plan(random.Random(18), 200)
+    graph = PlanGenerator.compile_graph(tasks)
+    uncertainty = np.full(len(tasks), 0.4)
+    result = simulate(graph, uncertainty * 0.3, uncertainty, 2000, seed=5)
+    p50, p95 = np.percentile(result.completion_days, [50, 95])
+    assert graph.forward.earliest_finish.max() < p50 < p95
+    assert np.all((0 <= result.criticality) & (result.criticality <= 1))
+    assert np.array_equal(simulate(graph, uncertainty * 0.3, uncertainty, 2000, seed=5).completion_days, result.completion_days)
+
+
+def test_calendar_registry_shares_compiled_calendars():
+    """Constraints with the same effective calendar share one compiled calendar, named calendars included"""
+    registry = CalendarRegistry(max_entries=2, refresh_seconds=60)
+    first = registry.compile(Constraints(unavailable_dates=["2025-01-02", "2025-01-01"]))
+    same = registry.compile(Constraints(unavailable_dates=["2025-01-01", "2025-01-02", "2025-01-01"]))
+    assert same is first
+    assert registry.stats == {"hits": 1, "misses": 1}
+    
+    registry._remember(SimpleNamespace(name="team", no_work_on_weekends=False, unavailable_dates=["2025-01-03"]))
+    named = registry.compile(Constraints(calendar_name="team", unavailable_dates=["2025-01-01"]))
+    assert not named.skip_weekends
+    assert [named.is_working_day(datetime(2025, 1, day).date()) for day in (1, 2, 3, 4)] == [False, True, False, True]
+    
+    # Unknown names fall back to the constraints' own calendar
+    assert registry.compile(Constraints(calendar_name="missing", unavailable_dates=["2025-01-01", "2025-01-02"])) is first